@@ -1,13 +1,86 @@
 """ The acis library package for ACIS Web Services clients.
 
+The core modules are imported with the package. The result, util, and index
+modules, and the optional queue and batch modules, are imported the first time
+one of their attributes is accessed, e.g. acis.StnDataResult; this keeps the
+package (and its optional dependencies) fast to import for short-lived
+scripts.
+
 """
 from __future__ import absolute_import
 
+from sys import modules
+from types import ModuleType
+
 from .__version__ import __version__
+from .cache import *
 from .call import *
 from .date import *
 from .error import *
+from .events import *
 from .request import *
-from .result import *
 from .stream import *
-from .util import *
+
+# The public attributes of each lazy module. These must match the __all__
+# attribute of the module.
+_LAZY_MODULES = {
+    "result": ("StnMetaResult", "StnDataResult", "MultiStnDataResult",
+               "LazyMultiStnDataResult", "GridDataResult", "AreaMetaResult"),
+    "util": ("decode_sids", "index_sids", "result_array", "result_columns",
+             "ColumnarResult"),
+    "index": ("StationIndex",),
+    "queue": (),  # not part of the core library (see queue.py)
+    "batch": (),  # not part of the core library (see batch.py)
+}
+
+
+class _LazyPackage(ModuleType):
+    """ A package that imports its lazy modules on demand.
+
+    """
+    def __init__(self, package):
+        """ Initialize a _LazyPackage object.
+
+        """
+        super(_LazyPackage, self).__init__(package.__name__, package.__doc__)
+        self.__dict__.update(package.__dict__)
+        self._package = package  # keep the original module alive
+        self._lazy = {}  # module name for each lazy attribute
+        for name, attrs in _LAZY_MODULES.iteritems():
+            self._lazy[name] = name
+            self._lazy.update((attr, name) for attr in attrs)
+        return
+
+    def __getattr__(self, attr):
+        """ Import a lazy module to get one of its attributes.
+
+        This is only called if the attribute does not already exist.
+
+        """
+        try:
+            name = self._lazy[attr]
+        except KeyError:
+            message = "'module' object has no attribute '{0:s}'"
+            raise AttributeError(message.format(attr))
+        __import__("{0:s}.{1:s}".format(self.__name__, name))
+        module = modules["{0:s}.{1:s}".format(self.__name__, name)]
+        for public in _LAZY_MODULES[name]:
+            setattr(self, public, getattr(module, public))
+        setattr(self, name, module)
+        return getattr(self, attr)
+
+    def __dir__(self):
+        """ Return the attributes of this package, including lazy ones.
+
+        """
+        return sorted(set(self.__dict__) | set(self._lazy))
+
+
+# Define __all__ so that "from acis import *" includes the lazy attributes.
+__all__ = ()
+for _name in ("cache", "call", "date", "error", "events", "request", "stream"):
+    __all__ += tuple(modules["{0:s}.{1:s}".format(__name__, _name)].__all__)
+for _name in ("result", "util", "index"):
+    __all__ += _LAZY_MODULES[_name]
+
+modules[__name__] = _LazyPackage(modules[__name__])
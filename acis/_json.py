@@ -0,0 +1,252 @@
+""" Incremental and parallel decoding of JSON results.
+
+"""
+from __future__ import absolute_import
+
+from marshal import dumps as marshal
+from marshal import loads as unmarshal
+from re import compile
+from re import escape
+
+try:
+    # Use the external simplejson library if it's available (see call.py).
+    from simplejson import JSONDecoder
+    from simplejson import loads
+except ImportError:
+    from json import JSONDecoder
+    from json import loads
+
+from .error import ResultError
+
+_WHITESPACE = compile(r"\s*")
+
+# Patterns for the start of an array item. A quote cannot appear unescaped
+# inside a JSON string, so a match is always outside of a string.
+_KEY = compile(r'\{\s*"((?:[^"\\]|\\.)*)"\s*:')  # first key of an object
+_DATE = r'\[\s*"\d{4}(?:-\d\d){0,2}"'  # array whose first item is a date
+
+
+def iter_array(stream, key="data", extra=None):
+    """ Iterate over the items of an array in a JSON object.
+
+    The stream parameter is a file-like object containing a JSON object, and
+    key is the name of an array in that object. The array items are decoded
+    and yielded one at a time as the stream is read, so only one item is held
+    in memory at a time. If the optional extra parameter is a dict, the other
+    values in the object are stored in it as they are decoded. An error
+    message in the result, i.e. {"error": "message"}, raises a ResultError.
+
+    """
+    reader = _Reader(stream)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        name = reader.value()
+        reader.expect(":")
+        if name == key and reader.peek() == "[":
+            reader.expect("[")
+            if reader.peek() == "]":
+                reader.expect("]")
+            else:
+                while True:
+                    yield reader.value()
+                    if reader.expect(",]") == "]":
+                        break
+        else:
+            value = reader.value()
+            if name == "error":
+                raise ResultError(value)
+            if extra is not None:
+                extra[name] = value
+        if reader.expect(",}") == "}":
+            break
+    return
+
+
+def parallel_loads(content, processes=None, key="data"):
+    """ Decode a JSON object using multiple processes.
+
+    The key parameter is the name of an array in the object, e.g. the sites
+    of a MultiStnData result or the dates of a StnData or GridData result. The
+    array is split into chunks at item boundaries, and the chunks are decoded
+    in parallel by the given number of processes (by default the number of
+    CPUs). The result is the same as for loads(). If the array items cannot
+    be split reliably, or if this is a daemon process (which cannot have
+    child processes), the content is decoded serially. A ValueError is raised
+    for invalid JSON.
+
+    """
+    from multiprocessing import cpu_count  # not loaded with the package
+    from multiprocessing import current_process
+    processes = processes or cpu_count()
+    if processes > 1 and not current_process().daemon:
+        try:
+            return _parallel(content, processes, key)
+        except ValueError:  # cannot split or misaligned chunks
+            pass
+    return loads(content)
+
+
+def _parallel(content, processes, key):
+    """ Decode a JSON object by decoding chunks of an array in parallel.
+
+    A ValueError is raised if this is not possible.
+
+    """
+    from multiprocessing import Pool  # not loaded with the package
+    match = compile(r'"{0:s}"\s*:\s*\['.format(escape(key))).search(content)
+    if not match:
+        raise ValueError("array not found")
+    start = _WHITESPACE.match(content, match.end()).end()
+    first = _KEY.match(content, start)
+    if first:
+        pattern = r'\{{\s*"{0:s}"\s*:'.format(escape(first.group(1)))
+    elif compile(_DATE).match(content, start):
+        pattern = _DATE
+    else:
+        raise ValueError("unknown array items")
+    pattern = compile(r",\s*(?={0:s})".format(pattern))
+    # Each chunk begins at an item that is at or after an equal division of
+    # the content.
+    starts = [start]
+    commas = []  # the comma before each start after the first
+    size = (len(content) - start) // processes
+    for pos in range(1, processes):
+        match = pattern.search(content, start + pos * size)
+        if not match:
+            break
+        if match.end() > starts[-1]:
+            starts.append(match.end())
+            commas.append(match.start())
+    if len(starts) < 2:
+        raise ValueError("array is too small")
+    chunks = [(content[lower:upper], False) for lower, upper in
+              zip(starts[:-1], commas)]
+    chunks.append((content[starts[-1]:], True))
+    pool = Pool(min(processes, len(chunks)))
+    try:
+        decoded = pool.map(_decode_items, chunks, 1)
+    finally:
+        pool.terminate()
+        pool.join()
+    items = []
+    for chunk, end in decoded:
+        items.extend(unmarshal(chunk))
+    end += starts[-1]  # end of the array
+    result = loads(content[:start] + content[end:])  # object without items
+    if not isinstance(result, dict) or result.get(key) != []:
+        raise ValueError("array is not in the top-level object")
+    result[key] = items
+    return result
+
+
+def _decode_items(chunk):
+    """ Decode a chunk of array items.
+
+    The chunk is a (content, last) tuple, where content must begin with an
+    item, and only the last chunk contains the end of the array. Return a list
+    of items and the position of the end of the array in the last chunk. The
+    list is marshalled, which is much faster than pickling it when it is sent
+    back to the parent process. A ValueError is raised if the chunk does not
+    contain complete items.
+
+    """
+    content, last = chunk
+    decode = _Reader._decoder.raw_decode
+    items = []
+    pos = 0
+    size = len(content)
+    while True:
+        item, pos = decode(content, pos)
+        items.append(item)
+        pos = _WHITESPACE.match(content, pos).end()
+        if not last and pos == size:
+            return marshal(items), None
+        char = content[pos:pos+1]
+        if last and char == "]":
+            return marshal(items), pos
+        if char != ",":
+            raise ValueError("chunk is not aligned with array items")
+        pos = _WHITESPACE.match(content, pos + 1).end()
+
+
+class _Reader(object):
+    """ Read JSON values from a stream.
+
+    """
+    _chunk = 8192
+    _decoder = JSONDecoder()
+    _delims = set(" \t\n\r,:]}")  # valid characters after a value
+
+    def __init__(self, stream):
+        """ Initialize a _Reader object.
+
+        """
+        self._stream = stream
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+        return
+
+    def peek(self):
+        """ Return the next non-whitespace character without consuming it.
+
+        An empty string is returned at the end of the stream.
+
+        """
+        while True:
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer) or not self._read(self._chunk):
+                break
+        return self._buffer[self._pos:self._pos+1]
+
+    def expect(self, chars):
+        """ Consume the next non-whitespace character and return it.
+
+        The character must be one of chars or a ResultError is raised.
+
+        """
+        char = self.peek()
+        if not char or char not in chars:
+            raise ResultError("server returned invalid JSON")
+        self._pos += 1
+        return char
+
+    def value(self):
+        """ Decode the next JSON value.
+
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except ValueError:  # incomplete or invalid value
+                end = None
+            if end is not None and (self._eof or 
+                                    self._buffer[end:end+1] in self._delims):
+                break
+            # The value was incomplete, or it was a number at the end of the
+            # buffer that might continue in the next chunk, e.g. "1.5e" would
+            # be decoded as 1.5. The amount read grows with the size of the
+            # value so that it does not have to be decoded too many times.
+            size = max(self._chunk, len(self._buffer) - self._pos)
+            if not self._read(size) and end is None:
+                raise ResultError("server returned invalid JSON")
+        self._pos = end
+        return value
+
+    def _read(self, size):
+        """ Read more data into the buffer.
+
+        Data that has already been consumed is discarded. Return False at the
+        end of the stream.
+
+        """
+        chunk = self._stream.read(size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+        return True
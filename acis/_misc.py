@@ -15,31 +15,19 @@ def annotate(sequence):
     of the sequence is preserved, and it is returned as a tuple.
     
     """
-    def counter(sequence):
-        """ Replacement for collections.Counter for Python <2.7.
-    
-        """
-        counts = {}
-        for item in sequence:
-            try:
-                counts[item] += 1
-            except KeyError:
-                counts[item] = 1
-        return counts
-
-    # Reverse the sequence, then the duplicate count acts as a reverse index 
-    # while successive duplicates are annotated and the count is decremented. 
-    # Reverse the sequence again to restore the orignal order.
-    annotated = list(reversed(list(sequence)))
-    for key, count in counter(annotated).iteritems():
-        if count == 1:
-            continue
-        for pos, item in enumerate(annotated):
-            if item != key:
-                continue
-            count -= 1
-            annotated[pos] = "{0:s}_{1:d}".format(item, count)
-    return tuple(reversed(annotated))             
+    items = list(sequence)
+    counts = {}
+    for item in items:
+        counts[item] = counts.get(item, 0) + 1
+    seen = {}  # number of times each duplicate item has been annotated
+    annotated = []
+    for item in items:
+        if counts[item] > 1:
+            index = seen.get(item, 0)
+            seen[item] = index + 1
+            item = "{0:s}_{1:d}".format(item, index)
+        annotated.append(item)
+    return tuple(annotated)
 
 
 def make_element(elem):
@@ -130,4 +118,141 @@ def date_span(params):
         interval = params["elems"][0].get("interval", "dly")
     except TypeError: # not a sequence
         interval = "dly"  # default value is daily
-    return sdate, edate, interval
\ No newline at end of file
+    return sdate, edate, interval
+
+
+class ElementSchema(object):
+    """ A compiled description of the elements for a call.
+
+    An ElementSchema is immutable; add() and with_interval() return a new
+    schema. The aliases attribute is a tuple of the annotated element aliases,
+    and each element's position in a data record (not counting the uid and
+    date) is given by position(). The layouts attribute is a tuple of the 
+    fields for each element value as determined by its "add" option, e.g.
+    ("value", "flag", "time") for add="f,t", or ("value",) for a scalar 
+    value.
+
+    If an interval is specified it is applied to every element by params().
+    Otherwise, each element's interval is left as is.
+
+    """
+    _fields = {"f": "flag", "t": "time", "n": "count"}  # "add" codes
+
+    def __init__(self, elems=(), interval=None):
+        """ Initialize an ElementSchema object.
+
+        The elems parameter is a sequence of element names, var major codes,
+        or element dicts (see make_element()), or the equivalent comma-
+        delimited string. Element dicts are copied.
+
+        """
+        if isinstance(elems, basestring):
+            elems = elems.split(",")
+        elems = [dict(elem) if isinstance(elem, dict) else elem for elem in
+                 elems]
+        self._elems = tuple(map(make_element, elems))
+        self._interval = interval
+        self._aliases = annotate(elem["alias"] for elem in self._elems)
+        self._positions = dict((alias, pos) for pos, alias in
+                               enumerate(self._aliases))
+        self._layouts = tuple(map(self._layout, self._elems))
+        return
+
+    @property
+    def aliases(self):
+        """ The annotated alias for each element.
+
+        """
+        return self._aliases
+
+    @property
+    def layouts(self):
+        """ The value fields for each element.
+
+        """
+        return self._layouts
+
+    @property
+    def interval(self):
+        """ The interval that is applied to every element, or None.
+
+        """
+        return self._interval
+
+    def __len__(self):
+        """ Return the number of elements.
+
+        """
+        return len(self._elems)
+
+    def position(self, alias):
+        """ Return the position of an element in a data record.
+
+        A KeyError is raised for an unknown alias.
+
+        """
+        return self._positions[alias]
+
+    def add(self, ident, **options):
+        """ Return a new schema with an additional element.
+
+        """
+        elem = make_element(ident)
+        elem.update(options)
+        return ElementSchema(self._elems + (elem,), self._interval)
+
+    def with_interval(self, interval):
+        """ Return a new schema with a different interval.
+
+        """
+        return ElementSchema(self._elems, interval)
+
+    def params(self):
+        """ Return the element objects for the params of a call.
+
+        The return value is a tuple of new element dicts, and its schema
+        attribute is this object so that the schema does not have to be 
+        compiled again for the result of the call.
+
+        """
+        elems = _Elements(map(dict, self._elems))
+        if self._interval is not None:
+            for elem in elems:
+                elem["interval"] = self._interval
+        elems.schema = self
+        return elems
+
+    @classmethod
+    def _layout(cls, elem):
+        """ Return the value fields for an element.
+
+        """
+        try:
+            codes = elem["add"]
+        except KeyError:  # scalar value
+            return ("value",)
+        if isinstance(codes, basestring):
+            codes = codes.split(",")
+        fields = [cls._fields.get(code.strip(), code.strip()) for code in 
+                  codes]
+        return tuple(["value"] + fields)
+
+
+class _Elements(tuple):
+    """ The element objects for a call and their ElementSchema.
+
+    """
+    schema = None
+
+
+def element_schema(elems):
+    """ Return the ElementSchema for the elems of a call.
+
+    The schema attached to elems by ElementSchema.params() is reused if it is
+    present.
+
+    """
+    schema = getattr(elems, "schema", None)
+    if schema is None:
+        schema = ElementSchema(elems)
+    return schema
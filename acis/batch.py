@@ -0,0 +1,589 @@
+""" Splitting and combining of ACIS requests for parallel execution.
+
+* USE AT YOUR OWN RISK. *
+
+Some requests are too big to be executed efficiently as a single call, and
+others are too small. The functions in this module split a request into smaller
+requests (or combine several requests into fewer) that are executed in parallel
+by a RequestQueue, and then the results are combined into the same query that
+the original request(s) would have returned. Like RequestQueue, this is not
+part of the core library yet, and the interface should not be considered
+stable.
+
+"""
+from __future__ import absolute_import
+
+from bisect import bisect_left
+from json import dumps
+from math import ceil
+from math import floor
+
+from ._misc import date_span
+from .call import WebServicesCall
+from .date import _date_tuple
+from .date import date_object
+from .date import date_string
+from .error import RequestError
+from .error import ResultError
+from .queue import RequestQueue
+
+__all__ = ("split_dates", "submit_chunked", "split_bbox", "submit_tiled",
+           "submit_coalesced", "submit_points")
+
+_GRID_MISSING = -999  # default ACIS missing value for grids
+
+_LOCATIONS = ("loc", "bbox", "state", "county", "climdiv", "cwa", "basin")
+
+
+def split_dates(sdate, edate, years=1):
+    """ Split a date range into chunks aligned with calendar years.
+
+    Return a list of inclusive (sdate, edate) pairs. Each chunk covers at most
+    the given number of years and starts on a multiple of that number, e.g.
+    decades for years=10. The first and last chunks are truncated to the
+    original date range.
+
+    """
+    sdate, edate = date_object(sdate), date_object(edate)
+    chunks = []
+    start = sdate
+    while start <= edate:
+        year = (start.year // years + 1) * years  # start of next chunk
+        end = min(edate, start.replace(year=year - 1, month=12, day=31))
+        chunks.append((date_string(start), date_string(end)))
+        start = end.replace(year=year, month=1, day=1)
+    return chunks
+
+
+def submit_chunked(request, years=10, workers=4):
+    """ Submit a StnDataRequest as parallel requests for chunks of years.
+
+    The request date range is split using split_dates(), and the chunks are
+    executed in parallel by a RequestQueue with the given number of workers.
+    The return value is the same query that request.submit() returns, and the
+    data for all chunks are combined in chronological order. A "por" date is
+    resolved to the period of record for the requested elements with a
+    StnMeta call before the request is split.
+
+    Summaries and other element options that depend on the entire date range
+    cannot be combined across chunks, and intervals must be "dly", "mly", or
+    "yly". A "season_start" cannot be split either because a season may cross
+    the calendar year boundary between chunks. The chunks use the connection
+    pool shared by all WebServicesCalls. If the date range is empty, e.g.
+    sdate is after edate, the request is submitted as is.
+
+    """
+    params = dict(request.params)
+    if "date" in params:
+        return request.submit()  # single date, nothing to split
+    for elem in params["elems"]:
+        options = set(elem) & set(("smry", "smry_only", "groupby", "duration",
+                                   "season_start"))
+        if options:
+            message = "cannot split request with {0:s}"
+            raise RequestError(message.format(", ".join(sorted(options))))
+        if elem.get("interval", "dly") not in ("dly", "mly", "yly"):
+            raise RequestError("cannot split request with custom interval")
+    if "por" in (params["sdate"], params["edate"]):
+        try:
+            sdate, edate = _por(request.url, params)
+        except ValueError:  # no period of record
+            return request.submit()
+        if params["sdate"] == "por":
+            params["sdate"] = sdate
+        if params["edate"] == "por":
+            params["edate"] = edate
+    chunks = split_dates(params["sdate"], params["edate"], years)
+    if not chunks:
+        return request.submit()  # let the server report the invalid range
+    queue = RequestQueue(workers, pool=WebServicesCall.pool)
+    for sdate, edate in chunks:
+        chunk = dict(params, sdate=sdate, edate=edate)
+        queue.add(_Request(request.url, chunk))
+    queue.execute()
+    meta = None
+    data = []
+    for query in queue.results:
+        result = query["result"]
+        try:
+            raise ResultError(result["error"])
+        except KeyError:  # no error
+            pass
+        meta = meta or result.get("meta")
+        data.extend(result.get("data", []))
+    return {"params": params, "result": {"meta": meta, "data": data}}
+
+
+def _por(url, params):
+    """ Determine the period of record for the elements of a StnData request.
+
+    Return the earliest start date and latest end date for any element. A
+    ValueError is raised if there is no period of record.
+
+    """
+    call = WebServicesCall(url.rsplit("/", 1)[0] + "/StnMeta")
+    meta = {"meta": "valid_daterange", "elems": []}
+    for key in ("uid", "sid"):
+        if key in params:
+            meta[key + "s"] = params[key]
+    for elem in params["elems"]:
+        # Only the element identity is valid for StnMeta.
+        ident = ("name", "vX")
+        meta["elems"].append(dict((key, elem[key]) for key in ident if 
+                                  key in elem))
+    try:
+        site = call(meta)["meta"][0]
+    except (KeyError, IndexError):  # no site
+        raise ValueError("no period of record")
+    ranges = [dates for dates in site.get("valid_daterange", []) if dates]
+    if not ranges:
+        raise ValueError("no period of record")
+    sdate = min(start for start, end in ranges)
+    edate = max(end for start, end in ranges)
+    return sdate, edate
+
+
+def split_bbox(bbox, size=5.):
+    """ Split a bounding box into tiles.
+
+    The bbox is a (west, south, east, north) sequence or the equivalent comma-
+    delimited string. Return a list of (west, south, east, north) tuples that
+    cover the bbox with equal-sized tiles no larger than size degrees on each
+    side. Adjacent tiles share an edge, so a point on an edge may appear in
+    the results for both tiles.
+
+    """
+    if isinstance(bbox, basestring):
+        bbox = bbox.split(",")
+    west, south, east, north = map(float, bbox)
+    nx = max(1, int(ceil((east - west) / size)))
+    ny = max(1, int(ceil((north - south) / size)))
+    xedges = [west + (east - west) * i / nx for i in range(nx)] + [east]
+    yedges = [south + (north - south) * j / ny for j in range(ny)] + [north]
+    tiles = []
+    for j in range(ny):
+        for i in range(nx):
+            tiles.append((xedges[i], yedges[j], xedges[i+1], yedges[j+1]))
+    return tiles
+
+
+def submit_tiled(request, size=5., workers=4):
+    """ Submit a MultiStnData or GridData request as parallel spatial tiles.
+
+    A "bbox" location is split into tiles using split_bbox(), and a 
+    MultiStnData request for multiple states is split into a request for each 
+    state. The tiles are executed in parallel by a RequestQueue with the given
+    number of workers. The return value is the same query that 
+    request.submit() returns. Stations that are in more than one tile are only
+    included once, and the grids for each tile are combined into a single grid
+    for the entire bbox. Any other location is submitted as a single request.
+
+    """
+    params = dict(request.params)
+    if "grid" in params:
+        if "bbox" not in params:
+            return request.submit()
+        tiles = _tiles(params["bbox"], size)
+        meta = params.get("meta", ())
+        if isinstance(meta, basestring):
+            meta = meta.split(",")
+        tile_meta = sorted(set(meta) | set(("ll",)))  # needed to mosaic tiles
+        merge = lambda results: _mosaic(results, set(meta))
+    else:
+        meta = params.get("meta")
+        if isinstance(meta, basestring):
+            meta = meta.split(",")
+        tile_meta = meta
+        if meta is not None:  # otherwise the default includes the uid
+            tile_meta = sorted(set(meta) | set(("uid",)))  # to de-duplicate
+            meta = set(meta)
+        merge = lambda results: _union(results, meta)
+        if "bbox" in params:
+            tiles = _tiles(params["bbox"], size)
+        else:
+            states = params.get("state", ())
+            if isinstance(states, basestring):
+                states = states.split(",")
+            tiles = [{"state": state} for state in states]
+    if len(tiles) <= 1:
+        return request.submit()
+    queue = RequestQueue(workers)
+    for tile in tiles:
+        tile = dict(params, **tile)
+        if tile_meta is not None:
+            tile["meta"] = tile_meta
+        queue.add(_Request(request.url, tile))
+    queue.execute()
+    results = []
+    for query in queue.results:
+        result = query["result"]
+        try:
+            raise ResultError(result["error"])
+        except KeyError:  # no error
+            pass
+        results.append(result)
+    return {"params": params, "result": merge(results)}
+
+
+def _tiles(bbox, size):
+    """ Return the location params for each tile of a bbox.
+
+    """
+    return [{"bbox": ",".join(map(repr, tile))} for tile in
+            split_bbox(bbox, size)]
+
+
+def _union(results, meta=None):
+    """ Combine MultiStnData results for each tile.
+
+    Stations are identified by their uid, and only the first occurrence of a
+    station is kept. If meta is not None, the uid is removed from the site
+    metadata unless it is one of the requested meta fields.
+
+    """
+    data = []
+    uids = set()
+    for result in results:
+        for site in result.get("data", []):
+            try:
+                uid = site["meta"]["uid"]
+            except KeyError:
+                raise ResultError("metadata does not contain uid")
+            if uid in uids:
+                continue
+            uids.add(uid)
+            if meta is not None and "uid" not in meta:
+                del site["meta"]["uid"]
+            data.append(site)
+    return {"data": data}
+
+
+def _mosaic(results, meta):
+    """ Combine GridData results for each tile into a single grid.
+
+    The position of each tile is determined from its "ll" metadata. Any grid 
+    point that is not in a tile is missing. Only the requested meta fields are
+    included in the combined result.
+
+    """
+    # The grid coordinates are rounded so that edges that are shared by two
+    # tiles have the same coordinates.
+    lats = [[round(row[0], 6) for row in result["meta"]["lat"]] for result in
+            results]
+    lons = [[round(lon, 6) for lon in result["meta"]["lon"][0]] for result in
+            results]
+    rows = sorted(set(lat for tile in lats for lat in tile))
+    rows = dict((lat, pos) for pos, lat in enumerate(rows))
+    cols = sorted(set(lon for tile in lons for lon in tile))
+    cols = dict((lon, pos) for pos, lon in enumerate(cols))
+    shape = (len(rows), len(cols))
+    index = [([rows[lat] for lat in ylist], [cols[lon] for lon in xlist]) for
+             ylist, xlist in zip(lats, lons)]
+    merged = {}
+    fields = set(results[0].get("meta", {}))
+    if "ll" not in meta:
+        fields.difference_update(("lat", "lon"))
+    merged["meta"] = {}
+    for field in fields:
+        tiles = [result["meta"][field] for result in results]
+        merged["meta"][field] = _place(shape, index, tiles, None)
+    if "data" in results[0]:
+        merged["data"] = []
+        for records in zip(*(result["data"] for result in results)):
+            record = [records[0][0]]  # date
+            for pos in range(1, len(records[0])):
+                tiles = [tile[pos] for tile in records]
+                record.append(_place(shape, index, tiles))
+            merged["data"].append(record)
+    if "smry" in results[0]:
+        merged["smry"] = []
+        for pos in range(len(results[0]["smry"])):
+            tiles = [result["smry"][pos] for result in results]
+            merged["smry"].append(_place(shape, index, tiles))
+    return merged
+
+
+def _place(shape, index, tiles, fill=_GRID_MISSING):
+    """ Copy tile grids into a new grid with the given (ny, nx) shape.
+
+    The index is a sequence of (rows, cols) positions in the new grid for each
+    tile.
+
+    """
+    grid = [[fill] * shape[1] for _ in range(shape[0])]
+    for (rows, cols), tile in zip(index, tiles):
+        for j, values in zip(rows, tile):
+            dest = grid[j]
+            for i, value in zip(cols, values):
+                dest[i] = value
+    return grid
+
+
+def submit_coalesced(requests, size=50, workers=4):
+    """ Submit StnDataRequests as combined MultiStnData requests.
+
+    Requests that are identical except for their "sid" are combined into
+    MultiStnData requests for up to size sites each, and these are executed in
+    parallel by a RequestQueue with the given number of workers. The return
+    value is a list containing the query that request.submit() would return
+    for each request, in the same order, so each query can be used to create
+    a StnDataResult.
+
+    MultiStnData does not accept "uid", "por" dates, or "groupby", so these
+    requests are submitted individually, as are requests without explicit
+    "meta" fields (the default fields are not the same). A site is matched to
+    its request using the "sids" metadata, and any request that cannot be
+    matched to exactly one site is also submitted individually.
+
+    """
+    queries = [None] * len(requests)
+    groups = {}  # request positions for each sid, keyed by compatible params
+    single = []  # positions of requests that must be submitted individually
+    for pos, request in enumerate(requests):
+        params = request.params
+        dates = (params.get("sdate"), params.get("edate"), params.get("date"))
+        if ("sid" not in params or "uid" in params or "meta" not in params
+                or "por" in dates or
+                any("groupby" in elem for elem in params["elems"])):
+            single.append(pos)
+            continue
+        common = dict(params)
+        del common["sid"]
+        common.pop("meta", None)
+        key = request.url, dumps(common, sort_keys=True)
+        groups.setdefault(key, {}).setdefault(params["sid"], []).append(pos)
+    queue = RequestQueue(workers)
+    for pos in single:
+        queue.add(_Request(requests[pos].url, requests[pos].params))
+    batches = []
+    for (url, common), sids in groups.iteritems():
+        fields = set(("uid", "sids"))
+        for positions in sids.itervalues():
+            for pos in positions:
+                fields.update(_fields(requests[pos].params))
+        sids = sorted(sids.iteritems())
+        for start in range(0, len(sids), size):
+            batch = dict(sids[start:start+size])
+            params = dict(requests[batch.values()[0][0]].params)
+            del params["sid"]
+            params.update(sids=",".join(sorted(batch)), meta=sorted(fields))
+            queue.add(_Request(url.rsplit("/", 1)[0] + "/MultiStnData",
+                               params))
+            batches.append(batch)
+    queue.execute()
+    for pos, query in zip(single, queue.results):
+        queries[pos] = query
+    unmatched = []
+    for batch, query in zip(batches, queue.results[len(single):]):
+        result = query["result"]
+        try:
+            raise ResultError(result["error"])
+        except KeyError:  # no error
+            pass
+        sites = _match(result.get("data", []), batch)
+        dates = _date_tuple(*date_span(query["params"]))
+        for sid, positions in batch.iteritems():
+            try:
+                site = sites[sid]
+            except KeyError:  # no unique site for this sid
+                unmatched.extend(positions)
+                continue
+            for pos in positions:
+                params = requests[pos].params
+                queries[pos] = {"params": params,
+                                "result": _split(site, params, dates)}
+    if unmatched:
+        queue = RequestQueue(workers)
+        for pos in unmatched:
+            queue.add(_Request(requests[pos].url, requests[pos].params))
+        queue.execute()
+        for pos, query in zip(unmatched, queue.results):
+            queries[pos] = query
+    return queries
+
+
+def _fields(params):
+    """ Return the metadata fields for a request.
+
+    """
+    fields = params.get("meta", ())
+    if isinstance(fields, basestring):
+        fields = fields.split(",")
+    return fields
+
+
+def _match(sites, sids):
+    """ Match the sites in a MultiStnData result to the requested sids.
+
+    Return a dict of sites keyed by sid. A sid matches a site if it is one of
+    the site's "sids" (with or without the network code, ignoring case). Any
+    sid that matches more than one site is not included.
+
+    """
+    idents = {}
+    for site in sites:
+        for ident in site["meta"].get("sids", ()):
+            ident = ident.upper().split()
+            for key in set((" ".join(ident), ident[0])):
+                idents.setdefault(key, []).append(site)
+    matches = {}
+    for sid in sids:
+        candidates = idents.get(" ".join(sid.upper().split()), ())
+        if len(set(id(site) for site in candidates)) == 1:
+            matches[sid] = candidates[0]
+    return matches
+
+
+def _split(site, params, dates):
+    """ Create a StnData result from a MultiStnData site.
+
+    MultiStnData data records do not include the date, and for a single date
+    the data are a single record.
+
+    """
+    fields = _fields(params)
+    meta = site["meta"]
+    result = {"meta": dict((key, meta[key]) for key in fields if key in meta)}
+    if "data" in site:
+        data = site["data"]
+        if len(dates) == 1:  # 1D result
+            data = [data]
+        result["data"] = [[date] + record for date, record in 
+                          zip(dates, data)]
+    if "smry" in site:
+        result["smry"] = site["smry"]
+    return result
+
+
+def submit_points(request, points, size=1., pad=0.1, workers=4):
+    """ Submit GridData requests for many points as a few bbox requests.
+
+    The request is a GridDataRequest that defines the grid, elements, dates,
+    and metadata; any location is ignored. The points are a sequence of
+    (lon, lat) pairs, and they are grouped into cells of size degrees. The
+    points in each cell are extracted from a single bbox request that covers
+    them with a margin of pad degrees, which must be at least half the grid
+    resolution. The bbox requests are executed in parallel by a RequestQueue
+    with the given number of workers.
+
+    The return value is a list containing the query that a "loc" request
+    would return for each point, in the same order. Each point value is taken
+    from the nearest grid point, and a point that is the only one in its cell
+    or is not within the grid is submitted as a "loc" request.
+
+    """
+    params = dict(request.params)
+    for key in _LOCATIONS:
+        params.pop(key, None)
+    meta = params.get("meta", ())
+    if isinstance(meta, basestring):
+        meta = meta.split(",")
+    meta = set(meta)
+    cells = {}
+    for pos, (lon, lat) in enumerate(points):
+        cell = int(floor(lon / size)), int(floor(lat / size))
+        cells.setdefault(cell, []).append(pos)
+    queries = [None] * len(points)
+    single = []
+    tiles = []
+    queue = RequestQueue(workers)
+    for positions in cells.itervalues():
+        if len(positions) == 1:
+            single.extend(positions)
+            continue
+        lons, lats = zip(*(points[pos] for pos in positions))
+        bbox = (min(lons) - pad, min(lats) - pad, max(lons) + pad,
+                max(lats) + pad)
+        tile = dict(params, bbox=",".join(map(repr, bbox)),
+                    meta=sorted(meta | set(("ll",))))  # needed to extract
+        queue.add(_Request(request.url, tile))
+        tiles.append(positions)
+    queue.execute()
+    for positions, query in zip(tiles, queue.results):
+        result = query["result"]
+        try:
+            raise ResultError(result["error"])
+        except KeyError:  # no error
+            pass
+        for pos in positions:
+            try:
+                extract = _extract(result, points[pos], meta)
+            except ValueError:  # point is not within the grid
+                single.append(pos)
+                continue
+            queries[pos] = {"params": _loc(params, points[pos]),
+                            "result": extract}
+    if single:
+        queue = RequestQueue(workers)
+        for pos in single:
+            queue.add(_Request(request.url, _loc(params, points[pos])))
+        queue.execute()
+        for pos, query in zip(single, queue.results):
+            queries[pos] = query
+    return queries
+
+
+def _loc(params, point):
+    """ Return the params for a "loc" request for a point.
+
+    """
+    return dict(params, loc="{0!r},{1!r}".format(*point))
+
+
+def _extract(result, point, meta):
+    """ Extract the values for a point from a GridData bbox result.
+
+    The return value is the result that a "loc" request would return. Only the
+    requested meta fields are included. A ValueError is raised if the point is
+    not within the grid.
+
+    """
+    lon, lat = point
+    try:
+        j = _nearest([row[0] for row in result["meta"]["lat"]], lat)
+        i = _nearest(result["meta"]["lon"][0], lon)
+    except (KeyError, IndexError):  # empty grid
+        raise ValueError("point is not within the grid")
+    extract = {"meta": {}}
+    for field, grid in result.get("meta", {}).iteritems():
+        if field in ("lat", "lon") and "ll" not in meta:
+            continue
+        extract["meta"][field] = grid[j][i]
+    if "data" in result:
+        extract["data"] = [[record[0]] + [grid[j][i] for grid in record[1:]]
+                           for record in result["data"]]
+    if "smry" in result:
+        extract["smry"] = [grid[j][i] for grid in result["smry"]]
+    return extract
+
+
+def _nearest(coords, value):
+    """ Return the index of the grid coordinate nearest to a value.
+
+    The coordinates must be evenly spaced in ascending order. A ValueError is
+    raised if the value is more than half a grid spacing outside the grid.
+
+    """
+    if len(coords) < 2:
+        raise ValueError("cannot determine grid spacing")
+    half = (coords[-1] - coords[0]) / (len(coords) - 1) / 2.
+    if not coords[0] - half <= value <= coords[-1] + half:
+        raise ValueError("value is not within the grid")
+    pos = bisect_left(coords, value)
+    if pos == len(coords) or (pos > 0 and
+                              value - coords[pos-1] <= coords[pos] - value):
+        pos -= 1
+    return pos
+
+
+class _Request(object):
+    """ A minimal request object for a RequestQueue.
+
+    """
+    def __init__(self, url, params):
+        """ Initialize a _Request object.
+
+        """
+        self.url = url
+        self.params = params
+        return
@@ -0,0 +1,429 @@
+""" Caching of ACIS Web Services results.
+
+Caching is opt-in. A cache object is enabled for every WebServicesCall (and
+therefore every Request, Stream, and RequestQueue) by assigning it to the
+WebServicesCall.cache attribute:
+
+    acis.WebServicesCall.cache = acis.ResponseCache("/path/to/cache")
+
+Results are cached as the raw content returned by the server, and the cache key
+is the call URL plus the canonical JSON encoding of the params object. Error
+results are never cached. A MemoryCache can be layered in front of a
+ResponseCache by using the latter as its backend.
+
+"""
+from __future__ import absolute_import
+
+from datetime import date
+from datetime import timedelta
+from errno import ENOENT
+from hashlib import sha1
+from json import dumps
+from json import loads
+from os import fdopen
+from os import listdir
+from os import makedirs
+from os import remove
+from os import rename
+from os import stat
+from os import utime
+from os.path import expanduser
+from os.path import isdir
+from os.path import join
+from sys import exc_info
+from tempfile import mkstemp
+from threading import Event
+from threading import Lock
+from time import time
+from urlparse import urlsplit
+
+from .date import date_object
+
+__all__ = ("ResponseCache", "MemoryCache")
+
+
+def _cache_key(url, params):
+    """ Return the cache key for a call.
+
+    """
+    params = dumps(params, sort_keys=True, separators=(",", ":"))
+    return sha1("{0:s}\n{1:s}".format(url, params)).hexdigest()
+
+
+def _cacheable(content):
+    """ Return True if the content returned by the server can be cached.
+
+    """
+    # JSON errors are {"error": "message"}, and CSV errors are a single line,
+    # "error: message".
+    return not content.lstrip("{\" ").startswith("error")
+
+
+class ResponseCache(object):
+    """ An on-disk cache of server results.
+
+    Each result is stored in its own file under the cache directory. A result
+    for a request whose end date is more than immutable days in the past is
+    not expected to change and is kept until it is evicted. All other results,
+    including requests without dates or for the period of record, expire after
+    ttl seconds. When the total size of the cache exceeds max_size bytes the
+    least-recently used results are evicted.
+
+    The hits and misses attributes count the cache lookups.
+
+    """
+    def __init__(self, path, max_size=2**30, ttl=3600, immutable=30):
+        """ Initialize a ResponseCache object.
+
+        """
+        self.path = expanduser(path)
+        self.max_size = max_size
+        self.ttl = ttl
+        self.immutable = immutable
+        self.hits = 0
+        self.misses = 0
+        self._lock = Lock()
+        if not isdir(self.path):
+            makedirs(self.path)
+        self._size = sum(size for size, mtime, name in self._entries())
+        return
+
+    def fetch(self, url, params, load):
+        """ Return the cached content for a call.
+
+        If the content is not in the cache, the load function is called with no
+        arguments to retrieve it from the server, and the result is cached.
+
+        """
+        key = _cache_key(url, params)
+        content = self._read(key)
+        with self._lock:
+            if content is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        if content is None:
+            content = load()
+            if _cacheable(content):
+                self._write(key, content, self._expires(params))
+        return content
+
+    def clear(self):
+        """ Remove all results from the cache.
+
+        """
+        with self._lock:
+            for size, mtime, name in self._entries():
+                self._remove(name)
+            self._size = 0
+        return
+
+    def _expires(self, params):
+        """ Return the expiration time for a result, or None if it's immutable.
+
+        """
+        edate = params.get("edate") or params.get("date")
+        try:
+            edate = date_object(edate)
+        except (TypeError, ValueError):  # no date or "por"
+            pass
+        else:
+            if edate < date.today() - timedelta(days=self.immutable):
+                return None
+        return time() + self.ttl
+
+    def _read(self, key):
+        """ Read a result from the cache.
+
+        Return None if the result is not in the cache or has expired.
+
+        """
+        name = join(self.path, key)
+        try:
+            with open(name, "rb") as stream:
+                expires = loads(stream.readline())["expires"]
+                if expires is not None and expires < time():
+                    content = None
+                else:
+                    content = stream.read()
+        except IOError as err:
+            if err.errno != ENOENT:
+                raise
+            return None
+        if content is None:
+            with self._lock:
+                self._remove(name)
+        else:
+            try:
+                utime(name, None)  # mark as recently used
+            except OSError:  # removed by another thread or process
+                pass
+        return content
+
+    def _write(self, key, content, expires):
+        """ Write a result to the cache.
+
+        """
+        # Write to a temporary file first and then rename it, so other threads
+        # or processes will never see a partial result.
+        header = dumps({"expires": expires})
+        fd, tmp = mkstemp(dir=self.path, prefix=".tmp")
+        with fdopen(fd, "wb") as stream:
+            stream.write(header + "\n")
+            stream.write(content)
+        size = stat(tmp).st_size
+        rename(tmp, join(self.path, key))
+        with self._lock:
+            self._size += size
+            if self._size > self.max_size:
+                self._evict()
+        return
+
+    def _evict(self):
+        """ Evict the least-recently used results.
+
+        The caller must hold the lock. Results are evicted until the cache is
+        at 90% of its maximum size so that every write does not trigger an
+        eviction.
+
+        """
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        self._size = sum(size for size, mtime, name in entries)
+        for size, mtime, name in entries:
+            if self._size <= 0.9 * self.max_size:
+                break
+            self._remove(name)
+        return
+
+    def _entries(self):
+        """ Iterate over the (size, mtime, name) of each cached result.
+
+        """
+        for name in listdir(self.path):
+            if name.startswith("."):  # temporary file
+                continue
+            name = join(self.path, name)
+            try:
+                info = stat(name)
+            except OSError:  # removed by another thread or process
+                continue
+            yield info.st_size, info.st_mtime, name
+        return
+
+    def _remove(self, name):
+        """ Remove a cached result.
+
+        The caller must hold the lock.
+
+        """
+        try:
+            size = stat(name).st_size
+            remove(name)
+        except OSError:  # removed by another thread or process
+            return
+        self._size -= size
+        return
+
+
+class MemoryCache(object):
+    """ A thread-safe in-memory cache of server results.
+
+    This is intended for results that change rarely and are requested often,
+    e.g. station or area metadata. The cache holds at most max_entries results
+    and max_size bytes, and the least-recently used results are evicted first.
+    Results expire after ttl seconds (never if ttl is None).
+
+    Concurrent requests for the same uncached result share a single call to
+    the server. The calls parameter is an optional sequence of call types,
+    e.g. ("StnMeta", "General"); calls of any other type are not cached. If
+    there is a backend cache (e.g. a ResponseCache) it is used to retrieve
+    results that are not in memory.
+
+    The hits and misses attributes count the cache lookups, and shared counts
+    lookups that waited for a call that was already in progress.
+
+    """
+    def __init__(self, max_entries=1024, max_size=2**26, ttl=None, calls=None,
+                 backend=None):
+        """ Initialize a MemoryCache object.
+
+        """
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.ttl = ttl
+        self.calls = tuple(calls) if calls is not None else None
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self._lock = Lock()
+        self._pending = {}
+        self.clear()
+        return
+
+    @property
+    def hit_ratio(self):
+        """ The fraction of lookups that did not require a server call.
+
+        """
+        lookups = self.hits + self.misses + self.shared
+        return float(self.hits + self.shared) / lookups if lookups else 0.
+
+    def fetch(self, url, params, load):
+        """ Return the cached content for a call.
+
+        If the content is not in the cache, the load function is called with no
+        arguments to retrieve it from the server, and the result is cached.
+
+        """
+        if not self._cached(url):
+            return self._load(url, params, load)
+        key = _cache_key(url, params)
+        with self._lock:
+            content = self._get(key)
+            if content is not None:
+                self.hits += 1
+                return content
+            try:
+                flight = self._pending[key]
+            except KeyError:  # no call in progress
+                flight = self._pending[key] = _Flight()
+                self.misses += 1
+                leader = True
+            else:
+                self.shared += 1
+                leader = False
+        if not leader:
+            return flight.wait()
+        try:
+            content = self._load(url, params, load)
+        except BaseException:  # waiters must not see a missing result
+            flight.error = exc_info()
+            raise
+        else:
+            flight.content = content
+        finally:
+            with self._lock:
+                del self._pending[key]
+                if flight.error is None and _cacheable(content):
+                    self._put(key, content)
+            flight.done.set()
+        return content
+
+    def clear(self):
+        """ Remove all results from the cache.
+
+        """
+        with self._lock:
+            # The entries are a circular doubly-linked list in order of use,
+            # where each link is [prev, next, key, content, expires].
+            self._root = []
+            self._root[:] = [self._root, self._root, None, None, None]
+            self._links = {}
+            self._size = 0
+        return
+
+    def _cached(self, url):
+        """ Return True if results for this URL are cached.
+
+        """
+        if self.calls is None:
+            return True
+        path = urlsplit(url).path.lstrip("/")
+        return path.startswith(self.calls)
+
+    def _load(self, url, params, load):
+        """ Load content from the backend cache or the server.
+
+        """
+        if self.backend is None:
+            return load()
+        return self.backend.fetch(url, params, load)
+
+    def _get(self, key):
+        """ Return a cached result and mark it as the most recently used.
+
+        The caller must hold the lock. Return None if the result is not in the
+        cache or has expired.
+
+        """
+        try:
+            link = self._links[key]
+        except KeyError:
+            return None
+        self._unlink(link)
+        if link[4] is not None and link[4] < time():  # expired
+            self._remove(link)
+            return None
+        self._link(link)
+        return link[3]
+
+    def _put(self, key, content):
+        """ Add a result to the cache.
+
+        The caller must hold the lock.
+
+        """
+        if len(content) > self.max_size:
+            return  # too big to cache
+        expires = time() + self.ttl if self.ttl is not None else None
+        link = [None, None, key, content, expires]
+        self._link(link)
+        self._links[key] = link
+        self._size += len(content)
+        while (len(self._links) > self.max_entries or 
+                                                self._size > self.max_size):
+            oldest = self._root[1]
+            self._unlink(oldest)
+            self._remove(oldest)
+        return
+
+    def _link(self, link):
+        """ Insert a link at the most recently used end of the list.
+
+        """
+        last = self._root[0]
+        link[0], link[1] = last, self._root
+        last[1] = self._root[0] = link
+        return
+
+    def _unlink(self, link):
+        """ Remove a link from the list.
+
+        """
+        prev, next = link[0], link[1]
+        prev[1], next[0] = next, prev
+        return
+
+    def _remove(self, link):
+        """ Remove an unlinked result from the cache.
+
+        """
+        del self._links[link[2]]
+        self._size -= len(link[3])
+        return
+
+
+class _Flight(object):
+    """ A server call that is in progress.
+
+    """
+    def __init__(self):
+        """ Initialize a _Flight object.
+
+        """
+        self.done = Event()
+        self.content = None
+        self.error = None
+        return
+
+    def wait(self):
+        """ Wait for the call to finish and return its content.
+
+        If the call failed, its exception is raised.
+
+        """
+        self.done.wait()
+        if self.error is not None:
+            raise self.error[0], self.error[1], self.error[2]
+        return self.content
@@ -21,16 +21,276 @@ except ImportError:
     from json import dumps
     from json import loads
 
+from StringIO import StringIO
+from errno import ECONNRESET
+from errno import EPIPE
+from httplib import BadStatusLine
+from httplib import HTTPConnection
+from httplib import HTTPException
+from httplib import HTTPSConnection
+from socket import error as SocketError
+from socket import timeout as SocketTimeout
+from threading import Condition
+from time import time
 from urllib import urlencode
-from urllib2 import Request
 from urllib2 import HTTPError
-from urllib2 import urlopen
 from urlparse import urljoin
+from urlparse import urlsplit
+from zlib import MAX_WBITS
+from zlib import decompressobj
+from zlib import error as ZlibError
 
+from . import events
+from ._json import iter_array
+from ._json import parallel_loads
 from .error import RequestError
 from .error import ResultError
 
-__all__ = ("WebServicesCall",)
+__all__ = ("WebServicesCall", "ConnectionPool")
+
+
+class ConnectionPool(object):
+    """ A pool of persistent HTTP connections.
+
+    Connections use HTTP/1.1 keep-alive so that consecutive requests to the
+    same host can reuse an open socket instead of paying the cost of a new
+    connection (and TLS handshake for https) every time. The maxsize attribute
+    is the maximum number of open connections per host; a thread that needs a
+    connection when this limit is reached will wait until one is released. 
+    Connections that have been idle for more than idle seconds are closed.
+
+    A connection is only released when the stream using it is closed, so every
+    stream must be closed even if it is not completely read.
+
+    """
+    def __init__(self, maxsize=4, idle=60):
+        """ Initialize a ConnectionPool object.
+
+        """
+        self.maxsize = maxsize
+        self.idle = idle
+        self._lock = Condition()
+        self._pool = {}  # idle connections keyed by (scheme, host)
+        self._count = {}  # checked-out connections keyed by (scheme, host)
+        return
+
+    def acquire(self, url, timeout=None):
+        """ Get a connection for the scheme and host of a URL.
+
+        An idle connection is reused if one is available, otherwise a new 
+        connection is created. The second item of the returned tuple is True 
+        for a reused connection. If the connection limit has been reached, a
+        socket.timeout is raised if no connection is released within timeout
+        seconds.
+
+        """
+        scheme, host = urlsplit(url)[:2]
+        key = (scheme.lower(), host.lower())
+        if timeout is not None:
+            expires = time() + timeout
+        with self._lock:
+            while True:
+                self._evict()
+                try:
+                    conn = self._pool[key].pop()[0]
+                except (KeyError, IndexError):  # no idle connection
+                    conn = None
+                if conn is not None or self._count.get(key, 0) < self.maxsize:
+                    break
+                if timeout is None:
+                    self._lock.wait()
+                    continue
+                remaining = expires - time()
+                if remaining <= 0:
+                    raise SocketTimeout("timed out waiting for a connection")
+                self._lock.wait(remaining)
+            self._count[key] = self._count.get(key, 0) + 1
+        if conn is None:
+            https = scheme.lower() == "https"
+            conn = (HTTPSConnection if https else HTTPConnection)(host,
+                                                            timeout=timeout)
+            conn.pool_key = key
+            return conn, False
+        conn.timeout = timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, True
+
+    def release(self, conn, reuse=True):
+        """ Return a connection to the pool.
+
+        If reuse is False the connection is closed instead of being kept for
+        another request, e.g. the server asked to close it or the last reply 
+        was not completely read.
+
+        """
+        with self._lock:
+            self._count[conn.pool_key] -= 1
+            if reuse and conn.sock is not None:
+                idle = self._pool.setdefault(conn.pool_key, [])
+                idle.append((conn, time()))
+            else:
+                conn.close()
+            self._lock.notify()
+        return
+
+    def clear(self):
+        """ Close all idle connections.
+
+        """
+        with self._lock:
+            for idle in self._pool.itervalues():
+                for conn, stamp in idle:
+                    conn.close()
+            self._pool = {}
+        return
+
+    def _evict(self):
+        """ Close connections that have been idle for too long.
+
+        The caller must hold the lock.
+
+        """
+        expired = time() - self.idle
+        for idle in self._pool.itervalues():
+            while idle and idle[0][1] < expired:  # oldest connections first
+                idle.pop(0)[0].close()
+        return
+
+
+class _Response(object):
+    """ A file-like object for reading a pooled HTTP response.
+
+    The connection is returned to the pool when the response is closed. It is
+    only reused if the entire response was read. A gzip or deflate response is
+    decompressed as it is read. The wire_bytes attribute is the number of
+    (possibly compressed) content bytes read from the server so far, and bytes
+    is the number of decompressed bytes.
+
+    """
+    _chunk = 8192
+    _wbits = {"gzip": 16 + MAX_WBITS, "deflate": MAX_WBITS}
+
+    def __init__(self, response, conn, pool, info=None):
+        """ Initialize a _Response object.
+
+        The optional info parameter is a dict of values for the "response"
+        event that is emitted when the response is closed.
+
+        """
+        self.code = response.status
+        self.msg = response.reason
+        self.headers = response.msg
+        self._response = response
+        self._conn = conn
+        self._pool = pool
+        self._buffer = ""
+        self._pos = 0
+        self.wire_bytes = 0
+        self.bytes = 0
+        self._info = info
+        self._start = time()
+        encoding = response.getheader("Content-Encoding", "").strip().lower()
+        try:
+            self._decoder = decompressobj(self._wbits[encoding])
+        except KeyError:  # identity
+            self._decoder = None
+        self._encoding = encoding
+        return
+
+    def read(self, size=-1):
+        """ Read up to size bytes, or the rest of the response if size < 0.
+
+        """
+        chunks = []
+        count = 0
+        while True:
+            avail = len(self._buffer) - self._pos
+            if 0 <= size <= count + avail:
+                end = self._pos + size - count
+                chunks.append(self._buffer[self._pos:end])
+                self._pos = end
+                break
+            chunks.append(self._buffer[self._pos:])
+            count += avail
+            if not self._fill():
+                break
+        return "".join(chunks)
+
+    def readline(self):
+        """ Read the next line of the response.
+
+        """
+        chunks = []
+        while True:
+            end = self._buffer.find("\n", self._pos) + 1
+            if end > 0:
+                chunks.append(self._buffer[self._pos:end])
+                self._pos = end
+                break
+            chunks.append(self._buffer[self._pos:])
+            if not self._fill():
+                break
+        return "".join(chunks)
+
+    def __iter__(self):
+        """ Iterate over each line of the response.
+
+        """
+        return iter(self.readline, "")
+
+    def close(self):
+        """ Close the response and release its connection.
+
+        """
+        if self._conn is None:
+            return  # already closed
+        complete = self._response.isclosed()
+        reuse = complete and not self._response.will_close
+        self._response.close()
+        self._pool.release(self._conn, reuse)
+        self._conn = None
+        if self._info is not None:
+            events.emit("response", transfer=time() - self._start,
+                        wire_bytes=self.wire_bytes, bytes=self.bytes, 
+                        **self._info)
+        return
+
+    def _fill(self):
+        """ Replace the buffer with the next chunk from the server.
+
+        Return False if there is no more data.
+
+        """
+        self._buffer, self._pos = "", 0
+        while self._conn is not None and not self._buffer:
+            chunk = self._response.read(self._chunk)
+            self.wire_bytes += len(chunk)
+            if self._decoder is None:
+                self._buffer = chunk
+            elif chunk:
+                self._buffer = self._decompress(chunk)
+            else:
+                self._buffer = self._decoder.flush()
+            if not chunk:
+                break
+        self.bytes += len(self._buffer)
+        return len(self._buffer) > 0
+
+    def _decompress(self, chunk):
+        """ Decompress a chunk of the response.
+
+        """
+        try:
+            return self._decoder.decompress(chunk)
+        except ZlibError:
+            if self._encoding != "deflate" or self.wire_bytes > len(chunk):
+                raise ResultError("server returned invalid compressed data")
+        # Some servers send a raw deflate stream without the zlib header that
+        # is required by the HTTP spec.
+        self._encoding = "raw"
+        self._decoder = decompressobj(-MAX_WBITS)
+        return self._decompress(chunk)
 
 
 class WebServicesCall(object):
@@ -43,14 +303,32 @@ class WebServicesCall(object):
     _server = "http://data.rcc-acis.org"
     _timeout = 15  # seconds
 
-    def __init__(self, call_type):
+    # All calls share the same connection pool so that keep-alive connections
+    # can be reused by every WebServicesCall and Request object.
+    pool = ConnectionPool()
+
+    # An optional cache for all calls, e.g. a ResponseCache (see cache.py).
+    cache = None
+
+    # If processes is not None, JSON results that are at least parallel_size
+    # bytes are decoded by that many processes (0 for the number of CPUs); see
+    # _json.parallel_loads(). The decoded items still have to be rebuilt in
+    # this process, so the speedup is greatest for numeric results, e.g.
+    # GridData, and process startup makes this slower for smaller results.
+    processes = None
+    parallel_size = 8 * 1024 * 1024
+
+    def __init__(self, call_type, timeout=None):
         """ Initialize a WebServicesCall.
 
         The call_type parameter is the type of ACIS call, e.g. "StnMeta",
-        "StnData", etc.
+        "StnData", etc. The optional timeout (in seconds) overrides the default
+        timeout for this call.
 
         """
         self.url = urljoin(self._server, call_type)
+        if timeout is not None:
+            self._timeout = timeout
         return
 
     def __call__(self, params):
@@ -59,38 +337,133 @@ class WebServicesCall(object):
         The params parameter is a dict specifying the call parameters. The
         result depends on the output type specified in params. JSON output
         (the default) gets decoded and returned as a dict, and for all other
-        output types a stream object gets returned.
+        output types a stream object gets returned. The caller must close the
+        stream, even if it is not completely read, to release its connection
+        to the pool.
 
         """
-        stream = self._post(urlencode({"params": dumps(params)}))
+        stream = self._open(params)
         if params.get("output", "json").lower() != "json":
             return stream
         try:
-            result = loads(stream.read())
+            content = stream.read()
+            start = time()
+            if self.processes is None or len(content) < self.parallel_size:
+                result = loads(content)
+            else:
+                result = parallel_loads(content, self.processes)
         except ValueError:
             raise ResultError("server returned invalid JSON")
         finally:
             stream.close()
+        events.emit("decode", events.call_type(self.url), 
+                    decode=time() - start, bytes=len(content))
         return result
 
+    def iterdata(self, params, extra=None):
+        """ Execute a web services call and iterate over the data items.
+
+        This is only for JSON output. Rather than decoding the entire result at
+        once, each item of the "data" array, e.g. each site for MultiStnData or
+        each date for GridData, is decoded and yielded as it is read from the
+        server, so only one item at a time is held in memory. If the optional
+        extra parameter is a dict, the other values in the result (e.g. meta
+        and smry for GridData) are stored in it as they are decoded.
+
+        """
+        stream = self._open(params)
+        try:
+            for item in iter_array(stream, "data", extra):
+                yield item
+        finally:
+            stream.close()
+        return
+
+    def _open(self, params):
+        """ Execute a web services call and return the result stream.
+
+        """
+        data = urlencode({"params": dumps(params)})
+        if self.cache is None:
+            return self._post(data)
+        return StringIO(self.cache.fetch(self.url, params,
+                                         lambda: self._read(data)))
+
+    def _read(self, data):
+        """ Execute a POST request and return the entire result.
+
+        """
+        stream = self._post(data)
+        try:
+            return stream.read()
+        finally:
+            stream.close()
+
     def _post(self, data):
         """ Execute a POST request.
 
         The data parameter must be a properly encoded and escaped string.
 
         """
+        http_ok = 200
         http_bad = 400
-        request = Request(self.url, data)
+        headers = {
+            "Content-Type": "application/x-www-form-urlencoded",
+            "Accept-Encoding": "gzip, deflate",
+        }
+        path = urlsplit(self.url).path
+        conn, reused = self.pool.acquire(self.url, self._timeout)
+        start = time()
         try:
-            stream = urlopen(request, timeout=self._timeout)
-        except HTTPError as err:
+            try:
+                conn.request("POST", path, data, headers)
+                response = conn.getresponse()
+            except (HTTPException, SocketError) as error:
+                if not reused or not _stale(error):
+                    raise
+                # The server closed an idle keep-alive connection, so try 
+                # again with a new connection.
+                self.pool.release(conn, False)
+                conn, reused = None, False
+                conn = self.pool.acquire(self.url, self._timeout)[0]
+                conn.request("POST", path, data, headers)
+                response = conn.getresponse()
+        except:
+            if conn is not None:
+                self.pool.release(conn, False)
+            raise
+        info = None
+        if events.enabled():
+            info = {"call_type": events.call_type(self.url), 
+                    "param_bytes": len(data), "ttfb": time() - start}
+        stream = _Response(response, conn, self.pool, info)
+        if stream.code != http_ok:
             # This doesn't do the right thing for a "soft 404", e.g. an ISP
             # redirects to a custom error or search page for a DNS lookup
             # failure and returns a 200 (OK) code.
-            if err.code == http_bad:
+            content = stream.read()
+            stream.close()
+            if stream.code == http_bad:
                 # If the ACIS server returns this code it also provides a
                 # helpful plain text error message as the content.
-                raise RequestError(err.read().rstrip())
-            else:
-                raise
+                raise RequestError(content.rstrip())
+            raise HTTPError(self.url, stream.code, stream.msg, stream.headers,
+                            None)
         return stream
+
+
+def _stale(error):
+    """ Return True if an error means a reused connection was closed.
+
+    This is the case if the server closed the connection before sending any of
+    the reply. A timeout is not included because the server may still be
+    processing the request, so sending it again would duplicate the work.
+
+    """
+    if isinstance(error, BadStatusLine):
+        return True  # closed without a status line
+    if isinstance(error, SocketTimeout):
+        return False
+    if isinstance(error, SocketError):
+        return error.errno in (ECONNRESET, EPIPE)
+    return False
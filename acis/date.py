@@ -7,20 +7,25 @@ calculate a date range based on ACIS call parameters.
 This implementation is based on ACIS Web Services Version 2:
     <http://data.rcc-acis.org/doc/>.
 
-The external dateutil library is required:
+The external dateutil library is required for date_delta(), and it is imported
+the first time it is needed:
     <http://pypi.python.org/pypi/python-dateutil>.
 
 """
 from __future__ import absolute_import
 
+from calendar import monthrange
 from datetime import date
 from re import compile
 
-from dateutil.relativedelta import relativedelta
-
-__all__ = ("date_object", "date_string", "date_trunc", "date_range")
+__all__ = ("date_object", "date_string", "date_trunc", "date_range", 
+           "date_array")
 
 _DATE_REGEX = compile(r"^(\d{4})(?:-?(\d{2}))?(?:-?(\d{2}))?$")
+_NAMED_INTERVALS = {"dly": (0, 0, 1), "mly": (0, 1, 0), "yly": (1, 0, 0)}
+_RANGE_CACHE = {}  # date range tuples keyed by (sdate, edate, interval)
+_RANGE_CACHE_SIZE = 128
+_DATE_STRINGS = {}  # date strings keyed by ordinal
 
 
 def date_object(datestr):
@@ -60,16 +65,21 @@ def date_delta(interval):
     An interval can be a name ("dly", "mly", "yly") or a (y, m, d) sequence.
     
     """
-    named_deltas = {
-        "dly": (0, 0, 1),
-        "mly": (0, 1, 0),
-        "yly": (1, 0, 0)}
+    from dateutil.relativedelta import relativedelta  # only needed here
+    y, m, d = _interval(interval)
+    return relativedelta(years=y, months=m, days=d)
+
+
+def _interval(interval):
+    """ Return the (y, m, d) tuple for an interval.
+
+    """
     try:
-        interval = named_deltas[interval.lower()]
+        return _NAMED_INTERVALS[interval.lower()]
     except AttributeError:  # not a str
         pass
     y, m, d = interval
-    return relativedelta(years=y, months=m, days=d)
+    return int(y), int(m), int(d)
 
 
 def date_trunc(datestr, interval):
@@ -99,19 +109,92 @@ def date_trunc(datestr, interval):
 def date_range(sdate, edate=None, interval="dly"):
     """ Return a date range.
 
-    A generator expression is created for a date range based on the start date,
-    end date (inclusive), and interval. A single date is returned if edate is
-    None. The interval can be "yly", "mly", "dly" or a (y, m, d) sequence.
-    The returned dates will have the precision defined by interval (see the
-    date_trunc function).
+    An iterator is created for a date range based on the start date, end date
+    (inclusive), and interval. A single date is returned if edate is None. The
+    interval can be "yly", "mly", "dly" or a (y, m, d) sequence. The returned
+    dates will have the precision defined by interval (see the date_trunc
+    function). Dates are calculated using integer arithmetic, and recent 
+    ranges are cached, so repeating a range is essentially free.
+    
+    """
+    return iter(_date_tuple(sdate, edate, interval))
+
+
+def date_array(sdate, edate=None, interval="dly"):
+    """ Return a date range as a numpy datetime64 array.
+
+    The parameters are the same as for date_range(). For "mly" and "yly" 
+    intervals the array units are months and years, respectively, and days
+    otherwise. This requires numpy 1.7 or later:
+        <http://numpy.scipy.org/>
     
+    """
+    import numpy  # optional dependency
+    if edate is None:
+        edate = sdate
+    y, m, d = _interval(interval)
+    sdate = date_trunc(sdate, interval)
+    edate = date_trunc(edate, interval)
+    unit = {4: "Y", 7: "M", 10: "D"}[len(sdate)]  # precision of the dates
+    step = {"Y": y, "M": m, "D": d}[unit]
+    if (y, m, d).count(0) == 2 and step > 0:
+        # A single date component that matches the precision can be stepped
+        # using datetime64 arithmetic.
+        start = numpy.datetime64(sdate, unit)
+        stop = numpy.datetime64(edate, unit) + 1
+        return numpy.arange(start, stop, step)
+    dates = _date_tuple(sdate, edate, interval)
+    return numpy.array(dates, dtype="datetime64[D]")
+
+
+def _date_tuple(sdate, edate=None, interval="dly"):
+    """ Return a date range as a tuple of date strings.
+
+    The parameters are the same as for date_range(). The tuple is cached.
+
     """
     if edate is None:
         edate = sdate
-    sdate = date_object(date_trunc(sdate, interval))
-    edate = date_object(date_trunc(edate, interval))
-    delta = date_delta(interval)
-    while sdate <= edate:
-        yield date_trunc(date_string(sdate), interval)
-        sdate += delta
-    return
\ No newline at end of file
+    try:
+        key = (sdate, edate, interval.lower())
+    except AttributeError:  # not a str
+        key = (sdate, edate, tuple(interval))
+    try:
+        return _RANGE_CACHE[key]
+    except KeyError:  # not cached
+        pass
+    y, m, d = _interval(interval)
+    if min(y, m, d) < 0 or not (y or m or d):
+        raise ValueError("invalid interval: {0!r}".format(interval))
+    start = date_object(date_trunc(sdate, interval))
+    end = date_object(date_trunc(edate, interval))
+    if not (y or m):
+        ordinals = xrange(start.toordinal(), end.toordinal() + 1, d)
+    else:
+        # Emulate the cumulative addition of a relativedelta: the year and
+        # month are incremented first, the day is clamped to the length of the
+        # new month, and then the days are added.
+        ordinals = []
+        while start <= end:
+            ordinals.append(start.toordinal())
+            months = start.month - 1 + m
+            year = start.year + y + months // 12
+            month = months % 12 + 1
+            day = min(start.day, monthrange(year, month)[1])
+            start = date.fromordinal(date(year, month, day).toordinal() + d)
+    strings = _DATE_STRINGS
+    dates = []
+    for ordinal in ordinals:
+        try:
+            dates.append(strings[ordinal])
+        except KeyError:  # first use of this date
+            strings[ordinal] = date.fromordinal(ordinal).isoformat()
+            dates.append(strings[ordinal])
+    size = len(date_trunc("2000-01-01", interval))  # precision of the dates
+    if size < 10:
+        dates = [datestr[:size] for datestr in dates]
+    dates = tuple(dates)
+    if len(_RANGE_CACHE) >= _RANGE_CACHE_SIZE:
+        _RANGE_CACHE.clear()
+    _RANGE_CACHE[key] = dates
+    return dates
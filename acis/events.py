@@ -0,0 +1,151 @@
+""" Instrumentation events for ACIS Web Services calls.
+
+* USE AT YOUR OWN RISK. *
+
+A hook is any function that accepts an event dict. Hooks are registered with
+add_hook(), and every hook is called for each event emitted by a
+WebServicesCall, RequestQueue, Result, or Stream object. Events may be emitted
+from worker threads, so hooks must be thread-safe. When no hooks are
+registered the cost of instrumentation is negligible.
+
+Each event has an "event" key identifying its type and a "call_type" key, e.g.
+"StnData", and the remaining keys are measurements; times are in seconds:
+    response    param_bytes, ttfb, transfer, wire_bytes, bytes
+    decode      decode (JSON decoding time), bytes
+    construct   construct (Result construction time)
+    stream      parse (CSV parsing time), records
+    request     wait (time in the RequestQueue), attempts
+
+The CallStats class is a hook that aggregates events and reports percentiles
+for each call type. The interface should not be considered stable.
+
+"""
+from __future__ import absolute_import
+
+from sys import stdout
+from threading import Lock
+from urlparse import urlsplit
+
+__all__ = ("add_hook", "remove_hook", "CallStats")
+
+_hooks = []
+
+
+def add_hook(hook):
+    """ Register a hook function to be called for every event.
+
+    """
+    _hooks.append(hook)
+    return
+
+
+def remove_hook(hook):
+    """ Unregister a hook function.
+
+    """
+    _hooks.remove(hook)
+    return
+
+
+def enabled():
+    """ Return True if any hooks are registered.
+
+    """
+    return bool(_hooks)
+
+
+def emit(event, call_type, **values):
+    """ Emit an event to all registered hooks.
+
+    """
+    if not _hooks:
+        return
+    values.update({"event": event, "call_type": call_type})
+    for hook in list(_hooks):
+        hook(values)
+    return
+
+
+def call_type(url):
+    """ Return the call type for a web services URL.
+
+    """
+    return urlsplit(url).path.rstrip("/").rsplit("/", 1)[-1]
+
+
+class CallStats(object):
+    """ Aggregate events by call type.
+
+    A CallStats object is a hook function, e.g.
+        stats = CallStats()
+        acis.add_hook(stats)
+        ...
+        stats.report()
+
+    """
+    def __init__(self, percentiles=(50, 95, 99)):
+        """ Initialize a CallStats object.
+
+        """
+        self.percentiles = tuple(percentiles)
+        self._lock = Lock()
+        self._samples = {}  # lists of values keyed by (call_type, measurement)
+        return
+
+    def __call__(self, event):
+        """ Record the measurements for an event.
+
+        """
+        with self._lock:
+            for key, value in event.iteritems():
+                if key in ("event", "call_type") or value is None:
+                    continue
+                samples = self._samples.setdefault((event["call_type"], key),
+                                                   [])
+                samples.append(value)
+        return
+
+    def summary(self):
+        """ Return the percentiles for each call type and measurement.
+
+        The return value is a dict of dicts keyed by call type and then by
+        measurement, and each value is a (count, p1, p2, ...) tuple for the
+        percentiles of this object.
+
+        """
+        summary = {}
+        with self._lock:
+            for (call_type, key), samples in self._samples.iteritems():
+                values = sorted(samples)
+                stats = [len(values)]
+                for pct in self.percentiles:
+                    # Use the nearest-rank method.
+                    rank = max(0, -(-pct * len(values) // 100) - 1)
+                    stats.append(values[rank])
+                summary.setdefault(call_type, {})[key] = tuple(stats)
+        return summary
+
+    def report(self, stream=stdout):
+        """ Write a table of the summary() percentiles to a stream.
+
+        """
+        header = ["call_type", "measurement", "count"]
+        header.extend("p{0:d}".format(pct) for pct in self.percentiles)
+        stream.write(" ".join("{0:>12s}".format(col) for col in header))
+        stream.write("\n")
+        for call_type, stats in sorted(self.summary().iteritems()):
+            for key, values in sorted(stats.iteritems()):
+                line = ["{0:>12s}".format(call_type), "{0:>12s}".format(key)]
+                line.append("{0:12d}".format(values[0]))
+                line.extend("{0:12.4g}".format(value) for value in values[1:])
+                stream.write(" ".join(line))
+                stream.write("\n")
+        return
+
+    def clear(self):
+        """ Discard all recorded events.
+
+        """
+        with self._lock:
+            self._samples = {}
+        return
@@ -0,0 +1,248 @@
+""" Indexed lookups for station metadata.
+
+A StationIndex is built from a StnMetaResult and answers spatial and attribute
+queries without scanning the metadata of every site. Each query returns a set
+of site UIDs (except for nearest(), which returns an ordered list), so the
+results of different queries can be combined using set operations:
+
+    index = StationIndex(result)
+    uids = index.find(state="OK") & index.elevation(300, 500)
+
+"""
+from __future__ import absolute_import
+
+from bisect import bisect_left
+from bisect import bisect_right
+from heapq import heappush
+from heapq import heapreplace
+from math import asin
+from math import cos
+from math import floor
+from math import pi
+from math import radians
+from math import sin
+from math import sqrt
+
+from .util import index_sids
+
+__all__ = ("StationIndex",)
+
+_EARTH_RADIUS = 6371.0  # km
+
+
+class StationIndex(object):
+    """ An index of station metadata.
+
+    The spatial index requires the "ll" metadata field, the elevation index
+    requires "elev", and the period-of-record index requires "valid_daterange".
+    The attribute indexes use the "state", "county", "climdiv", and "sids"
+    fields. Sites without a field are not included in the corresponding index.
+    A StationIndex can be pickled.
+
+    """
+    _attrs = ("state", "county", "climdiv")
+
+    def __init__(self, result, cell=1.):
+        """ Initialize a StationIndex object.
+
+        The result parameter is a StnMetaResult or its meta attribute. The
+        spatial grid for bbox queries has cells of the given size in degrees.
+
+        """
+        self.meta = getattr(result, "meta", result)
+        self.cell = cell
+        self._grid = {}  # uids for each (i, j) grid cell
+        self._attr = dict((attr, {}) for attr in self._attrs)
+        self._elev = []  # sorted (elev, uid) pairs
+        self._ranges = []  # sorted date ranges for each elem
+        points = []
+        for uid, site in self.meta.iteritems():
+            try:
+                lon, lat = site["ll"]
+            except (KeyError, TypeError, ValueError):  # no valid ll
+                pass
+            else:
+                self._grid.setdefault(self._cell(lon, lat), []).append(uid)
+                points.append(_unit_vector(lon, lat) + (uid,))
+            for attr in self._attrs:
+                try:
+                    value = site[attr]
+                except KeyError:
+                    continue
+                self._attr[attr].setdefault(value, set()).add(uid)
+            try:
+                self._elev.append((float(site["elev"]), uid))
+            except (KeyError, TypeError, ValueError):  # no valid elev
+                pass
+            for pos, dates in enumerate(site.get("valid_daterange", ())):
+                while len(self._ranges) <= pos:
+                    self._ranges.append([])
+                if dates:
+                    self._ranges[pos].append((dates[0], dates[1], uid))
+        self._elev.sort()
+        for pos, ranges in enumerate(self._ranges):
+            # Store the sorted ranges as (starts, ends, uids) columns.
+            self._ranges[pos] = map(list, zip(*sorted(ranges))) or [[], [], []]
+        sids, self.sids = index_sids(dict((uid, site) for uid, site in
+                                          self.meta.iteritems() if
+                                          "sids" in site))
+        self._networks = {}
+        for uid, table in sids.iteritems():
+            for network in table:
+                self._networks.setdefault(network, set()).add(uid)
+        self._points = points
+        _build_tree(self._points)
+        return
+
+    def __len__(self):
+        """ Return the number of sites in the index.
+
+        """
+        return len(self.meta)
+
+    def find(self, state=None, county=None, climdiv=None, network=None):
+        """ Return the sites that match all of the given attributes.
+
+        The network is a network name or code as used by decode_sids(), and
+        it matches any site that has an ID for that network. All sites are
+        returned if no attributes are specified.
+
+        """
+        matches = [self._attr[attr].get(value, set()) for attr, value in
+                   (("state", state), ("county", county),
+                    ("climdiv", climdiv)) if value is not None]
+        if network is not None:
+            matches.append(self._networks.get(network, set()))
+        if not matches:
+            return set(self.meta)
+        matches.sort(key=len)
+        return matches[0].intersection(*matches[1:])
+
+    def uid(self, network, ident):
+        """ Return the site UID for a network ID, e.g. uid("WBAN", "13967").
+
+        A KeyError is raised for an unknown ID.
+
+        """
+        return self.sids[(network, ident)]
+
+    def bbox(self, west, south, east, north):
+        """ Return the sites within a bounding box (inclusive).
+
+        """
+        imin, jmin = self._cell(west, south)
+        imax, jmax = self._cell(east, north)
+        uids = set()
+        for i in range(imin, imax + 1):
+            for j in range(jmin, jmax + 1):
+                for uid in self._grid.get((i, j), ()):
+                    lon, lat = self.meta[uid]["ll"]
+                    if west <= lon <= east and south <= lat <= north:
+                        uids.add(uid)
+        return uids
+
+    def nearest(self, lon, lat, n=1, max_distance=None):
+        """ Return the n sites nearest to a point.
+
+        The return value is a list of (uid, distance) pairs in order of
+        increasing distance, where distance is the great circle distance in
+        km. If max_distance is not None, sites farther away are excluded.
+
+        """
+        if n < 1:
+            return []
+        heap = []  # (-chord**2, uid) for the n nearest sites so far
+        limit = float("inf")
+        if max_distance is not None:
+            angle = min(max_distance / _EARTH_RADIUS, pi)
+            limit = (2 * sin(angle / 2))**2  # squared chord length
+        target = _unit_vector(lon, lat)
+        stack = [(0, len(self._points), 0, 0.)]
+        while stack:
+            # Each subtree is skipped if the squared distance to its splitting
+            # plane (a lower bound for all its points) is too large.
+            lo, hi, axis, bound = stack.pop()
+            if lo >= hi or bound > limit:
+                continue
+            if len(heap) == n and bound >= -heap[0][0]:
+                continue
+            mid = (lo + hi) // 2
+            point = self._points[mid]
+            dist2 = sum((point[k] - target[k])**2 for k in range(3))
+            if dist2 <= limit:
+                if len(heap) < n:
+                    heappush(heap, (-dist2, point[3]))
+                elif dist2 < -heap[0][0]:
+                    heapreplace(heap, (-dist2, point[3]))
+            diff = target[axis] - point[axis]
+            near, far = (lo, mid), (mid + 1, hi)
+            if diff > 0:
+                near, far = far, near
+            axis = (axis + 1) % 3
+            stack.append(far + (axis, max(bound, diff * diff)))
+            stack.append(near + (axis, bound))  # search this side first
+        nearest = sorted((-dist2, uid) for dist2, uid in heap)
+        return [(uid, 2 * _EARTH_RADIUS * asin(min(1., sqrt(dist2) / 2))) for
+                dist2, uid in nearest]
+
+    def elevation(self, low=None, high=None):
+        """ Return the sites within an elevation range (inclusive).
+
+        Elevation units are the same as the metadata.
+
+        """
+        start = bisect_left(self._elev, (low,)) if low is not None else 0
+        end = len(self._elev)
+        if high is not None:
+            end = bisect_right(self._elev, (high, float("inf")))
+        return set(uid for elev, uid in self._elev[start:end])
+
+    def overlaps(self, sdate, edate, elem=0):
+        """ Return the sites whose period of record overlaps a date range.
+
+        The date range is inclusive, and dates are YYYY-MM-DD strings. The
+        elem parameter is the position of the element in the "elems" used for
+        the StnMeta call.
+
+        """
+        try:
+            starts, ends, uids = self._ranges[elem]
+        except IndexError:  # no valid_daterange for this element
+            return set()
+        end = bisect_right(starts, edate)  # all ranges that start by edate
+        return set(uid for stop, uid in zip(ends[:end], uids[:end]) if
+                   stop >= sdate)
+
+    def _cell(self, lon, lat):
+        """ Return the grid cell for a point.
+
+        """
+        return int(floor(lon / self.cell)), int(floor(lat / self.cell))
+
+
+def _unit_vector(lon, lat):
+    """ Return the 3D unit vector for a point on the Earth's surface.
+
+    """
+    lon, lat = radians(lon), radians(lat)
+    return cos(lat) * cos(lon), cos(lat) * sin(lon), sin(lat)
+
+
+def _build_tree(points):
+    """ Arrange a list of (x, y, z, uid) points in place as a k-d tree.
+
+    The tree is implicit: the root is the median point for the x axis at the 
+    middle of the list, and the points before and after it are the left and 
+    right subtrees, which are arranged the same way for the next axis.
+
+    """
+    stack = [(0, len(points), 0)]
+    while stack:
+        lo, hi, axis = stack.pop()
+        if hi - lo <= 1:
+            continue
+        points[lo:hi] = sorted(points[lo:hi], key=lambda point: point[axis])
+        mid = (lo + hi) // 2
+        stack.append((lo, mid, (axis + 1) % 3))
+        stack.append((mid + 1, hi, (axis + 1) % 3))
+    return
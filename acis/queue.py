@@ -1,205 +1,414 @@
 """ Parallel execution of multiple ACIS Requests.
 
-* USE AT YOUR OWN RISK. *  
+* USE AT YOUR OWN RISK. *
 
 In situations where server-side processing is the bottleneck, application
 performance can be enhanced by executing requests in parallel on the ACIS
 server.
 
-This is _very_ alpha and cannot handle things like server redirects (but ACIS
-isn't doing this...yet). An error with one request will take the whole queue
-down. The interface should not be considered stable. 
+Requests are executed by a fixed number of worker threads that share a pool of
+keep-alive connections, so thousands of requests can be queued without opening
+thousands of sockets. This cannot handle things like server redirects (but ACIS
+isn't doing this...yet). By default an error with one request will take the
+whole queue down, but errors can be captured for each request instead, and
+transient errors can be retried.
+
+JSON decoding and callbacks are CPU-bound, so they cannot run in parallel in
+worker threads. Alternatively, requests can be executed by a pool of worker
+processes that each make their own calls and apply the callbacks; only the
+return value of each callback is sent back to the parent process. The
+interface should not be considered stable.
 
 """
 from __future__ import absolute_import
 
-from asyncore import dispatcher
-from asyncore import loop
-from cStringIO import StringIO
-from json import dumps
-from json import loads
-from socket import AF_INET
-from socket import SOCK_STREAM
-from urllib import urlencode
-from urlparse import urlparse
+from Queue import Empty
+from Queue import Queue
+from cPickle import HIGHEST_PROTOCOL
+from cPickle import dumps
+from cPickle import loads
+from httplib import HTTPException
+from multiprocessing import Pool
+from socket import error as SocketError
+from sys import exc_info
+from threading import Semaphore
+from threading import Thread
+from time import sleep
+from time import time
+from urllib2 import HTTPError
+
+from . import events
+from .call import ConnectionPool
+from .call import WebServicesCall
 
-from acis import RequestError
-from acis import ResultError
+__all__ = ("RequestQueue", "RetryPolicy", "RequestFailure")
 
 
 class RequestQueue(object):
     """ Manage parallel Requests.
-    
+
     """
-    @staticmethod
-    def _parse(reply):
-        """ Retrieve the JSON result from the reply returned by the server.
-        
-        """
-        code, message = reply.status
-        if code != 200:
-            # This doesn't do the right thing for a "soft 404", e.g. an ISP
-            # redirects to a custom error or search page for a DNS lookup
-            # failure and returns a 200 (OK) code.
-            if code == 400:
-                # If the ACIS server returns this code it also provides a
-                # helpful plain text error message as the content.
-                raise RequestError(reply.content.rstrip())
-            else:
-                error = "HTTP error: {0:s} ({1:d})".format(message, code)
-                raise RuntimeError(error)
-        try:
-            return loads(reply.content)
-        except ValueError:
-            raise ResultError("server returned invalid JSON")
-        
-    def __init__(self):
+    def __init__(self, workers=4, max_in_flight=None, timeout=None,
+                 retry=None, processes=None, pool=None):
         """ Initialize a RequestQueue object.
-        
+
+        The workers parameter is the maximum number of concurrent requests (and
+        open connections) to the server. The max_in_flight parameter limits
+        the number of requests that have been sent to the server but whose
+        results have not been collected yet; by default this is twice the
+        number of workers. The timeout parameter is the default timeout in
+        seconds for each request. The optional retry parameter is a 
+        RetryPolicy for retrying requests that fail with a transient error.
+        The optional pool is a ConnectionPool to use instead of a private pool
+        for this queue, e.g. WebServicesCall.pool to share keep-alive
+        connections with other calls; its maxsize also limits concurrency.
+
+        If processes is not None requests are executed by a pool of that many
+        worker processes (0 for the number of CPUs) instead of worker threads,
+        and the workers and max_in_flight parameters are ignored. Each process
+        executes one request at a time and applies its callback, so callbacks
+        must be picklable (e.g. a module-level function or a Result class),
+        and so must their return values. Events are emitted in the worker
+        processes, and the traceback for a captured error is not available.
+
         """
+        self.workers = workers
+        self.processes = processes
+        self.max_in_flight = max_in_flight or 2 * workers
+        self.timeout = timeout
+        self.retry = retry
+        self._pool = pool or ConnectionPool(maxsize=workers)
         self.clear()
         return
-        
-    def add(self, request, callback=None):
+
+    def add(self, request, callback=None, timeout=None):
         """ Add a Request to the queue.
-        
+
         During execution the resulting query object is passed to callback and
         the return value is stored; if no callback is specified the query
-        object is stored.
-                
+        object is stored. The optional timeout overrides the queue timeout for
+        this request.
+
         """
-        url = urlparse(request.url)
-        data = urlencode({"params": dumps(request.params)})
-        http_request = _HttpRequest(url.netloc, url.path, data, self._sockmap)
-        self._queue.append((http_request, request.params, callback))
+        if timeout is None:
+            timeout = self.timeout
+        params = dict(request.params)  # the request may be modified and reused
+        self._queue.append((request.url, params, callback, timeout))
         return
-        
-    def execute(self):
+
+    def execute(self, capture=False, consumer=None):
         """ Execute all requests in the queue.
-        
-        When execution is complete each element of the results attribute will 
-        contain a query object or the optional result type specified for that 
-        request.
-        
+
+        When execution is complete each element of the results attribute will
+        contain a query object or the optional result type specified for that
+        request. By default the first error is raised and the remaining 
+        requests are abandoned. If capture is True, the result for a request 
+        that failed (including its callback) is a RequestFailure object 
+        instead.
+
+        If a consumer function is specified each result is passed to it as
+        soon as its request is completed instead of being stored in the 
+        results attribute.
+
         """
-        loop(map=self._sockmap)  # execute all requests in this queue
-        for http_request, params, callback in self._queue:
-            try:
-                result = self._parse(http_request)
-            except:
-                # Need to do something about exceptions so that a single error
-                # doesn't take the entire queue down, but punt for now. 
-                raise
-            query = {"params": params, "result": result}
-            try:
-                self.results.append(callback(query))                
-            except TypeError:  # no callback
-                self.results.append(query)                
+        if consumer is not None:
+            for pos, result in self._complete(capture):
+                consumer(result)
+            return
+        results = [None] * len(self._queue)
+        for pos, result in self._complete(capture):
+            results[pos] = result
+        self.results.extend(results)
+        return
+
+    def as_completed(self, capture=False):
+        """ Execute all requests in the queue and iterate over the results.
+
+        Each result is yielded as soon as its request is completed, so the
+        results will not necessarily be in the same order as the requests.
+        Errors are handled the same as for execute(). Requests that have not
+        been completed are abandoned if iteration is stopped early.
+
+        """
+        for pos, result in self._complete(capture):
+            yield result
         return
-    
+
     def clear(self):
         """ Clear all requests and results in the queue.
-        
+
         """
         self.results = []
-        self._sockmap = {}
         self._queue = []
         return
-        
-        
-class _HttpRequest(dispatcher):
-    """ A single asynchronous HTTP request.
-
-    """    
-    @staticmethod
-    def _post(path, data):
-        """ Generate a POST request string.
-        
-        """
-        crlf = "\r\n"
-        post = ["POST {0:s} HTTP/1.0".format(path)]
-        post.append("Content-Type: application/x-www-form-urlencoded")
-        post.append("Content-Length: {0:d}".format(len(data)))
-        post.append("")
-        post.append(data)
-        return crlf.join(post)
-        
-    def __init__(self, host, path, data, map):
-        """ Initialize an _HttpRequest object.
-        
+
+    def _complete(self, capture):
+        """ Execute all requests and apply their callbacks.
+
+        This is a generator that yields a (pos, result) tuple for each request
+        as it is completed, where pos is the position of the request in the
+        queue.
+
         """
-        dispatcher.__init__(self, map=map)
-        self.status = None
-        self.content = None
-        self._buffer = StringIO()
-        self._request = self._post(path, data)
-        self.create_socket(AF_INET, SOCK_STREAM)
-        # Connection fails with with a socket.gaierror exception ("nodename nor
-        # servname provided, or not known") for more than 248 open connections;
-        # perhaps the ACIS server fails to respond if there are too many 
-        # connections from one client.
-        self.connect((host, 80))
+        if self.processes is None:
+            replies = ((pos, _query(self._queue[pos], *reply)) for pos, reply
+                       in self._execute())
+        else:
+            replies = self._spawn()
+        for pos, (query, error, attempts) in replies:
+            if error is None:
+                yield pos, query
+            elif capture:
+                params = self._queue[pos][1]
+                yield pos, RequestFailure(params, error, attempts)
+            else:
+                raise error[0], error[1], error[2]
         return
 
-    def _reply(self):
-        """ Parse the reply from the server.
-        
+    def _execute(self):
+        """ Execute all requests in the queue using worker threads.
+
+        This is a generator that yields a (pos, reply) tuple for each request
+        as it is completed, where pos is the position of the request in the
+        queue. The reply is a (result, error, attempts) tuple, and error is 
+        None or the exc_info() tuple for a failed request.
+
         """
-        # The reply should consist of a status line, header lines (ignored)
-        # followed by a blank line, and then the content.
-        status = self._buffer.readline().rstrip().split(" ", 2)
-        code, message = status[1:]
-        self.status = (int(code), message)
-        for header in self._buffer:
-            if not header.rstrip():
-                break
-        self.content = self._buffer.read()
+        tasks = Queue()
+        for task in enumerate(self._queue):
+            tasks.put(task)
+        replies = Queue()
+        in_flight = Semaphore(self.max_in_flight)
+        threads = []
+        start = time()
+        for _ in range(min(self.workers, len(self._queue))):
+            worker = _Worker(tasks, replies, in_flight, self._pool,
+                             self.retry, start)
+            worker.start()
+            threads.append(worker)
+        try:
+            for _ in range(len(self._queue)):
+                reply = replies.get()
+                in_flight.release()
+                yield reply
+        finally:
+            # Abandon any requests that have not been started if iteration is
+            # stopped early. Workers that are waiting for an in-flight slot are
+            # released so they can find the empty task queue and exit.
+            while True:
+                try:
+                    tasks.get_nowait()
+                except Empty:
+                    break
+            for worker in threads:
+                in_flight.release()
+            for worker in threads:
+                worker.join()
         return
 
-    # Implement the dispatcher interface.
-    
-    def writable(self):
-        """ Return True while there are data to send to the server.
-        
+    def _spawn(self):
+        """ Execute all requests in the queue using worker processes.
+
+        This is a generator that yields a (pos, reply) tuple for each request
+        as it is completed, where pos is the position of the request in the
+        queue. The reply is a (query, error, attempts) tuple, where query is
+        the return value of the callback, and error is None or the exc_info()
+        tuple (without a traceback) for a failed request.
+
         """
-        return len(self._request) > 0
-        
-    def handle_write(self):
-        """ Send a chunk of data to the server.
-        
+        if not self._queue:
+            return
+        start = time()
+        tasks = [(pos, task, self.retry, start) for pos, task in
+                 enumerate(self._queue)]
+        pool = Pool(self.processes or None)
+        try:
+            for reply in pool.imap_unordered(_process, tasks):
+                yield reply
+        finally:
+            # Abandon any requests that have not been completed if iteration
+            # is stopped early.
+            pool.terminate()
+            pool.join()
+        return
+
+
+class _Worker(Thread):
+    """ A worker thread for executing queued requests.
+
+    """
+    def __init__(self, tasks, replies, in_flight, pool, retry=None,
+                 start=None):
+        """ Initialize a _Worker object.
+
+        The start parameter is the time that execution of the queue began.
+
         """
-        count = self.send(self._request)
-        self._request = self._request[count:]
+        super(_Worker, self).__init__()
+        self.daemon = True
+        self._tasks = tasks
+        self._replies = replies
+        self._in_flight = in_flight
+        self._pool = pool
+        self._retry = retry
+        self._start = start or time()
         return
-        
-    def readable(self):
-        """ Return True while interested in reading data from the server.
-        
+
+    def run(self):
+        """ Execute requests until the task queue is empty.
+
         """
-        return True  # retrieve all data from the server
-        
-    def handle_read(self):
-        """ Read a chunk of data from the server.
-        
+        while True:
+            self._in_flight.acquire()
+            try:
+                pos, task = self._tasks.get_nowait()
+            except Empty:
+                self._in_flight.release()
+                break
+            url, params, callback, timeout = task
+            wait = time() - self._start
+            call = WebServicesCall(url, timeout)
+            call.pool = self._pool
+            reply = _call(call, params, self._retry)
+            events.emit("request", events.call_type(url), wait=wait, 
+                        attempts=reply[2])
+            self._replies.put((pos, reply))
+        return
+
+
+def _call(call, params, retry=None):
+    """ Execute a call, retrying it if allowed by the retry policy.
+
+    Return a (result, error, attempts) tuple.
+
+    """
+    attempts = 0
+    while True:
+        attempts += 1
+        try:
+            return call(params), None, attempts
+        except Exception as err:
+            error = exc_info()
+            if not retry or not retry.retryable(err, attempts):
+                return None, error, attempts
+        sleep(retry.delay(attempts))
+
+
+def _query(task, result, error, attempts):
+    """ Create the query object for a completed request.
+
+    The callback for the request is applied to the query. Return a (query,
+    error, attempts) tuple.
+
+    """
+    params, callback = task[1:3]
+    query = None
+    if error is None:
+        query = {"params": params, "result": result}
+        try:
+            if callback is not None:
+                query = callback(query)
+        except Exception:
+            error = exc_info()
+            query = None
+    return query, error, attempts
+
+
+def _process(task):
+    """ Execute a request in a worker process.
+
+    Return a (pos, (query, error, attempts)) tuple; see RequestQueue._spawn().
+
+    """
+    pos, task, retry, start = task
+    url, params, callback, timeout = task
+    wait = time() - start
+    call = WebServicesCall(url, timeout)
+    if _process.pool is None:
+        _process.pool = ConnectionPool(maxsize=1)  # one per process
+    call.pool = _process.pool
+    reply = _query(task, *_call(call, params, retry))
+    events.emit("request", events.call_type(url), wait=wait,
+                attempts=reply[2])
+    query, error, attempts = reply
+    if error is not None:
+        # Tracebacks cannot be pickled, and neither can some exceptions.
+        try:
+            value = loads(dumps(error[1], HIGHEST_PROTOCOL))
+        except Exception:
+            message = "{0:s}: {1!s}".format(error[0].__name__, error[1])
+            value = RuntimeError(message)
+        error = type(value), value, None
+    return pos, (query, error, attempts)
+
+_process.pool = None
+
+
+class RetryPolicy(object):
+    """ A policy for retrying requests that fail with a transient error.
+
+    Timeouts, connection errors, and server errors (HTTP 5xx) are retried with
+    an exponential backoff. Invalid requests (RequestError) and invalid 
+    results (ResultError) are never retried because the outcome would not 
+    change.
+
+    """
+    def __init__(self, retries=3, backoff=0.5, factor=2, max_delay=30):
+        """ Initialize a RetryPolicy object.
+
+        The retries parameter is the maximum number of retries for a request.
+        The delay before retry N is backoff * factor**(N - 1) seconds, but not
+        more than max_delay seconds.
+
         """
-        # The chunk size was chosen arbitrarily so there may be room for some
-        # optimization, but any bottleneck is almost certainly going to be on 
-        # the server, not during data transfer.
-        self._buffer.write(self.recv(8192))
+        self.retries = retries
+        self.backoff = backoff
+        self.factor = factor
+        self.max_delay = max_delay
         return
-        
-    def handle_close(self):
-        """ The server has closed the connection, so parse the reply.
-        
+
+    def retryable(self, error, attempts):
+        """ Return True if a request should be retried.
+
+        The error parameter is the exception raised by the last attempt, and
+        attempts is the number of attempts so far.
+
+        """
+        if attempts > self.retries:
+            return False
+        if isinstance(error, HTTPError):
+            return error.code >= 500
+        return isinstance(error, (SocketError, HTTPException))
+
+    def delay(self, attempts):
+        """ Return the delay in seconds before the next attempt.
+
         """
-        self.close()
-        self._buffer.seek(0)
-        self._reply()
+        return min(self.backoff * self.factor**(attempts - 1), self.max_delay)
+
+
+class RequestFailure(object):
+    """ A captured error for a request that failed.
+
+    The params attribute is the params object for the request, error is the
+    exception that was raised, and attempts is the number of times the request
+    was tried. The traceback attribute is the traceback for the exception.
+
+    """
+    def __init__(self, params, error, attempts=1):
+        """ Initialize a RequestFailure object.
+
+        The error parameter is an exc_info() tuple.
+
+        """
+        self.params = params
+        self.error = error[1]
+        self.traceback = error[2]
+        self.attempts = attempts
         return
-        
-    # def handle_error(self):
-    #     # Catch exceptions here so a single error doesn't take the whole queue
-    #     # down. Or something. Not sure how this works yet.        
-    #     pass
-        
 
+    def __repr__(self):
+        """ Return a string representation of this object.
+
+        """
+        return "RequestFailure({0!r})".format(self.error)
@@ -13,8 +13,8 @@ This implementation is based on ACIS Web Services Version 2:
 """
 from __future__ import absolute_import
 
+from ._misc import ElementSchema
 from ._misc import date_params
-from ._misc import make_element
 from ._misc import valid_interval
 from .call import WebServicesCall
 from .error import RequestError
@@ -130,8 +130,8 @@ class _DataRequest(_PlaceTimeRequest):
 
         """
         super(_DataRequest, self).__init__()
-        self._params["elems"] = []
-        self._interval = "dly"
+        self._schema = ElementSchema(interval="dly")
+        self._params["elems"] = self._schema.params()
         return
 
     def interval(self, value):
@@ -140,9 +140,8 @@ class _DataRequest(_PlaceTimeRequest):
         The default interval is daily.
 
         """
-        self._interval = valid_interval(value)
-        for elem in self._params["elems"]:
-            elem["interval"] = self._interval
+        self._schema = self._schema.with_interval(valid_interval(value))
+        self._params["elems"] = self._schema.params()
         return
 
     def add_element(self, ident, **options):
@@ -152,17 +151,16 @@ class _DataRequest(_PlaceTimeRequest):
         var major (vX) specifier.
 
         """
-        elem = make_element(ident)
-        options["interval"] = self._interval
-        elem.update(options)
-        self._params["elems"].append(elem)
+        self._schema = self._schema.add(ident, **options)
+        self._params["elems"] = self._schema.params()
         return
 
     def clear_elements(self):
         """ Clear all elements from this request.
 
         """
-        self._params["elems"] = []
+        self._schema = ElementSchema(interval=self._schema.interval)
+        self._params["elems"] = self._schema.params()
         return
 
 
@@ -176,7 +174,7 @@ class StnMetaRequest(_StnRequest):
         """ Set the elements for this request.
 
         """
-        self._params["elems"] = tuple(map(make_element, idents))
+        self._params["elems"] = ElementSchema(idents).params()
         return
 
 
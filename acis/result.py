@@ -17,23 +17,47 @@ This implementation is based on ACIS Web Services Version 2:
 """
 from __future__ import absolute_import
 
+from bisect import bisect_left
+from bisect import bisect_right
+from collections import Mapping
 from itertools import cycle
 from itertools import product
+from time import time
 
-from ._misc import annotate
+from . import events
 from ._misc import date_span
-from ._misc import make_element
-from .date import date_range
+from ._misc import element_schema
+from .date import _date_tuple
 from .error import ResultError
 
 __all__ = ("StnMetaResult", "StnDataResult", "MultiStnDataResult",
-           "GridDataResult", "AreaMetaResult")
+           "LazyMultiStnDataResult", "GridDataResult", "AreaMetaResult")
+
+
+class _ResultType(type):
+    """ Metaclass for result classes.
+
+    This emits a "construct" event with the time needed to create each result
+    object, including the initialization done by derived classes.
+
+    """
+    def __call__(cls, *args, **kwargs):
+        """ Create a new result object.
+
+        """
+        start = time()
+        result = super(_ResultType, cls).__call__(*args, **kwargs)
+        call_type = cls.__name__.replace("Lazy", "")[:-len("Result")]
+        events.emit("construct", call_type, construct=time() - start)
+        return result
 
 
 class _JsonResult(object):
     """ Abstract base class for all result objects.
 
     """
+    __metaclass__ = _ResultType
+
     def __init__(self, query):
         """ Initialize a _JsonResult object.
 
@@ -57,13 +81,9 @@ class _JsonResult(object):
         except KeyError:  # no error
             pass
 
-        # Define the elems attribute.
-        try:
-            elems = map(make_element, query["params"]["elems"])
-        except KeyError:  # no elems (ok for StnMetaResult)
-            self.elems = tuple()
-        else:
-            self.elems = annotate(elem["alias"] for elem in elems)
+        # Define the elems attribute. The schema for a Request is reused.
+        self._schema = element_schema(params.get("elems", ()))
+        self.elems = self._schema.aliases  # no elems is ok for StnMetaResult
         return
 
 
@@ -175,7 +195,7 @@ class MultiStnDataResult(_DataResult):
 
         """
         super(MultiStnDataResult, self).__init__(query)
-        self._dates = tuple(date_range(*date_span(query["params"])))
+        self._dates = _date_tuple(*date_span(query["params"]))
         for site in query["result"]["data"]:
             try:
                 uid = site["meta"].pop("uid")
@@ -216,6 +236,166 @@ class MultiStnDataResult(_DataResult):
         return
 
 
+class LazyMultiStnDataResult(MultiStnDataResult):
+    """ A MultiStnData result that is processed one site at a time.
+
+    The interface is the same as for MultiStnDataResult, but the data, meta,
+    and smry attributes are read-only mappings instead of dicts, and each site
+    is only processed when it is first accessed. This is much faster for large
+    results when only some of the sites are needed. The sites in the result
+    can also be an iterator, e.g. WebServicesCall.iterdata(), in which case
+    sites are retrieved from the server as they are needed.
+
+    A site with a missing UID will cause a ResultError when it is reached
+    rather than when the object is initialized.
+
+    """
+    def __init__(self, query):
+        """ Initialize a LazyMultiStnDataResult object.
+
+        """
+        _DataResult.__init__(self, query)
+        self._params = query["params"]
+        sites = _LazySites(query["result"]["data"], self._single)
+        self.meta = _SiteView(sites, 0)
+        self.data = _SiteView(sites, 1)
+        self.smry = _SiteView(sites, 2)
+        return
+
+    @property
+    def _dates(self):
+        """ The dates for this result.
+
+        """
+        try:
+            return self.__dates
+        except AttributeError:  # first access
+            self.__dates = _date_tuple(*date_span(self._params))
+        return self.__dates
+
+    def _single(self):
+        """ Return True if this is a single-date result.
+
+        """
+        return len(self._dates) == 1
+
+
+class _LazySites(object):
+    """ Site-at-a-time processing of MultiStnData sites.
+
+    Sites are retrieved from their source (a sequence or iterator) and 
+    indexed by UID as needed. Each site is processed into its (meta, data, 
+    smry) values the first time it is accessed.
+
+    """
+    def __init__(self, sites, single):
+        """ Initialize a _LazySites object.
+
+        The single parameter is a function that returns True if the sites have
+        data for a single date.
+
+        """
+        self._source = iter(sites)
+        self._single = single
+        self._uids = []  # in order of the source
+        self._raw = {}  # unprocessed sites
+        self._sites = {}  # processed sites
+        return
+
+    def __getitem__(self, uid):
+        """ Return the (meta, data, smry) values for a site.
+
+        """
+        try:
+            return self._sites[uid]
+        except KeyError:  # not processed yet
+            pass
+        while uid not in self._raw:
+            if not self._next():
+                raise KeyError(uid)
+        site = self._raw.pop(uid)
+        data = site.get("data", [])
+        if "data" in site and self._single():
+            # For single-date requests MultStnData returns the single record
+            # for each site as a 1D list instead of a 2D list.
+            data = [data]
+        self._sites[uid] = (site["meta"], data, site.get("smry", []))
+        return self._sites[uid]
+
+    def __iter__(self):
+        """ Iterate over the UIDs for all sites.
+
+        """
+        pos = 0
+        while True:
+            while pos < len(self._uids):
+                yield self._uids[pos]
+                pos += 1
+            if not self._next():
+                break
+        return
+
+    def __len__(self):
+        """ Return the number of sites.
+
+        """
+        while self._next():
+            continue
+        return len(self._uids)
+
+    def _next(self):
+        """ Retrieve the next site from the source.
+
+        Return False if there are no more sites.
+
+        """
+        try:
+            site = next(self._source)
+        except StopIteration:
+            return False
+        try:
+            uid = site["meta"].pop("uid")
+        except KeyError:
+            raise ResultError("metadata does not contain uid")
+        self._uids.append(uid)
+        self._raw[uid] = site
+        return True
+
+
+class _SiteView(Mapping):
+    """ A read-only mapping of UIDs to one of the values for each site.
+
+    """
+    def __init__(self, sites, field):
+        """ Initialize a _SiteView object.
+
+        The field parameter is the index of the (meta, data, smry) values to
+        use for this view.
+
+        """
+        self._sites = sites
+        self._field = field
+        return
+
+    def __getitem__(self, uid):
+        """ Return the value for a site.
+
+        """
+        return self._sites[uid][self._field]
+
+    def __iter__(self):
+        """ Iterate over all UIDs.
+
+        """
+        return iter(self._sites)
+
+    def __len__(self):
+        """ Return the number of sites.
+
+        """
+        return len(self._sites)
+
+
 class GridDataResult(_JsonResult):
     """ A result from a GridData call.
 
@@ -224,6 +404,9 @@ class GridDataResult(_JsonResult):
     arrays). In cases where a raster is desired use "bbox" instead to retrieve
     1x1 arrays:
         loc(lon, lat) => bbox(lon, lat, lon, lat) 
+
+    The array(), select(), and to_records() methods require the numpy library:
+        <http://numpy.scipy.org/>
     
     """
     def __init__(self, query):
@@ -243,6 +426,8 @@ class GridDataResult(_JsonResult):
                 self.shape = (len(elem), len(elem[0]))
             except TypeError:  # elem is a scalar
                 self.shape = (1, 1)
+        self.dates = [day[0] for day in self.data]
+        self._arrays = {}
         return
 
     def __len__(self):
@@ -272,6 +457,91 @@ class GridDataResult(_JsonResult):
             yield [(j, i), date] + elems
         return
 
+    def array(self, alias, dtype="float32"):
+        """ Return the data for an element as a numpy array.
+
+        The array is a contiguous (time, ny, nx) raster of all the values for
+        the element, where the time index corresponds to the dates attribute.
+        The array is only created the first time it is requested for each
+        element and dtype.
+
+        """
+        import numpy  # optional dependency
+        key = (alias, numpy.dtype(dtype))
+        try:
+            return self._arrays[key]
+        except KeyError:  # first access
+            pass
+        pos = self._schema.position(alias) + 1  # KeyError for unknown alias
+        array = numpy.array([day[pos] for day in self.data], dtype=dtype)
+        self._arrays[key] = array.reshape((len(self.data),) + self.shape)
+        return self._arrays[key]
+
+    def select(self, alias, sdate=None, edate=None, bbox=None, 
+               dtype="float32"):
+        """ Return the data for an element within a date range and bbox.
+
+        The returned array is a view of the array() data, so no data are 
+        copied. The date range (inclusive) is in the same format as the dates
+        attribute, and by default it is the entire result. The optional bbox
+        is a (west, south, east, north) sequence. The grid coordinates are 
+        taken from the "ll" metadata, which must be part of the result to use 
+        a bbox.
+
+        """
+        array = self.array(alias, dtype)
+        start = bisect_left(self.dates, sdate) if sdate else 0
+        stop = bisect_right(self.dates, edate) if edate else len(self.dates)
+        if bbox is None:
+            return array[start:stop]
+        west, south, east, north = bbox
+        try:
+            lat = [row[0] for row in self.meta["lat"]]
+            lon = self.meta["lon"][0]
+        except (KeyError, TypeError):  # no "ll" or a single point
+            raise ValueError("bbox requires grid lat/lon metadata")
+        rows = self._index_range(lat, south, north)
+        cols = self._index_range(lon, west, east)
+        return array[start:stop, rows, cols]
+
+    def to_records(self, dtype="float32"):
+        """ Return all data records as a numpy record array.
+
+        The records are in the same order as for __iter__(), but the position
+        of each record is split into integer "row" and "col" fields, and each
+        element is a field named by its alias. The array is created without
+        any Python operations for individual records.
+
+        """
+        import numpy  # optional dependency
+        ny, nx = self.shape
+        ndays = len(self.data)
+        fields = [("row", int), ("col", int), ("date", "S10")]
+        fields.extend((str(alias), dtype) for alias in self.elems)
+        records = numpy.empty(ndays * ny * nx, dtype=fields)
+        rows, cols = numpy.indices(self.shape)
+        records["row"] = numpy.tile(rows.ravel(), ndays)
+        records["col"] = numpy.tile(cols.ravel(), ndays)
+        records["date"] = numpy.repeat(self.dates, ny * nx)
+        for alias in self.elems:
+            records[str(alias)] = self.array(alias, dtype).ravel()
+        return records.view(numpy.recarray)
+
+    @staticmethod
+    def _index_range(coords, lower, upper):
+        """ Return a slice for the grid coordinates between two values.
+
+        The coordinates can be in ascending or descending order.
+
+        """
+        if coords[0] <= coords[-1]:
+            return slice(bisect_left(coords, lower), 
+                         bisect_right(coords, upper))
+        coords = coords[::-1]
+        size = len(coords)
+        start = size - bisect_right(coords, upper)
+        return slice(start, size - bisect_left(coords, lower))
+
 
 class AreaMetaResult(_JsonResult):
     """ A result from a General area metdata call.
@@ -5,7 +5,8 @@ accessing the result. CSV calls are very restricted compared to JSON calls, but
 the output can be streamed one record at a time rather than as a single JSON
 object; this can be useful for large data requests. Metadata is stored as dict
 keyed to a site identifer. Data records are streamed using the iterator
-interface. The elems attribute is a tuple of element aliases for this stream.
+interface or in lists of records using batches(). The elems attribute is a
+tuple of element aliases for this stream.
 
 This implementation is based on ACIS Web Services Version 2:
     <http://data.rcc-acis.org/doc/>.
@@ -14,11 +15,14 @@ This implementation is based on ACIS Web Services Version 2:
 from __future__ import absolute_import
 
 from contextlib import closing
+from csv import reader
 from itertools import chain
+from itertools import islice
+from time import time
 
-from ._misc import annotate
+from . import events
+from ._misc import ElementSchema
 from ._misc import date_params
-from ._misc import make_element
 from ._misc import valid_interval
 from .call import WebServicesCall
 from .error import RequestError
@@ -41,8 +45,9 @@ class _CsvStream(object):
 
         """
         self.meta = {}
-        self._params = {"output": "csv", "elems": []}
-        self._interval = "dly"
+        self._schema = ElementSchema(interval="dly")
+        self._params = {"output": "csv", "elems": self._schema.params()}
+        self._typed = None  # (missing, trace) values for typed conversion
         return
 
     @property
@@ -55,7 +60,7 @@ class _CsvStream(object):
         number, e.g. maxt_0, maxt_1, etc. 
 
         """
-        return annotate(elem["alias"] for elem in self._params["elems"])
+        return self._schema.aliases
 
     def interval(self, value):
         """ Set the interval for this stream.
@@ -63,23 +68,36 @@ class _CsvStream(object):
         The default interval is daily ("dly").
         
         """
-        self._interval = valid_interval(value)
+        self._schema = self._schema.with_interval(valid_interval(value))
+        self._params["elems"] = self._schema.params()
+        return
+
+    def typed(self, enabled=True, missing=None, trace=0.):
+        """ Convert data values to floats.
+
+        Missing values ("M") are replaced by the missing value, and trace
+        values ("T") are replaced by the trace value. Values that cannot be
+        converted, e.g. values with a flag, are left as strings. If enabled is
+        False, values are returned as strings (the default).
+
+        """
+        self._typed = (missing, trace) if enabled else None
         return
 
     def add_element(self, ident, **options):
         """ Add an element to this stream.
 
         """
-        elem = make_element(ident)
-        elem.update(options)
-        self._params["elems"].append(elem)
+        self._schema = self._schema.add(ident, **options)
+        self._params["elems"] = self._schema.params()
         return
 
     def clear_elements(self):
         """ Clear all elements from this stream.
 
         """
-        self._params["elems"] = []
+        self._schema = ElementSchema(interval=self._schema.interval)
+        self._params["elems"] = self._schema.params()
         return
         
     def __iter__(self):
@@ -87,11 +105,38 @@ class _CsvStream(object):
 
         """
         first_line, stream = self._connect()
-        with closing(stream):
-            line_iter = chain([first_line], stream)
-            self._header(line_iter)
-            for line in line_iter:
-                yield self._record(line.rstrip())
+        parse = 0.
+        records = 0
+        try:
+            with closing(stream):
+                line_iter = chain([first_line], stream)
+                self._header(line_iter)
+                for row in reader(line_iter):
+                    if not row:  # blank line
+                        continue
+                    start = time()
+                    record = self._record(row)
+                    parse += time() - start
+                    records += 1
+                    yield record
+        finally:
+            call_type = events.call_type(self._call.url)
+            events.emit("stream", call_type, parse=parse, records=records)
+        return
+
+    def batches(self, size=1000):
+        """ Stream lists of records from the server.
+
+        Each list contains the given number of records except for the last
+        one, which may be shorter.
+
+        """
+        records = iter(self)
+        while True:
+            batch = list(islice(records, size))
+            if not batch:
+                break
+            yield batch
         return
 
     def _connect(self):
@@ -101,12 +146,14 @@ class _CsvStream(object):
         line and the stream object.
 
         """
-        for elem in self._params['elems']:
-            elem['interval'] = self._interval
         stream = self._call(self._params)
-        first_line = stream.readline().rstrip()
-        if first_line.startswith("error"):  # "error: error message"
-            raise RequestError(first_line.split(":")[1].lstrip())
+        try:
+            first_line = stream.readline().rstrip()
+            if first_line.startswith("error"):  # "error: error message"
+                raise RequestError(first_line.split(":")[1].lstrip())
+        except:
+            stream.close()  # release the connection
+            raise
         return first_line, stream
 
     def _header(self, line_iter):
@@ -118,15 +165,39 @@ class _CsvStream(object):
         """
         return  # no header
 
-    def _record(self, line):
-        """ Process a line of data from the server.
+    def _record(self, row):
+        """ Process a row of data from the server.
 
         Each derived class must implement this to return a record of the form
-        (sid, date, elem1, ...).
+        (sid, date, elem1, ...). The row is a list of strings that can be
+        reused for the record.
 
         """
         raise NotImplementedError
 
+    def _convert(self, record, start):
+        """ Convert the data values of a record in place.
+
+        Values at the start position and beyond are converted if typed() is
+        enabled.
+
+        """
+        if self._typed is None:
+            return
+        missing, trace = self._typed
+        for pos in range(start, len(record)):
+            value = record[pos]
+            if value == "M":
+                record[pos] = missing
+            elif value == "T":
+                record[pos] = trace
+            else:
+                try:
+                    record[pos] = float(value)
+                except ValueError:  # flagged value
+                    pass
+        return
+
 
 class StnDataStream(_CsvStream):
     """ A StnData stream.
@@ -172,11 +243,13 @@ class StnDataStream(_CsvStream):
         self.meta[self._sid] = {"name": line_iter.next()}
         return
 
-    def _record(self, line):
-        """ Process a line of data from the server.
+    def _record(self, row):
+        """ Process a row of data from the server.
 
         """
-        return [self._sid] + line.split(",")
+        row.insert(0, self._sid)
+        self._convert(row, 2)
+        return row
 
 
 class MultiStnDataStream(_CsvStream):
@@ -204,8 +277,8 @@ class MultiStnDataStream(_CsvStream):
         self._params.update(options)
         return
 
-    def _record(self, line):
-        """ Process a line of data from the server.
+    def _record(self, row):
+        """ Process a row of data from the server.
 
         The meta attribute will not be fully populated until every line has
         been receieved.
@@ -213,9 +286,8 @@ class MultiStnDataStream(_CsvStream):
         """
         # The metadata for each site--name, state, lat/lon, and elevation--is
         # part of its data record.
-        record = line.split(",")
         try:
-            sid, name, state, lon, lat, elev = record[:6]
+            sid, name, state, lon, lat, elev = row[:6]
         except ValueError:  # blank line at end of output?
             raise StopIteration
         self.meta[sid] = {"name": name, "state": state}
@@ -227,4 +299,6 @@ class MultiStnDataStream(_CsvStream):
             self.meta[sid]["ll"] = [float(lon), float(lat)]
         except ValueError:  # lat/lon is blank
             pass
-        return [sid, self._params["date"]] + record[6:]
+        row[1:6] = [self._params["date"]]
+        self._convert(row, 2)
+        return row
@@ -3,7 +3,8 @@
 This module contains various functions that can be useful for processing ACIS
 data.
 
-The array_result function (optional) requires the numpy library: 
+The result_array and result_columns functions require the numpy library, which
+is imported the first time it is needed:
     <http://numpy.scipy.org/>
 
 This implementation is based on ACIS Web Services Version 2:
@@ -12,9 +13,11 @@ This implementation is based on ACIS Web Services Version 2:
 """
 from __future__ import absolute_import
 
+from re import MULTILINE
 from re import compile
 
-__all__ = ("decode_sids", "result_array")
+__all__ = ("decode_sids", "index_sids", "result_array", "result_columns",
+           "ColumnarResult")
 
 
 def decode_sids(sids):
@@ -27,34 +30,207 @@ def decode_sids(sids):
     """
     table = {}
     for sid in sids:
-        try:
-            ident, ntype = sid.split()
-            ntype = int(ntype)
-        except ValueError:  # not enough items in split or int() failed
+        match = decode_sids._regex.match(sid)
+        if match is None:
             raise ValueError("invalid SID: {0:s}".format(sid))
-        network = decode_sids._networks.get(ntype, ntype)
-        table.setdefault(network, list()).append(ident)
+        ident, ntype = match.groups()
+        table.setdefault(_network(ntype), list()).append(ident)
     return table
 
-decode_sids._regex = compile(r"^([^ ]*) (\d+)$")
+decode_sids._regex = compile(r"[ \t]*(\S+)[ \t]+(\d+)[ \t]*\Z")
+decode_sids._lines = compile(r"^[ \t]*(\S+)[ \t]+(\d+)[ \t]*$", MULTILINE)
 decode_sids._networks = {
      1: "WBAN",      2: "COOP",      3: "FAA",       4: "WMO", 
      5: "ICAO",      6: "GHCN",      7: "NWSLI",     8: "RCC",  
      9: "ThreadEx", 10: "CoCoRaHS", 16: "AWDN",     29: "SNOTEL"}
 
 
-try:
-    import numpy
-except ImportError:
-    pass
-else:
-    # Define function if numpy is available.
-    def result_array(result):
-        """ Convert a data result to a numpy record array.
-    
+def index_sids(meta):
+    """ Decode the SIDs for every site in a StnMeta result.
+
+    The meta parameter is the meta attribute of a StnMetaResult (a dict keyed
+    by uid), or the "meta" list of a StnMeta call where each site includes its
+    uid. Return a (sites, index) tuple. The sites dict contains the 
+    decode_sids() table for each uid, and the index dict maps each (network, 
+    ID) pair to a uid, e.g. index[("WBAN", "13967")]. If an ID belongs to more
+    than one site the first site is used. All SIDs are decoded in a single 
+    pass, and each network name is a single shared object.
+
+    """
+    try:
+        items = meta.iteritems()
+    except AttributeError:  # list of sites
+        items = ((site["uid"], site) for site in meta)
+    uids = []
+    counts = []
+    sids = []
+    for uid, site in items:
+        site_sids = site.get("sids", ())
+        uids.append(uid)
+        counts.append(len(site_sids))
+        sids.extend(site_sids)
+    text = "\n".join(sids)
+    pairs = decode_sids._lines.findall(text)
+    if len(pairs) != len(sids) or text.count("\n") != len(sids) - 1:
+        # Every SID must be exactly one matching line.
+        decode_sids(sids)  # raise an error for the first invalid SID
+    networks = {}  # network for each type code string
+    sites = {}
+    index = {}
+    pos = 0
+    for uid, count in zip(uids, counts):
+        table = sites[uid] = {}
+        for ident, ntype in pairs[pos:pos+count]:
+            try:
+                network = networks[ntype]
+            except KeyError:  # first occurrence
+                network = networks[ntype] = _network(ntype)
+            table.setdefault(network, []).append(ident)
+            index.setdefault((network, ident), uid)
+        pos += count
+    return sites, index
+
+
+def _network(ntype):
+    """ Return the network name for a type code string.
+
+    The integer code is returned for an unknown network.
+
+    """
+    ntype = int(ntype)
+    return decode_sids._networks.get(ntype, ntype)
+
+
+def result_array(result):
+    """ Convert a data result to a numpy record array.
+
+    """
+    import numpy  # optional dependency
+    # Element names are converted to plain strings because numpy does
+    # not play well with Unicode.
+    elems = [(str(elem), object) for elem in result.elems]
+    dtype = [("uid", int), ("date", str, 10)] + elems
+    return numpy.array([tuple(record) for record in result], dtype)
+
+
+def result_columns(result, dtype="float32", trace=0.):
+    """ Convert a station data result to a ColumnarResult.
+
+    The result parameter is a StnDataResult or MultiStnDataResult. Values
+    are converted to dtype, and trace values are replaced with trace.
+
+    """
+    return ColumnarResult(result, dtype, trace)
+
+
+class ColumnarResult(object):
+    """ A columnar numpy representation of a station data result.
+
+    Records are stored site by site in chronological order. The uids and 
+    offsets attributes are arrays where the records for uids[i] are in the
+    range offsets[i]:offsets[i+1] of every column (see the site() method),
+    and the dates attribute is an array of the date for each record.
+
+    The values, flags, and mask attributes are dicts keyed by element 
+    alias. Each values array contains the numeric value of the element 
+    for every record, each flags array contains the ACIS flag for that 
+    value ("A" for accumulated, "S" for a subsequent accumulation, "T" for
+    trace, "M" for missing, or "" for none), and each mask array is True
+    where the value is missing. Missing values are NaN. For elements with
+    additional options (e.g. [value, flag, time]) the flag field, if there is
+    one, takes precedence over a flag appended to the value, and the other
+    fields are ignored.
+
+    """
+    _flags = "ASTM"
+
+    def __init__(self, result, dtype="float32", trace=0.):
+        """ Initialize a ColumnarResult object.
+
+        """
+        import numpy  # optional dependency
+        self.elems = result.elems
+        layouts = result._schema.layouts
+        uids = []
+        dates = []
+        columns = [[] for elem in self.elems]
+        counts = []
+        for uid, records in result.data.iteritems():
+            uids.append(uid)
+            counts.append(len(records))
+            if not records:
+                continue
+            site_columns = zip(*records)  # transpose records to columns
+            if len(site_columns) > len(self.elems):  # StnData has dates
+                dates.extend(site_columns[0])
+                site_columns = site_columns[1:]
+            else:  # MultiStnData dates are implicit
+                dates.extend(result._dates[:len(records)])
+            for column, site_column in zip(columns, site_columns):
+                column.extend(site_column)
+        self.uids = numpy.array(uids, dtype=int)
+        self.offsets = numpy.zeros(len(uids) + 1, dtype=int)
+        numpy.cumsum(counts, out=self.offsets[1:])
+        self.dates = numpy.array(dates, dtype="S10")
+        self.values = {}
+        self.flags = {}
+        self.mask = {}
+        for alias, layout, column in zip(self.elems, layouts, columns):
+            values, flags, mask = self._parse(column, dtype, trace, layout)
+            self.values[alias] = values
+            self.flags[alias] = flags
+            self.mask[alias] = mask
+        self._index = dict((uid, pos) for pos, uid in enumerate(uids))
+        return
+
+    def __len__(self):
+        """ Return the number of records.
+
+        """
+        return len(self.dates)
+
+    def site(self, uid):
+        """ Return a slice object for the records of a site.
+
+        """
+        pos = self._index[uid]
+        return slice(self.offsets[pos], self.offsets[pos+1])
+
+    def masked(self, alias):
+        """ Return the values of an element as a masked array.
+
+        """
+        import numpy  # optional dependency
+        return numpy.ma.array(self.values[alias], mask=self.mask[alias])
+
+    @classmethod
+    def _parse(cls, column, dtype, trace, layout=("value",)):
+        """ Parse a column of ACIS values.
+
+        The layout is the sequence of fields for each value (see the
+        ElementSchema layouts attribute). Return the (values, flags, mask)
+        arrays for the column.
+
         """
-        # Element names are converted to plain strings because numpy does
-        # not play well with Unicode.
-        elems = [(str(elem), object) for elem in result.elems]
-        dtype = [("uid", int), ("date", str, 10)] + elems
-        return numpy.array([tuple(record) for record in result], dtype)
+        import numpy  # optional dependency
+        fields = None
+        if column and isinstance(column[0], list):  # [value, flag, ...]
+            if "flag" in layout:
+                pos = layout.index("flag")
+                fields = [item[pos] for item in column]
+            column = [item[0] for item in column]
+        text = numpy.asarray(column)
+        if text.dtype.kind not in "SU":  # numeric values
+            text = text.astype(str)
+        text = numpy.char.strip(text)
+        flags = numpy.zeros(len(text), dtype="S1")
+        for flag in cls._flags:
+            flags[numpy.char.endswith(text, flag)] = flag
+        if fields is not None:  # explicit flags take precedence
+            fields = numpy.char.strip(numpy.asarray(fields, dtype=str))
+            flags = numpy.where(fields == "", flags, fields).astype("S1")
+        text = numpy.char.rstrip(text, cls._flags)
+        values = numpy.where(text == "", "nan", text).astype(dtype)
+        values[flags == "M"] = numpy.nan
+        values[flags == "T"] = trace
+        return values, flags, numpy.isnan(values)
@@ -0,0 +1,242 @@
+""" A local HTTP server that replies with synthetic ACIS results.
+
+"""
+from BaseHTTPServer import BaseHTTPRequestHandler
+from BaseHTTPServer import HTTPServer
+from SocketServer import ThreadingMixIn
+from datetime import date
+from datetime import timedelta
+from json import dumps
+from json import loads
+from random import Random
+from threading import Thread
+from urlparse import parse_qs
+from zlib import DEFLATED
+from zlib import MAX_WBITS
+from zlib import compressobj
+
+
+class SyntheticServer(object):
+    """ A local server for synthetic ACIS results.
+
+    The size of each result is determined by the number of sites, the number
+    of days, and the (ny, nx) grid shape. Each result is only generated once,
+    so it does not contribute to the time measured by a benchmark. If gzip is
+    True, results are compressed for clients that accept it.
+
+    """
+    sdate = "2000-01-01"
+    elems = ("maxt", "mint", "pcpn")
+
+    def __init__(self, sites=100, days=365, grid=(50, 50), gzip=False):
+        """ Initialize a SyntheticServer object.
+
+        """
+        self.sites = sites
+        self.days = days
+        self.grid = grid
+        self.gzip = gzip
+        self._random = Random(0)  # deterministic results
+        start = date(*map(int, self.sdate.split("-")))
+        self.dates = [str(start + timedelta(days=day)) for day in
+                      range(days)]
+        self._replies = {}
+        for call_type, output in (("StnMeta", "json"), ("StnData", "json"),
+                                  ("MultiStnData", "json"),
+                                  ("GridData", "json"), ("General", "json"),
+                                  ("StnData", "csv"),
+                                  ("MultiStnData", "csv")):
+            content = getattr(self, "_" + call_type.lower())(output)
+            if output == "json":
+                content = dumps(content, separators=(",", ":"))
+            encoded = content
+            if gzip:
+                encoder = compressobj(6, DEFLATED, 16 + MAX_WBITS)
+                encoded = encoder.compress(content) + encoder.flush()
+            self._replies[(call_type, output)] = content, encoded
+        self._server = _ThreadingServer(("127.0.0.1", 0), _Handler)
+        self._server.synthetic = self
+        self._thread = None
+        return
+
+    @property
+    def url(self):
+        """ The base URL for this server.
+
+        """
+        return "http://127.0.0.1:{0:d}/".format(self._server.server_port)
+
+    def size(self, call_type, output="json"):
+        """ Return the uncompressed size of a result.
+
+        """
+        return len(self._replies[(call_type, output)][0])
+
+    def start(self):
+        """ Start serving requests in a background thread.
+
+        """
+        self._thread = Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return
+
+    def stop(self):
+        """ Stop the server.
+
+        """
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        return
+
+    def reply(self, call_type, params, gzip=False):
+        """ Return the reply content for a request.
+
+        """
+        output = params.get("output", "json").lower()
+        content, encoded = self._replies[(call_type, output)]
+        return encoded if gzip else content
+
+    def _value(self, elem):
+        """ Return a random data value.
+
+        """
+        if self._random.random() < 0.05:
+            return "M"
+        if elem == "pcpn":
+            value = self._random.random()
+            if value < 0.6:
+                return "0.00"
+            if value < 0.7:
+                return "T"
+            return "{0:.2f}".format(self._random.expovariate(3))
+        base = 70 if elem == "maxt" else 45
+        return str(int(self._random.gauss(base, 15)))
+
+    def _meta(self, uid):
+        """ Return the metadata for a site.
+
+        """
+        lon = -105 + 10 * self._random.random()
+        lat = 30 + 10 * self._random.random()
+        return {
+            "uid": uid,
+            "name": "SITE {0:d}".format(uid),
+            "sids": ["{0:05d} 2".format(uid), "K{0:03d} 3".format(uid % 1000)],
+            "state": "OK",
+            "ll": [round(lon, 4), round(lat, 4)],
+            "elev": round(1000 + 500 * self._random.random(), 1)}
+
+    def _stnmeta(self, output):
+        """ Return a StnMeta result.
+
+        """
+        return {"meta": [self._meta(uid) for uid in range(self.sites)]}
+
+    def _stndata(self, output):
+        """ Return a StnData result.
+
+        """
+        data = [[day] + [self._value(elem) for elem in self.elems] for day in
+                self.dates]
+        if output == "csv":
+            lines = ["SITE 0"]
+            lines.extend(",".join(record) for record in data)
+            return "\n".join(lines) + "\n"
+        return {"meta": self._meta(0), "data": data}
+
+    def _multistndata(self, output):
+        """ Return a MultiStnData result.
+
+        """
+        if output == "csv":
+            # MultiStnData CSV output is for a single date.
+            lines = []
+            for uid in range(self.sites):
+                meta = self._meta(uid)
+                record = [meta["sids"][0].split()[0], meta["name"],
+                          meta["state"]]
+                record.extend(map(str, meta["ll"] + [meta["elev"]]))
+                record.extend(self._value(elem) for elem in self.elems)
+                lines.append(",".join(record))
+            return "\n".join(lines) + "\n"
+        sites = []
+        for uid in range(self.sites):
+            data = [[self._value(elem) for elem in self.elems] for day in
+                    self.dates]
+            sites.append({"meta": self._meta(uid), "data": data})
+        return {"data": sites}
+
+    def _griddata(self, output):
+        """ Return a GridData result.
+
+        """
+        ny, nx = self.grid
+        lats = [30 + 0.04 * j for j in range(ny)]
+        lons = [-105 + 0.04 * i for i in range(nx)]
+        meta = {"lat": [[lat] * nx for lat in lats],
+                "lon": [lons for lat in lats]}
+        data = []
+        for day in self.dates:
+            record = [day]
+            for elem in self.elems:
+                record.append([[round(self._random.gauss(50, 15), 1) for i in
+                                range(nx)] for j in range(ny)])
+            data.append(record)
+        return {"meta": meta, "data": data}
+
+    def _general(self, output):
+        """ Return a General (area metadata) result.
+
+        """
+        meta = [{"id": "{0:05d}".format(fips), "name": "COUNTY {0:d}".format(
+                fips)} for fips in range(self.sites)]
+        return {"meta": meta}
+
+
+class _ThreadingServer(ThreadingMixIn, HTTPServer):
+    """ A multithreaded HTTP server.
+
+    """
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        """ Ignore errors for clients that disconnect early.
+
+        """
+        return
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """ Handle requests for a SyntheticServer.
+
+    """
+    protocol_version = "HTTP/1.1"  # keep-alive
+    wbufsize = -1  # send headers and content together
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        """ Handle a POST request.
+
+        """
+        size = int(self.headers.getheader("Content-Length", 0))
+        query = parse_qs(self.rfile.read(size))
+        params = loads(query["params"][0])
+        call_type = self.path.rstrip("/").rsplit("/", 1)[-1]
+        accept = self.headers.getheader("Accept-Encoding", "")
+        gzip = self.server.synthetic.gzip and "gzip" in accept
+        content = self.server.synthetic.reply(call_type, params, gzip)
+        self.send_response(200)
+        if gzip:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+        return
+
+    def log_message(self, format, *args):
+        """ Suppress logging.
+
+        """
+        return
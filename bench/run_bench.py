@@ -0,0 +1,431 @@
+""" Master benchmark script.
+
+All benchmarks are executed against a local SyntheticServer, so no network
+connection is required. Each benchmark is executed in a new Python process so
+that its peak memory use (resident set size) can be measured independently.
+Results are written as JSON so that different commits can be compared.
+
+"""
+import _path
+
+from datetime import date
+from datetime import timedelta
+from json import dump
+from json import dumps
+from json import load
+from json import loads
+from optparse import OptionParser
+from optparse import SUPPRESS_HELP
+from os.path import abspath
+from os.path import dirname
+from platform import python_version
+from subprocess import PIPE
+from subprocess import Popen
+from sys import executable
+from sys import exit
+from sys import stdout
+from time import time
+
+from _server import SyntheticServer
+
+
+# Benchmark functions. Each function executes one iteration of its benchmark
+# and returns the number of records that were processed.
+
+def _request(request, url, call_type, args):
+    """ Initialize a request for a benchmark.
+
+    """
+    from acis import WebServicesCall
+    request._call = WebServicesCall(url + call_type)
+    return request
+
+
+def _data_request(request, url, call_type, args):
+    """ Initialize a data request for a benchmark.
+
+    """
+    request = _request(request, url, call_type, args)
+    if call_type != "MultiStnData":
+        request.location(sid="okc")
+    else:
+        request.location(state="ok")
+    if call_type == "GridData":
+        request.grid(1)
+    request.dates(SyntheticServer.sdate, args.edate)
+    for elem in SyntheticServer.elems:
+        request.add_element(elem)
+    return request
+
+
+def call_stndata(url, args):
+    """ Benchmark a StnData WebServicesCall.
+
+    """
+    from acis import WebServicesCall
+    call = WebServicesCall(url + "StnData")
+    return len(call({"sid": "okc", "elems": "maxt,mint,pcpn"})["data"])
+
+
+def call_multistndata(url, args):
+    """ Benchmark a MultiStnData WebServicesCall.
+
+    """
+    from acis import WebServicesCall
+    call = WebServicesCall(url + "MultiStnData")
+    result = call({"state": "ok", "elems": "maxt,mint,pcpn"})
+    return sum(len(site["data"]) for site in result["data"])
+
+
+def call_griddata(url, args):
+    """ Benchmark a GridData WebServicesCall.
+
+    """
+    from acis import WebServicesCall
+    call = WebServicesCall(url + "GridData")
+    result = call({"state": "ok", "grid": 1, "elems": "maxt,mint,pcpn"})
+    return len(result["data"])
+
+
+def iterdata_multistndata(url, args):
+    """ Benchmark WebServicesCall.iterdata() for a MultiStnData call.
+
+    """
+    from acis import WebServicesCall
+    call = WebServicesCall(url + "MultiStnData")
+    params = {"state": "ok", "elems": "maxt,mint,pcpn"}
+    return sum(len(site["data"]) for site in call.iterdata(params))
+
+
+def queue_stndata(url, args):
+    """ Benchmark a RequestQueue of StnData requests, one for each site.
+
+    """
+    from acis import StnDataRequest
+    from acis.queue import RequestQueue
+    request = _data_request(StnDataRequest(), url, "StnData", args)
+    queue = RequestQueue()
+    for _ in range(args.sites):
+        queue.add(request)
+    queue.execute()
+    return sum(len(query["result"]["data"]) for query in queue.results)
+
+
+def stream_stndata(url, args):
+    """ Benchmark a StnDataStream.
+
+    """
+    from acis import StnDataStream
+    stream = _data_request(StnDataStream(), url, "StnData", args)
+    return sum(1 for record in stream)
+
+
+def stream_multistndata(url, args):
+    """ Benchmark a MultiStnDataStream.
+
+    """
+    from acis import MultiStnDataStream
+    stream = _request(MultiStnDataStream(), url, "MultiStnData", args)
+    stream.location(state="ok")
+    stream.date(SyntheticServer.sdate)
+    for elem in SyntheticServer.elems:
+        stream.add_element(elem)
+    return sum(1 for record in stream)
+
+
+def result_stnmeta(url, args):
+    """ Benchmark a StnMetaResult.
+
+    """
+    from acis import StnMetaRequest
+    from acis import StnMetaResult
+    request = _request(StnMetaRequest(), url, "StnMeta", args)
+    request.location(state="ok")
+    return len(StnMetaResult(request.submit()).meta)
+
+
+def result_stndata(url, args):
+    """ Benchmark a StnDataResult.
+
+    """
+    from acis import StnDataRequest
+    from acis import StnDataResult
+    request = _data_request(StnDataRequest(), url, "StnData", args)
+    return sum(1 for record in StnDataResult(request.submit()))
+
+
+def result_multistndata(url, args):
+    """ Benchmark a MultiStnDataResult.
+
+    """
+    from acis import MultiStnDataRequest
+    from acis import MultiStnDataResult
+    request = _data_request(MultiStnDataRequest(), url, "MultiStnData", args)
+    return sum(1 for record in MultiStnDataResult(request.submit()))
+
+
+def result_lazymultistndata(url, args):
+    """ Benchmark a LazyMultiStnDataResult.
+
+    """
+    from acis import MultiStnDataRequest
+    from acis import LazyMultiStnDataResult
+    request = _data_request(MultiStnDataRequest(), url, "MultiStnData", args)
+    return sum(1 for record in LazyMultiStnDataResult(request.submit()))
+
+
+def result_griddata(url, args):
+    """ Benchmark a GridDataResult.
+
+    """
+    from acis import GridDataRequest
+    from acis import GridDataResult
+    request = _data_request(GridDataRequest(), url, "GridData", args)
+    return sum(1 for record in GridDataResult(request.submit()))
+
+
+def result_areameta(url, args):
+    """ Benchmark an AreaMetaResult.
+
+    """
+    from acis import AreaMetaRequest
+    from acis import AreaMetaResult
+    request = _request(AreaMetaRequest("county"), url, "General", args)
+    request.location(state="ok")
+    return len(AreaMetaResult(request.submit()).meta)
+
+
+def result_array(url, args):
+    """ Benchmark the result_array() function for a MultiStnDataResult.
+
+    """
+    from acis import MultiStnDataRequest
+    from acis import MultiStnDataResult
+    from acis import result_array  # requires numpy
+    request = _data_request(MultiStnDataRequest(), url, "MultiStnData", args)
+    return len(result_array(MultiStnDataResult(request.submit())))
+
+
+def result_columns(url, args):
+    """ Benchmark the result_columns() function for a MultiStnDataResult.
+
+    """
+    from acis import MultiStnDataRequest
+    from acis import MultiStnDataResult
+    from acis import result_columns  # requires numpy
+    request = _data_request(MultiStnDataRequest(), url, "MultiStnData", args)
+    return len(result_columns(MultiStnDataResult(request.submit())).dates)
+
+
+def import_acis(url, args):
+    """ Benchmark importing the package in a new interpreter.
+
+    """
+    import acis
+    return 1
+
+
+def import_acis_all(url, args):
+    """ Benchmark importing the package and all optional modules.
+
+    """
+    import acis
+    import acis.batch
+    import acis.index
+    import acis.queue
+    import acis.result
+    import acis.util
+    import dateutil.relativedelta
+    try:
+        import numpy
+    except ImportError:  # not installed
+        pass
+    return 1
+
+
+# The benchmarks to run, and the call type and output for each one. Import
+# benchmarks are executed in a new process for every iteration.
+
+_BENCHMARKS = (
+    (import_acis, None, None),
+    (import_acis_all, None, None),
+    (call_stndata, "StnData", "json"),
+    (call_multistndata, "MultiStnData", "json"),
+    (call_griddata, "GridData", "json"),
+    (iterdata_multistndata, "MultiStnData", "json"),
+    (queue_stndata, "StnData", "json"),
+    (stream_stndata, "StnData", "csv"),
+    (stream_multistndata, "MultiStnData", "csv"),
+    (result_stnmeta, "StnMeta", "json"),
+    (result_stndata, "StnData", "json"),
+    (result_multistndata, "MultiStnData", "json"),
+    (result_lazymultistndata, "MultiStnData", "json"),
+    (result_griddata, "GridData", "json"),
+    (result_areameta, "General", "json"),
+    (result_array, "MultiStnData", "json"),
+    (result_columns, "MultiStnData", "json"),
+)
+
+
+def _child(args):
+    """ Execute a single benchmark in this process.
+
+    The results are written to stdout as JSON.
+
+    """
+    from resource import RUSAGE_SELF
+    from resource import getrusage
+    if not args.child.startswith("import"):
+        import acis  # exclude import time from the first iteration
+    bench = dict((func.__name__, func) for func, call, output in
+                 _BENCHMARKS)[args.child]
+    times = []
+    for _ in range(args.repeat):
+        start = time()
+        records = bench(args.url, args)
+        times.append(time() - start)
+    peak = getrusage(RUSAGE_SELF).ru_maxrss  # kB on Linux
+    stdout.write(dumps({"times": times, "records": records, "peak_rss": peak}))
+    return 0
+
+
+def _execute(name, url, args):
+    """ Execute a benchmark in a child process and return its results.
+
+    """
+    if name.startswith("import"):
+        # Each iteration needs a new process.
+        results = [_spawn(name, url, args, 1) for _ in range(args.repeat)]
+        for result in results:
+            if "error" in result:
+                return result
+        result = results[-1]
+        result["times"] = sum((result["times"] for result in results), [])
+        return result
+    return _spawn(name, url, args, args.repeat)
+
+
+def _spawn(name, url, args, repeat):
+    """ Execute a benchmark in a child process.
+
+    """
+    command = [executable, abspath(__file__), "--child", name, "--url", url,
+               "--repeat", str(repeat), "--sites", str(args.sites),
+               "--days", str(args.days)]
+    process = Popen(command, stdout=PIPE, stderr=PIPE)
+    output, error = process.communicate()
+    if process.returncode != 0:
+        message = error.strip().splitlines()[-1] if error.strip() else ""
+        return {"error": message}
+    return loads(output)
+
+
+def _revision():
+    """ Return the git revision of the library, or None if it's unknown.
+
+    """
+    try:
+        process = Popen(["git", "rev-parse", "--short", "HEAD"], stdout=PIPE,
+                        stderr=PIPE, cwd=dirname(abspath(__file__)))
+    except OSError:  # no git
+        return None
+    output = process.communicate()[0].strip()
+    return output if process.returncode == 0 else None
+
+
+def _report(results, baseline=None):
+    """ Write a table of benchmark results to stdout.
+
+    """
+    columns = ("benchmark", "best_s", "records/s", "MB/s", "peak_MB")
+    if baseline:
+        columns += ("change",)
+    stdout.write("{0:<24s}".format(columns[0]))
+    stdout.write("".join("{0:>12s}".format(col) for col in columns[1:]))
+    stdout.write("\n")
+    for name, result in results:
+        stdout.write("{0:<24s}".format(name))
+        if "error" in result:
+            stdout.write("  {0:s}\n".format(result["error"]))
+            continue
+        values = (result["best"], result["records_per_s"],
+                  result["mb_per_s"], result["peak_rss"] / 1024.)
+        stdout.write("".join("{0:12.4g}".format(value) for value in values))
+        try:
+            old = baseline[name]["best"]
+        except (KeyError, TypeError):  # no baseline
+            pass
+        else:
+            change = 100 * (result["best"] / old - 1)
+            stdout.write("{0:+11.1f}%".format(change))
+        stdout.write("\n")
+    return
+
+
+def main(argv=None):
+    """ Run all benchmarks.
+
+    """
+    parser = OptionParser(usage="%prog [options] [benchmark ...]")
+    parser.add_option("--sites", type="int", default=100,
+                      help="number of sites in each result [%default]")
+    parser.add_option("--days", type="int", default=365,
+                      help="number of days in each result [%default]")
+    parser.add_option("--grid", default="50x50",
+                      help="grid size as NYxNX [%default]")
+    parser.add_option("--repeat", type="int", default=3,
+                      help="iterations for each benchmark [%default]")
+    parser.add_option("--gzip", action="store_true", default=False,
+                      help="compress server replies")
+    parser.add_option("--output", help="write results to this JSON file")
+    parser.add_option("--compare", help="compare to this JSON results file")
+    parser.add_option("--child", help=SUPPRESS_HELP)
+    parser.add_option("--url", help=SUPPRESS_HELP)
+    args, names = parser.parse_args(argv)
+    sdate = date(*map(int, SyntheticServer.sdate.split("-")))
+    args.edate = str(sdate + timedelta(days=args.days - 1))
+    if args.child:
+        return _child(args)
+    grid = tuple(map(int, args.grid.lower().split("x")))
+    server = SyntheticServer(args.sites, args.days, grid, args.gzip)
+    server.start()
+    results = []
+    try:
+        for func, call_type, output in _BENCHMARKS:
+            name = func.__name__
+            if names and name not in names:
+                continue
+            result = _execute(name, server.url, args)
+            if "error" not in result:
+                size = 0.
+                if call_type is not None:
+                    size = server.size(call_type, output) / 2.**20
+                calls = args.sites if name.startswith("queue") else 1
+                best = min(result["times"])
+                result["best"] = best
+                result["bytes"] = int(size * 2**20 * calls)
+                result["records_per_s"] = result["records"] / best
+                result["mb_per_s"] = size * calls / best
+            results.append((name, result))
+    finally:
+        server.stop()
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r") as stream:
+            baseline = load(stream)["results"]
+    _report(results, baseline)
+    if args.output:
+        config = {"sites": args.sites, "days": args.days, "grid": grid,
+                  "repeat": args.repeat, "gzip": args.gzip}
+        summary = {"revision": _revision(), "python": python_version(),
+                   "timestamp": time(), "config": config,
+                   "results": dict(results)}
+        with open(args.output, "w") as stream:
+            dump(summary, stream, indent=1, sort_keys=True)
+    return 0
+
+
+# Make the script executable.
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,168 @@
+""" A local HTTP server that stands in for the ACIS server.
+
+Tests that use this server do not require a network connection, and they can
+inspect the requests and connections made by the library.
+
+"""
+from BaseHTTPServer import BaseHTTPRequestHandler
+from BaseHTTPServer import HTTPServer
+from SocketServer import ThreadingMixIn
+from json import dumps
+from json import loads
+from socket import SHUT_RDWR
+from socket import error as SocketError
+from threading import Lock
+from threading import Thread
+from urlparse import parse_qs
+from zlib import DEFLATED
+from zlib import MAX_WBITS
+from zlib import compress
+from zlib import compressobj
+
+
+class StubServer(object):
+    """ A local HTTP/1.1 server with keep-alive connections.
+
+    The reply function is called with the call type (e.g. "StnData") and the
+    decoded params object for each request, and it must return an HTTP status
+    code and the reply content. A content object that is not a string will be
+    encoded as JSON.
+
+    If encoding is "gzip" or "deflate", replies are compressed for clients that
+    accept that encoding. The request headers are recorded in the headers 
+    attribute.
+
+    """
+    def __init__(self, reply, encoding=None):
+        """ Initialize a StubServer object.
+
+        """
+        self.reply = reply
+        self.encoding = encoding
+        self.connections = 0
+        self.requests = []
+        self.headers = []
+        self._sockets = []
+        self._threads = []
+        self._lock = Lock()
+        self._server = _ThreadingServer(("127.0.0.1", 0), _Handler)
+        self._server.stub = self
+        self._thread = None
+        return
+
+    @property
+    def url(self):
+        """ The base URL for this server.
+
+        """
+        return "http://127.0.0.1:{0:d}/".format(self._server.server_port)
+
+    def start(self):
+        """ Start serving requests in a background thread.
+
+        """
+        poll = 0.05  # seconds between shutdown checks
+        self._thread = Thread(target=self._server.serve_forever, args=(poll,))
+        self._thread.daemon = True
+        self._thread.start()
+        return
+
+    def stop(self):
+        """ Stop the server.
+
+        """
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+        for sock in self._sockets:
+            # Close keep-alive connections so their handler threads exit.
+            try:
+                sock.shutdown(SHUT_RDWR)
+            except SocketError:  # already closed
+                pass
+        for thread in self._threads:
+            thread.join()
+        return
+
+    def _connect(self, sock, thread):
+        """ Record a new connection and the thread that is handling it.
+
+        """
+        with self._lock:
+            self.connections += 1
+            self._sockets.append(sock)
+            self._threads.append(thread)
+        return
+
+    def _request(self, call_type, params, headers):
+        """ Record a request and return its reply.
+
+        """
+        with self._lock:
+            self.requests.append((call_type, params))
+            self.headers.append(headers)
+        return self.reply(call_type, params)
+
+
+class _ThreadingServer(ThreadingMixIn, HTTPServer):
+    """ A multithreaded HTTP server.
+
+    """
+    def process_request(self, request, client_address):
+        """ Handle a new connection in its own thread.
+
+        """
+        args = (request, client_address)
+        thread = Thread(target=self.process_request_thread, args=args)
+        thread.daemon = True
+        self.stub._connect(request, thread)
+        thread.start()
+        return
+
+    def handle_error(self, request, client_address):
+        """ Ignore errors for clients that disconnect early.
+
+        """
+        return
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """ Handle requests for a StubServer.
+
+    """
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_POST(self):
+        """ Handle a POST request.
+
+        """
+        size = int(self.headers.getheader("Content-Length", 0))
+        query = parse_qs(self.rfile.read(size))
+        params = loads(query["params"][0])
+        call_type = self.path.lstrip("/")
+        stub = self.server.stub
+        code, content = stub._request(call_type, params, dict(self.headers))
+        if not isinstance(content, basestring):
+            content = dumps(content)
+        accept = self.headers.getheader("Accept-Encoding", "")
+        encoding = None
+        if stub.encoding and stub.encoding in accept:
+            encoding = stub.encoding
+        if encoding == "gzip":
+            encoder = compressobj(9, DEFLATED, 16 + MAX_WBITS)
+            content = encoder.compress(content) + encoder.flush()
+        elif encoding == "deflate":
+            content = compress(content)
+        self.send_response(code)
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+        return
+
+    def log_message(self, format, *args):
+        """ Suppress logging.
+
+        """
+        return
@@ -0,0 +1,600 @@
+""" Testing for the the batch.py module
+
+The module can be executed on its own or incorporated into a larger test suite.
+
+"""
+import _path
+import _unittest as unittest
+from _server import StubServer
+from math import ceil
+from math import floor
+
+from acis import RequestError
+from acis import ResultError
+from acis import GridDataRequest
+from acis import GridDataResult
+from acis import MultiStnDataRequest
+from acis import MultiStnDataResult
+from acis import StnDataRequest
+from acis import StnDataResult
+from acis import WebServicesCall
+from acis import date_range
+from acis.batch import split_bbox
+from acis.batch import split_dates
+from acis.batch import submit_chunked
+from acis.batch import submit_coalesced
+from acis.batch import submit_points
+from acis.batch import submit_tiled
+
+
+# Define the TestCase classes for this module. Each public component of the
+# module being tested has its own TestCase.
+
+class SplitDatesFunctionTest(unittest.TestCase):
+    """ Unit testing for the split_dates function.
+
+    """
+    def test(self):
+        """ Test normal operation.
+
+        """
+        chunks = [("1995-06-15", "1999-12-31"), ("2000-01-01", "2009-12-31"),
+                  ("2010-01-01", "2012-03-01")]
+        self.assertSequenceEqual(chunks, split_dates("1995-06-15",
+                                                     "2012-03-01", 10))
+        return
+
+    def test_years(self):
+        """ Test yearly chunks.
+
+        """
+        chunks = [("2011-12-31", "2011-12-31"), ("2012-01-01", "2012-01-01")]
+        self.assertSequenceEqual(chunks, split_dates("2011-12-31",
+                                                     "2012-01-01"))
+        return
+
+
+class SubmitChunkedFunctionTest(unittest.TestCase):
+    """ Unit testing for the submit_chunked function.
+
+    """
+    @staticmethod
+    def _reply(call_type, params):
+        """ Reply to a StnData or StnMeta call.
+
+        """
+        if call_type == "StnMeta":
+            ranges = [["1990-03-01", "2005-02-03"],
+                      ["1989-12-30", "2004-01-01"]]
+            return 200, {"meta": [{"valid_daterange": ranges}]}
+        if params["sdate"] > params["edate"]:
+            return 200, {"error": "start date must be before end date"}
+        dates = date_range(params["sdate"], params["edate"])
+        data = [[date, date[-2:]] for date in dates]
+        return 200, {"meta": {"uid": 92, "name": "OKC"}, "data": data}
+
+    def setUp(self):
+        """ Set up the test fixture.
+
+        This is called before each test is run so that they are isolated from
+        any side effects. This is part of the unittest API.
+
+        """
+        self._server = StubServer(self._reply)
+        self._server.start()
+        self._request = StnDataRequest()
+        self._request._call = WebServicesCall(self._server.url + "StnData")
+        self._request.location(sid="okc")
+        self._request.add_element("maxt")
+        self._request.add_element("mint")
+        return
+
+    def tearDown(self):
+        """ Tear down the test fixture.
+
+        This is called after each test is run. This is part of the unittest
+        API.
+
+        """
+        self._server.stop()
+        return
+
+    def test(self):
+        """ Test normal operation.
+
+        """
+        self._request.dates("1998-06-01", "2011-02-01")
+        query = submit_chunked(self._request, years=5)
+        self.assertEqual(4, len(self._server.requests))
+        expected = StnDataResult(self._request.submit())
+        result = StnDataResult(query)
+        self.assertDictEqual(expected.meta, result.meta)
+        self.assertDictEqual(expected.data, result.data)
+        return
+
+    def test_por(self):
+        """ Test a period-of-record request.
+
+        """
+        self._request.dates("por", "2000-01-01")
+        query = submit_chunked(self._request)
+        self.assertEqual("StnMeta", self._server.requests[0][0])
+        data = StnDataResult(query).data[92]
+        self.assertEqual("1989-12-30", data[0][0])
+        self.assertEqual("2000-01-01", data[-1][0])
+        return
+
+    def test_smry(self):
+        """ Test that a request with a summary cannot be split.
+
+        """
+        self._request.dates("2000-01-01", "2001-01-01")
+        self._request.add_element("pcpn", smry="sum")
+        with self.assertRaises(RequestError):
+            submit_chunked(self._request)
+        return
+
+    def test_season(self):
+        """ Test that a request with a season_start cannot be split.
+
+        """
+        self._request.dates("2000-01-01", "2001-01-01")
+        self._request.clear_elements()
+        self._request.add_element("pcpn", season_start="07-01")
+        with self.assertRaises(RequestError):
+            submit_chunked(self._request)
+        return
+
+    def test_reversed(self):
+        """ Test a request where sdate is after edate.
+
+        """
+        self._request.dates("2011-02-01", "1998-06-01")
+        query = submit_chunked(self._request, years=5)
+        self.assertEqual(1, len(self._server.requests))
+        self.assertEqual("2011-02-01", query["params"]["sdate"])
+        with self.assertRaises(ResultError):
+            StnDataResult(query)
+        return
+
+
+class SubmitCoalescedFunctionTest(unittest.TestCase):
+    """ Unit testing for the submit_coalesced function.
+
+    """
+    _SITES = [{"uid": uid, "name": "SITE {0:d}".format(uid), "state": "OK",
+               "sids": ["{0:05d} 2".format(uid), "S{0:d} 3".format(uid)]}
+              for uid in range(1, 6)]
+
+    def _reply(self, call_type, params):
+        """ Reply to a StnData or MultiStnData call.
+
+        The data value for each date is the site uid plus the day of month.
+        "DUP" is an ambiguous sid for the first two sites.
+
+        """
+        sdate = params.get("sdate", params.get("date"))
+        if sdate == "por":
+            sdate = "1999-12-31"
+        dates = list(date_range(sdate, params.get("edate")))
+        sites = []
+        for site in self._SITES:
+            idents = set(["DUP"] if site["uid"] < 3 else [])
+            for ident in site["sids"]:
+                idents.update((ident, ident.split()[0]))
+            sites.append((idents, site))
+        meta = params["meta"]
+        if call_type == "StnData":
+            if "uid" in params:
+                sids = [sid for idents, site in sites if site["uid"] ==
+                        params["uid"] for sid in site["sids"][:1]]
+            else:
+                sids = [params["sid"].upper()]
+        else:
+            sids = params["sids"].upper().split(",")
+        data = []
+        for sid in sids:
+            for idents, site in sites:
+                if sid in idents:
+                    break
+            else:
+                continue
+            values = [[str(site["uid"] + int(date[-2:]))] for date in dates]
+            data.append({"meta": dict((key, site[key]) for key in meta),
+                         "data": values})
+        if call_type == "StnData":
+            if not data:
+                return 200, {"error": "unknown sid"}
+            site = data[0]
+            site["data"] = [[date] + values for date, values in
+                            zip(dates, site["data"])]
+            return 200, site
+        if "date" in params:
+            for site in data:
+                site["data"] = site["data"][0]  # 1D result
+        return 200, {"data": data}
+
+    def setUp(self):
+        """ Set up the test fixture.
+
+        This is called before each test is run so that they are isolated from
+        any side effects. This is part of the unittest API.
+
+        """
+        self._server = StubServer(self._reply)
+        self._server.start()
+        return
+
+    def tearDown(self):
+        """ Tear down the test fixture.
+
+        This is called after each test is run. This is part of the unittest
+        API.
+
+        """
+        self._server.stop()
+        return
+
+    def _request(self, sdate, edate=None, **location):
+        """ Create a StnDataRequest for the test server.
+
+        """
+        request = StnDataRequest()
+        request._call = WebServicesCall(self._server.url + "StnData")
+        request.location(**location)
+        request.dates(sdate, edate)
+        request.metadata("name")
+        request.add_element("maxt")
+        return request
+
+    def _check(self, requests, queries):
+        """ Check each query against the request submitted individually.
+
+        """
+        self.assertEqual(len(requests), len(queries))
+        for request, query in zip(requests, queries):
+            self.assertEqual(request.params, query["params"])
+            self.assertDictEqual(request.submit()["result"], query["result"])
+        return
+
+    def test(self):
+        """ Test normal operation.
+
+        """
+        sids = ["S1", "s2", "00003", "00004 2", "S5 3", "S1"]
+        requests = [self._request("2000-01-01", "2000-01-03", sid=sid) for
+                    sid in sids]
+        queries = submit_coalesced(requests, size=2)
+        self.assertSequenceEqual(["MultiStnData"] * 3, [call_type for
+                                 call_type, params in self._server.requests])
+        self._check(requests, queries)
+        result = StnDataResult(queries[1])
+        self.assertEqual([["2000-01-01", "3"], ["2000-01-02", "4"],
+                          ["2000-01-03", "5"]], result.data[2])
+        return
+
+    def test_date(self):
+        """ Test a single date.
+
+        """
+        requests = [self._request("2000-01-05", sid=sid) for sid in
+                    ("S1", "S2")]
+        queries = submit_coalesced(requests)
+        self.assertEqual(1, len(self._server.requests))
+        self._check(requests, queries)
+        return
+
+    def test_single(self):
+        """ Test requests that are submitted individually.
+
+        """
+        requests = [self._request("2000-01-01", "2000-01-03", uid=3),
+                    self._request("por", "2000-01-03", sid="S4"),
+                    self._request("2000-01-01", "2000-01-03", sid="DUP"),
+                    self._request("2000-01-01", "2000-01-03", sid="S5")]
+        requests[3].metadata("name", "state")  # compatible with DUP
+        queries = submit_coalesced(requests)
+        call_types = sorted(call_type for call_type, params in
+                            self._server.requests)
+        self.assertEqual(["MultiStnData"] + ["StnData"] * 3, call_types)
+        self._check(requests, queries)
+        self.assertEqual({"uid": 5, "name": "SITE 5", "state": "OK"},
+                         queries[3]["result"]["meta"])
+        return
+
+
+class SubmitPointsFunctionTest(unittest.TestCase):
+    """ Unit testing for the submit_points function.
+
+    """
+    _POINTS = [(-76.1, 42.2), (-76.4, 42.7), (-70.2, 35.3), (-76.9, 42.01)]
+
+    @staticmethod
+    def _reply(call_type, params):
+        """ Reply to a GridData call for a grid with a 0.5 degree resolution.
+
+        """
+        dates = list(date_range(params["sdate"], params["edate"]))
+        if "loc" in params:
+            lon, lat = [round(float(x) * 2) / 2 for x in
+                        params["loc"].split(",")]
+            lats, lons = [lat], [lon]
+        else:
+            west, south, east, north = map(float, params["bbox"].split(","))
+            lats = [j / 2. for j in range(int(ceil(south * 2)),
+                                          int(floor(north * 2)) + 1)]
+            lons = [i / 2. for i in range(int(ceil(west * 2)),
+                                          int(floor(east * 2)) + 1)]
+        meta = {"lat": [[lat] * len(lons) for lat in lats],
+                "lon": [lons for lat in lats],
+                "elev": [[lat + lon for lon in lons] for lat in lats]}
+        if "ll" not in params["meta"]:
+            del meta["lat"], meta["lon"]
+        if "elev" not in params["meta"]:
+            del meta["elev"]
+        data = []
+        for day, date in enumerate(dates):
+            grid = [[day * lat * lon for lon in lons] for lat in lats]
+            data.append([date, grid])
+        smry = [[[lat - lon for lon in lons] for lat in lats]]
+        result = {"meta": meta, "data": data, "smry": smry}
+        if "loc" in params:
+            # Point results are scalars.
+            meta.update((key, value[0][0]) for key, value in meta.items())
+            result["data"] = [[date, grid[0][0]] for date, grid in data]
+            result["smry"] = [grid[0][0] for grid in smry]
+        return 200, result
+
+    def setUp(self):
+        """ Set up the test fixture.
+
+        This is called before each test is run so that they are isolated from
+        any side effects. This is part of the unittest API.
+
+        """
+        self._server = StubServer(self._reply)
+        self._server.start()
+        self._request = GridDataRequest()
+        self._request._call = WebServicesCall(self._server.url + "GridData")
+        self._request.dates("2000-01-01", "2000-01-03")
+        self._request.grid(1)
+        self._request.metadata("elev")
+        self._request.add_element("maxt", smry="max")
+        return
+
+    def tearDown(self):
+        """ Tear down the test fixture.
+
+        This is called after each test is run. This is part of the unittest
+        API.
+
+        """
+        self._server.stop()
+        return
+
+    def _check(self, queries):
+        """ Check each query against a loc request for the point.
+
+        """
+        self.assertEqual(len(self._POINTS), len(queries))
+        for point, query in zip(self._POINTS, queries):
+            self._request.location(loc="{0!r},{1!r}".format(*point))
+            expected = self._request.submit()
+            self.assertDictEqual(expected["params"], query["params"])
+            self.assertDictEqual(expected["result"], query["result"])
+        return
+
+    def test(self):
+        """ Test normal operation.
+
+        """
+        queries = submit_points(self._request, self._POINTS, pad=0.3)
+        locations = sorted("bbox" if "bbox" in params else "loc" for
+                           call_type, params in self._server.requests)
+        self.assertEqual(["bbox", "loc"], locations)
+        self._check(queries)
+        result = GridDataResult(queries[0])
+        self.assertEqual((1, 1), result.shape)
+        self.assertEqual({"elev": -34.0}, result.meta)
+        return
+
+    def test_pad(self):
+        """ Test points that are not within the bbox grid.
+
+        """
+        queries = submit_points(self._request, self._POINTS, pad=0)
+        locations = sorted("bbox" if "bbox" in params else "loc" for
+                           call_type, params in self._server.requests)
+        self.assertEqual(["bbox"] + ["loc"] * 4, locations)
+        self._check(queries)
+        return
+
+
+class SplitBboxFunctionTest(unittest.TestCase):
+    """ Unit testing for the split_bbox function.
+
+    """
+    def test(self):
+        """ Test normal operation.
+
+        """
+        tiles = [(-90., 40., -87.5, 42.), (-87.5, 40., -85., 42.)]
+        self.assertSequenceEqual(tiles, split_bbox("-90,40,-85,42", 3))
+        return
+
+    def test_small(self):
+        """ Test a bbox that is smaller than the tile size.
+
+        """
+        tiles = [(-90., 40., -89., 41.)]
+        self.assertSequenceEqual(tiles, split_bbox((-90, 40, -89, 41)))
+        return
+
+
+class SubmitTiledFunctionTest(unittest.TestCase):
+    """ Unit testing for the submit_tiled function.
+
+    """
+    _SITES = (
+        (1, "NY", -76.0, 42.0),
+        (2, "NY", -74.5, 43.5),
+        (3, "PA", -77.5, 41.0),
+        (4, "PA", -75.0, 40.0))
+
+    @classmethod
+    def _reply(cls, call_type, params):
+        """ Reply to a MultiStnData or GridData call.
+
+        """
+        dates = date_range(params["sdate"], params["edate"])
+        try:
+            west, south, east, north = map(float, params["bbox"].split(","))
+        except KeyError:  # state
+            west, south, east, north = -180, -90, 180, 90
+        if call_type == "MultiStnData":
+            data = []
+            for uid, state, lon, lat in cls._SITES:
+                if (west <= lon <= east and south <= lat <= north and
+                        params.get("state", state) == state):
+                    values = [[str(uid)] for date in dates]
+                    meta = {"uid": uid, "state": state}
+                    if "meta" in params:
+                        meta = dict((key, value) for key, value in
+                                    meta.iteritems() if key in params["meta"])
+                    data.append({"meta": meta, "data": values})
+            return 200, {"data": data}
+        # Return a grid with a 0.5 degree resolution.
+        lats = [j / 2. for j in range(int(ceil(south * 2)),
+                                      int(floor(north * 2)) + 1)]
+        lons = [i / 2. for i in range(int(ceil(west * 2)),
+                                      int(floor(east * 2)) + 1)]
+        meta = {"lat": [[lat] * len(lons) for lat in lats],
+                "lon": [lons for lat in lats],
+                "elev": [[lat + lon for lon in lons] for lat in lats]}
+        data = []
+        for day, date in enumerate(dates):
+            grid = [[day * lat * lon for lon in lons] for lat in lats]
+            data.append([date, grid])
+        smry = [[[lat - lon for lon in lons] for lat in lats]]
+        return 200, {"meta": meta, "data": data, "smry": smry}
+
+    def setUp(self):
+        """ Set up the test fixture.
+
+        This is called before each test is run so that they are isolated from
+        any side effects. This is part of the unittest API.
+
+        """
+        self._server = StubServer(self._reply)
+        self._server.start()
+        return
+
+    def tearDown(self):
+        """ Tear down the test fixture.
+
+        This is called after each test is run. This is part of the unittest 
+        API.
+
+        """
+        self._server.stop()
+        return
+
+    def test_bbox(self):
+        """ Test a MultiStnData bbox request.
+
+        """
+        request = MultiStnDataRequest()
+        request._call = WebServicesCall(self._server.url + "MultiStnData")
+        request.location(bbox="-78,40,-74,44")
+        request.dates("2000-01-01", "2000-01-03")
+        request.add_element("maxt")
+        query = submit_tiled(request, size=2)
+        self.assertEqual(4, len(self._server.requests))
+        expected = MultiStnDataResult(request.submit())
+        result = MultiStnDataResult(query)
+        self.assertDictEqual(expected.data, result.data)
+        self.assertEqual(4, len(result.data))
+        return
+
+    def test_state(self):
+        """ Test a MultiStnData request for multiple states.
+
+        """
+        request = MultiStnDataRequest()
+        request._call = WebServicesCall(self._server.url + "MultiStnData")
+        request.location(state="NY,PA")
+        request.dates("2000-01-01", "2000-01-03")
+        request.add_element("maxt")
+        result = MultiStnDataResult(submit_tiled(request))
+        self.assertEqual(["NY", "PA"], sorted(params["state"] for call_type, 
+                                              params in self._server.requests))
+        self.assertItemsEqual([1, 2, 3, 4], result.data.keys())
+        return
+
+    def test_meta(self):
+        """ Test a MultiStnData request whose meta does not include the uid.
+
+        """
+        request = MultiStnDataRequest()
+        request._call = WebServicesCall(self._server.url + "MultiStnData")
+        request.location(bbox="-78,40,-74,44")
+        request.dates("2000-01-01", "2000-01-03")
+        request.add_element("maxt")
+        request.params["meta"] = "state"
+        query = submit_tiled(request, size=2)
+        for call_type, params in self._server.requests:
+            self.assertEqual(["state", "uid"], params["meta"])
+        states = sorted(site["meta"]["state"] for site in
+                        query["result"]["data"])
+        self.assertEqual(["NY", "NY", "PA", "PA"], states)
+        for site in query["result"]["data"]:
+            self.assertNotIn("uid", site["meta"])
+        return
+
+    def test_grid(self):
+        """ Test a GridData bbox request.
+
+        """
+        request = GridDataRequest()
+        request._call = WebServicesCall(self._server.url + "GridData")
+        request.location(bbox="-78,40,-74,44")
+        request.dates("2000-01-01", "2000-01-03")
+        request.grid(1)
+        request.metadata("elev")
+        request.add_element("maxt", smry="max")
+        query = submit_tiled(request, size=1.5)
+        self.assertEqual(9, len(self._server.requests))
+        expected = request.submit()["result"]
+        del expected["meta"]["lat"], expected["meta"]["lon"]  # not requested
+        self.assertDictEqual(expected, query["result"])
+        result = GridDataResult(query)
+        self.assertEqual((9, 9), result.shape)
+        return
+
+
+# Specify the test cases to run for this module. Private bases classes need
+# to be explicitly excluded from automatic discovery.
+
+_TEST_CASES = (SplitDatesFunctionTest, SubmitChunkedFunctionTest,
+               SubmitCoalescedFunctionTest, SubmitPointsFunctionTest,
+               SplitBboxFunctionTest, SubmitTiledFunctionTest)
+
+def load_tests(loader, tests, pattern):
+    """ Define a TestSuite for this module.
+
+    This is part of the unittest API. The last two arguments are ignored. The
+    _TEST_CASES global is used to determine which TestCase classes to load
+    from this module.
+
+    """
+    suite = unittest.TestSuite()
+    for test_case in _TEST_CASES:
+        tests = loader.loadTestsFromTestCase(test_case)
+        suite.addTests(tests)
+    return suite
+
+
+# Make the module executable.
+
+if __name__ == "__main__":
+    unittest.main()  # main() calls sys.exit()
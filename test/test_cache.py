@@ -0,0 +1,315 @@
+""" Testing for the the cache.py module
+
+The module can be executed on its own or incorporated into a larger test suite.
+
+"""
+import _path
+import _unittest as unittest
+from _data import TestData
+from _server import StubServer
+
+from shutil import rmtree
+from tempfile import mkdtemp
+from threading import Event
+from threading import Thread
+from time import sleep
+
+from acis import MemoryCache
+from acis import ResponseCache
+from acis import WebServicesCall
+
+
+# Define the TestCase classes for this module. Each public component of the
+# module being tested has its own TestCase.
+
+class ResponseCacheTest(unittest.TestCase):
+    """ Unit testing for the ResponseCache class.
+
+    """
+    _url = "http://data.rcc-acis.org/StnData"
+
+    @classmethod
+    def setUpClass(cls):
+        """ Initialize the ResponseCacheTest class.
+
+        This is called before any tests are run. This is part of the unittest
+        API.
+
+        """
+        cls._DATA = TestData("data/StnData.xml")
+        return
+
+    def setUp(self):
+        """ Set up the test fixture.
+
+        This is called before each test is run so that they are isolated from
+        any side effects. This is part of the unittest API.
+
+        """
+        self._path = mkdtemp()
+        self._loads = 0
+        return
+
+    def tearDown(self):
+        """ Tear down the test fixture.
+
+        This is called after each test is run. This is part of the unittest 
+        API.
+
+        """
+        rmtree(self._path)
+        return
+
+    def _load(self, content="content"):
+        """ Stand-in for retrieving content from the server.
+
+        """
+        self._loads += 1
+        return content
+
+    def test_fetch(self):
+        """ Test the fetch method.
+
+        """
+        cache = ResponseCache(self._path)
+        params = self._DATA.params  # historical dates
+        for _ in range(3):
+            self.assertEqual("content", cache.fetch(self._url, params, 
+                                                    self._load))
+        self.assertEqual(1, self._loads)
+        self.assertEqual((2, 1), (cache.hits, cache.misses))
+        return
+
+    def test_fetch_key(self):
+        """ Test that the cache key does not depend on params order.
+
+        """
+        cache = ResponseCache(self._path)
+        cache.fetch(self._url, {"sid": "okc", "date": "2000-01-01"}, 
+                    self._load)
+        cache.fetch(self._url, {"date": "2000-01-01", "sid": "okc"}, 
+                    self._load)
+        cache.fetch(self._url, {"date": "2000-01-01", "sid": "tul"}, 
+                    self._load)
+        self.assertEqual(2, self._loads)
+        return
+
+    def test_fetch_error(self):
+        """ Test that error results are not cached.
+
+        """
+        cache = ResponseCache(self._path)
+        load = lambda: self._load('{"error":"bad request"}')
+        for _ in range(2):
+            cache.fetch(self._url, self._DATA.params, load)
+        self.assertEqual(2, self._loads)
+        return
+
+    def test_ttl(self):
+        """ Test expiration of mutable results.
+
+        """
+        cache = ResponseCache(self._path, ttl=-1)
+        params = {"sid": "okc", "sdate": "2000-01-01", "edate": "por"}
+        cache.fetch(self._url, params, self._load)
+        cache.fetch(self._url, params, self._load)
+        self.assertEqual(2, self._loads)
+        params["edate"] = "2000-12-31"  # immutable
+        cache.fetch(self._url, params, self._load)
+        cache.fetch(self._url, params, self._load)
+        self.assertEqual(3, self._loads)
+        return
+
+    def test_evict(self):
+        """ Test eviction of least-recently used results.
+
+        """
+        cache = ResponseCache(self._path, max_size=400)
+        load = lambda: self._load("x" * 100)
+        for sid in ("a", "b", "c", "a", "d"):
+            params = {"sid": sid, "date": "2000-01-01"}
+            cache.fetch(self._url, params, load)
+            sleep(0.01)  # distinct access times
+        self.assertLessEqual(cache._size, 400)
+        self.assertEqual(4, self._loads)
+        for sid in ("a", "c", "d"):
+            params = {"sid": sid, "date": "2000-01-01"}
+            cache.fetch(self._url, params, load)
+        self.assertEqual(4, self._loads)
+        cache.fetch(self._url, {"sid": "b", "date": "2000-01-01"}, load)
+        self.assertEqual(5, self._loads)  # b was evicted
+        return
+
+    def test_call(self):
+        """ Test caching for a WebServicesCall.
+
+        """
+        reply = lambda call_type, params: (200, self._DATA.result)
+        server = StubServer(reply)
+        server.start()
+        try:
+            call = WebServicesCall(server.url + "StnData")
+            call.cache = ResponseCache(self._path)
+            for _ in range(2):
+                result = call(self._DATA.params)
+                self.assertDictEqual(self._DATA.result, result)
+        finally:
+            server.stop()
+        self.assertEqual(1, len(server.requests))
+        return
+
+
+class MemoryCacheTest(unittest.TestCase):
+    """ Unit testing for the MemoryCache class.
+
+    """
+    _url = "http://data.rcc-acis.org/StnMeta"
+
+    def setUp(self):
+        """ Set up the test fixture.
+
+        This is called before each test is run so that they are isolated from
+        any side effects. This is part of the unittest API.
+
+        """
+        self._loads = 0
+        return
+
+    def _load(self, content="content"):
+        """ Stand-in for retrieving content from the server.
+
+        """
+        self._loads += 1
+        return content
+
+    def test_fetch(self):
+        """ Test the fetch method.
+
+        """
+        cache = MemoryCache()
+        for _ in range(4):
+            self.assertEqual("content", cache.fetch(self._url, {"state": "ok"},
+                                                    self._load))
+        self.assertEqual(1, self._loads)
+        self.assertEqual((3, 1), (cache.hits, cache.misses))
+        self.assertEqual(0.75, cache.hit_ratio)
+        return
+
+    def test_calls(self):
+        """ Test the calls filter.
+
+        """
+        cache = MemoryCache(calls=("StnMeta", "General"))
+        url = "http://data.rcc-acis.org/StnData"
+        for _ in range(2):
+            cache.fetch(url, {"sid": "okc"}, self._load)
+            cache.fetch(self._url, {"sid": "okc"}, self._load)
+        self.assertEqual(3, self._loads)
+        return
+
+    def test_evict(self):
+        """ Test eviction of least-recently used results.
+
+        """
+        cache = MemoryCache(max_entries=2)
+        for state in ("ok", "tx", "ok", "ks"):  # tx is evicted
+            cache.fetch(self._url, {"state": state}, self._load)
+        self.assertEqual(3, self._loads)
+        cache.fetch(self._url, {"state": "ok"}, self._load)
+        cache.fetch(self._url, {"state": "tx"}, self._load)
+        self.assertEqual(4, self._loads)
+        cache = MemoryCache(max_size=10)
+        for state in ("ok", "tx", "ok"):  # only one result fits
+            cache.fetch(self._url, {"state": state}, self._load)
+        self.assertEqual(7, self._loads)
+        return
+
+    def test_single_flight(self):
+        """ Test that concurrent identical calls share one server call.
+
+        """
+        cache = MemoryCache()
+        release = Event()
+        def load():
+            release.wait()
+            return self._load()
+        results = []
+        fetch = lambda: results.append(cache.fetch(self._url, {}, load))
+        threads = [Thread(target=fetch) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertSequenceEqual(["content"] * 4, results)
+        self.assertEqual(1, self._loads)
+        self.assertEqual(3, cache.shared)
+        return
+
+    def test_single_flight_interrupt(self):
+        """ Test that an interrupted call is raised to all callers.
+
+        """
+        cache = MemoryCache()
+        release = Event()
+        def load():
+            release.wait()
+            raise KeyboardInterrupt
+        errors = []
+        def fetch():
+            try:
+                cache.fetch(self._url, {}, load)
+            except KeyboardInterrupt:
+                errors.append(True)
+            return
+        threads = [Thread(target=fetch) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        sleep(0.1)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(4, len(errors))
+        self.assertEqual("content", cache.fetch(self._url, {}, self._load))
+        self.assertEqual(1, self._loads)  # failed call was not cached
+        return
+
+    def test_backend(self):
+        """ Test a backend cache.
+
+        """
+        backend = MemoryCache()
+        cache = MemoryCache(backend=backend)
+        cache.fetch(self._url, {}, self._load)
+        cache.clear()
+        cache.fetch(self._url, {}, self._load)
+        self.assertEqual(1, self._loads)
+        self.assertEqual(1, backend.hits)
+        return
+
+
+# Specify the test cases to run for this module. Private bases classes need
+# to be explicitly excluded from automatic discovery.
+
+_TEST_CASES = (ResponseCacheTest, MemoryCacheTest)
+
+def load_tests(loader, tests, pattern):
+    """ Define a TestSuite for this module.
+
+    This is part of the unittest API. The last two arguments are ignored. The
+    _TEST_CASES global is used to determine which TestCase classes to load
+    from this module.
+
+    """
+    suite = unittest.TestSuite()
+    for test_case in _TEST_CASES:
+        tests = loader.loadTestsFromTestCase(test_case)
+        suite.addTests(tests)
+    return suite
+
+
+# Make the module executable.
+
+if __name__ == "__main__":
+    unittest.main()  # main() calls sys.exit()
@@ -6,9 +6,16 @@ The module can be executed on its own or incorporated into a larger test suite.
 import _path
 import _unittest as unittest
 from _data import TestData
+from _server import StubServer
 
+from socket import timeout as SocketTimeout
+from threading import Thread
+from time import sleep
+
+from acis import ConnectionPool
 from acis import WebServicesCall
 from acis import RequestError
+from acis import ResultError
 
 
 # Define the TestCase classes for this module. Each public component of the
@@ -58,11 +65,263 @@ class WebServicesCallTest(unittest.TestCase):
         self.assertEqual("Need sId", str(context.exception))
         return
 
+    def test_keepalive(self):
+        """ Test connection reuse for sequential calls.
+
+        """
+        reply = lambda call_type, params: (200, self._DATA.result)
+        server = StubServer(reply)
+        server.start()
+        try:
+            self._call.url = server.url + "StnData"
+            self._call.pool = ConnectionPool()
+            for _ in range(5):
+                result = self._call(self._DATA.params)
+                self.assertDictEqual(self._DATA.result, result)
+        finally:
+            server.stop()
+        self.assertEqual(5, len(server.requests))
+        self.assertEqual(1, server.connections)
+        return
+
+    def test_timeout_reused(self):
+        """ Test that a timeout on a reused connection is not retried.
+
+        """
+        def reply(call_type, params):
+            sleep(params.get("delay", 0))
+            return 200, self._DATA.result
+        server = StubServer(reply)
+        server.start()
+        try:
+            self._call = WebServicesCall(server.url + "StnData", timeout=0.2)
+            self._call.pool = ConnectionPool()
+            self._call(self._DATA.params)
+            with self.assertRaises(SocketTimeout):
+                self._call(dict(self._DATA.params, delay=0.5))
+        finally:
+            server.stop()
+        self.assertEqual(2, len(server.requests))
+        return
+
+    def test_gzip(self):
+        """ Test a gzip-compressed reply.
+
+        """
+        self._test_encoding("gzip")
+        return
+
+    def test_deflate(self):
+        """ Test a deflate-compressed reply.
+
+        """
+        self._test_encoding("deflate")
+        return
+
+    def test_identity(self):
+        """ Test an uncompressed reply.
+
+        """
+        self._test_encoding(None)
+        return
+
+    def _test_encoding(self, encoding):
+        """ Test a reply with the given content encoding.
+
+        """
+        lines = ["{0:d},{1:d}.5,M\n".format(day, day % 7) for day in 
+                 range(5000)]
+        content = "".join(lines)
+        reply = lambda call_type, params: (200, content)
+        server = StubServer(reply, encoding)
+        server.start()
+        try:
+            self._call.url = server.url + "StnData"
+            stream = self._call({"output": "csv"})
+            try:
+                self.assertEqual(lines[0], stream.readline())
+                self.assertSequenceEqual(lines[1:], list(stream))
+            finally:
+                stream.close()
+            stream2 = self._call({"output": "csv"})  # reuse the connection
+            result = stream2.read()
+            stream2.close()
+        finally:
+            server.stop()
+        self.assertEqual("gzip, deflate", server.headers[0]["accept-encoding"])
+        self.assertEqual(content, result)
+        if encoding:
+            self.assertLess(stream.wire_bytes, len(content) / 4)
+        else:
+            self.assertEqual(len(content), stream.wire_bytes)
+        self.assertEqual(1, server.connections)
+        return
+
+    def test_iterdata(self):
+        """ Test the iterdata method.
+
+        """
+        data = TestData("data/MultiStnData.xml")
+        sites = data.result["data"] * 200  # multiple read chunks
+        reply = lambda call_type, params: (200, {"data": sites, "x": 1.25})
+        server = StubServer(reply)
+        server.start()
+        try:
+            self._call.url = server.url + "MultiStnData"
+            extra = {}
+            items = list(self._call.iterdata(data.params, extra))
+        finally:
+            server.stop()
+        self.assertSequenceEqual(sites, items)
+        self.assertDictEqual({"x": 1.25}, extra)
+        return
+
+    def test_parallel(self):
+        """ Test parallel decoding of a large result.
+
+        """
+        stn = TestData("data/StnData.xml")
+        multi = TestData("data/MultiStnData.xml")
+        grid = [[[1.5, -999], [2, 3.25e-3]]] * 2
+        results = [
+            {"meta": stn.result["meta"], "data": stn.result["data"] * 200,
+             "smry": stn.result["smry"]},
+            {"data": multi.result["data"] * 200},
+            {"meta": {"elev": [[1, 2]]}, "smry": grid,
+             "data": [["2000-01-01", grid, grid]] * 200},
+            {"data": [[["2000-01-01", 1]], [["2000-01-02", 2]]] * 200},
+            {"data": []}]
+        reply = lambda call_type, params: (200, results[params["pos"]])
+        server = StubServer(reply)
+        server.start()
+        try:
+            self._call.url = server.url + "StnData"
+            self._call.processes = 2
+            self._call.parallel_size = 0
+            for pos, result in enumerate(results):
+                self.assertEqual(result, self._call({"pos": pos}))
+        finally:
+            server.stop()
+        return
+
+    def test_iterdata_error(self):
+        """ Test the iterdata method for an error result.
+
+        """
+        reply = lambda call_type, params: (200, {"error": "no data"})
+        server = StubServer(reply)
+        server.start()
+        try:
+            self._call.url = server.url + "MultiStnData"
+            with self.assertRaises(ResultError) as context:
+                list(self._call.iterdata({}))
+        finally:
+            server.stop()
+        self.assertEqual("no data", str(context.exception))
+        return
+
+    def test_error_local(self):
+        """ Test an invalid call with a local server.
+
+        """
+        reply = lambda call_type, params: (400, "Need sId\n")
+        server = StubServer(reply)
+        server.start()
+        try:
+            self._call.url = server.url + "StnData"
+            self._call.pool = ConnectionPool()
+            with self.assertRaises(RequestError) as context:
+                self._call({})
+            self._call.pool.clear()
+        finally:
+            server.stop()
+        self.assertEqual("Need sId", str(context.exception))
+        return
+
+
+class ConnectionPoolTest(unittest.TestCase):
+    """ Unit testing for the ConnectionPool class.
+
+    """
+    _url = "http://127.0.0.1:8080/StnData"
+
+    def test_reuse(self):
+        """ Test reuse of a released connection.
+
+        """
+        pool = ConnectionPool()
+        conn, reused = pool.acquire(self._url)
+        self.assertFalse(reused)
+        conn.sock = _Socket()  # pretend that the connection is open
+        pool.release(conn)
+        self.assertEqual((conn, True), pool.acquire(self._url))
+        pool.release(conn, False)
+        self.assertFalse(pool.acquire(self._url)[1])
+        return
+
+    def test_maxsize(self):
+        """ Test the per-host connection limit.
+
+        """
+        pool = ConnectionPool(maxsize=1)
+        conn = pool.acquire(self._url)[0]
+        acquired = []
+        acquire = lambda: acquired.append(pool.acquire(self._url))
+        thread = Thread(target=acquire)
+        thread.start()
+        sleep(0.1)
+        self.assertEqual(0, len(acquired))  # waiting for a connection
+        pool.release(conn, False)
+        thread.join(1)
+        self.assertEqual(1, len(acquired))
+        return
+
+    def test_timeout(self):
+        """ Test a timeout waiting for a connection.
+
+        """
+        pool = ConnectionPool(maxsize=1)
+        conn = pool.acquire(self._url)[0]
+        with self.assertRaises(SocketTimeout):
+            pool.acquire(self._url, 0.1)
+        pool.release(conn, False)
+        self.assertFalse(pool.acquire(self._url, 0.1)[1])
+        return
+
+    def test_idle(self):
+        """ Test eviction of idle connections.
+
+        """
+        pool = ConnectionPool(idle=60)
+        conn = pool.acquire(self._url)[0]
+        conn.sock = _Socket()  # pretend that the connection is open
+        pool.release(conn)
+        self.assertEqual((conn, True), pool.acquire(self._url))
+        pool.release(conn)
+        pool.idle = 0
+        sleep(0.01)  # make sure the connection is older than the limit
+        other, reused = pool.acquire(self._url)
+        self.assertFalse(reused)
+        self.assertIsNot(conn, other)
+        self.assertIsNone(conn.sock)  # evicted connection was closed
+        return
+
+
+class _Socket(object):
+    """ A stand-in for an open socket.
+
+    """
+    def settimeout(self, timeout):
+        return
+
+    def close(self):
+        return
+
 
 # Specify the test cases to run for this module. Private bases classes need
 # to be explicitly excluded from automatic discovery.
 
-_TEST_CASES = (WebServicesCallTest,)
+_TEST_CASES = (WebServicesCallTest, ConnectionPoolTest)
 
 def load_tests(loader, tests, pattern):
     """ Define a TestSuite for this module.
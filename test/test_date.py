@@ -12,6 +12,7 @@ from _data import TestData
 
 from acis import date_trunc
 from acis import date_object
+from acis import date_array
 from acis import date_range
 from acis import date_string
 
@@ -200,12 +201,75 @@ class DateRangeFunctionTest(unittest.TestCase):
         self.assertSequenceEqual(expected, list(actual))
         return
 
+    def test_month_end(self):
+        """ Test a monthly interval starting at the end of a month.
+
+        The day is clamped to the end of each month, cumulatively.
+
+        """
+        expected = ("2011-01-31", "2011-02-28", "2011-03-28")
+        actual = date_range("2011-01-31", "2011-04-27", (0, 1, 0))
+        self.assertSequenceEqual(expected, list(actual))
+        return
+
+    def test_bad_interval(self):
+        """ Test exception for an invalid interval.
+
+        """
+        with self.assertRaises(ValueError):
+            date_range("2011-01-01", "2011-12-31", (0, 0, 0))
+        return
+
+
+class DateArrayFunctionTest(unittest.TestCase):
+    """ Unit testing for the date_array function.
+
+    """
+    def test_daily(self):
+        """ Test a daily interval.
+
+        """
+        expected = ("2011-12-31", "2012-01-02", "2012-01-04")
+        actual = date_array("2011-12-31", "2012-01-04", (0, 0, 2))
+        self.assertEqual("datetime64[D]", str(actual.dtype))
+        self.assertSequenceEqual(expected, map(str, actual))
+        return
+
+    def test_monthly(self):
+        """ Test a monthly interval.
+
+        """
+        expected = ("2011-12", "2012-01", "2012-02")
+        actual = date_array("20111215", "2012-02-15", "mly")
+        self.assertEqual("datetime64[M]", str(actual.dtype))
+        self.assertSequenceEqual(expected, map(str, actual))
+        return
+
+    def test_yearly(self):
+        """ Test a yearly interval.
+
+        """
+        expected = ("2011", "2012", "2013")
+        actual = date_array("2011-12-15", "2013-12-15", "yly")
+        self.assertEqual("datetime64[Y]", str(actual.dtype))
+        self.assertSequenceEqual(expected, map(str, actual))
+        return
+
+    def test_ymd(self):
+        """ Test a mixed (y, m, d) interval.
+
+        """
+        expected = ("2011-01-31", "2012-03-01", "2013-04-02")
+        actual = date_array("2011-01-31", "2013-12-31", (1, 1, 1))
+        self.assertSequenceEqual(expected, map(str, actual))
+        return
+
 
 # Specify the test cases to run for this module. Private bases classes need
 # to be explicitly excluded from automatic discovery.
 
 _TEST_CASES = (DateObjectFunctionTest, DateStringFunctionTest,
-        DateTruncFunctionTest, DateRangeFunctionTest)
+        DateTruncFunctionTest, DateRangeFunctionTest, DateArrayFunctionTest)
 
 def load_tests(loader, tests, pattern):
     """ Define a TestSuite for this module.
@@ -0,0 +1,219 @@
+""" Testing for the the events.py module
+
+The module can be executed on its own or incorporated into a larger test suite.
+
+"""
+import _path
+import _unittest as unittest
+from _data import TestData
+from _server import StubServer
+
+from StringIO import StringIO
+
+from acis import CallStats
+from acis import StnDataRequest
+from acis import StnDataResult
+from acis import StnDataStream
+from acis import WebServicesCall
+from acis import add_hook
+from acis import remove_hook
+from acis.queue import RequestQueue
+
+
+# Define the TestCase classes for this module. Each public component of the
+# module being tested has its own TestCase.
+
+class AddHookFunctionTest(unittest.TestCase):
+    """ Unit testing for the add_hook function.
+
+    """
+    @classmethod
+    def setUpClass(cls):
+        """ Initialize the AddHookFunctionTest class.
+
+        This is called before any tests are run. This is part of the unittest
+        API.
+
+        """
+        cls._DATA = TestData("data/StnData.xml")
+        return
+
+    def setUp(self):
+        """ Set up the test fixture.
+
+        This is called before each test is run so that they are isolated from
+        any side effects. This is part of the unittest API.
+
+        """
+        self._events = []
+        add_hook(self._events.append)
+        return
+
+    def tearDown(self):
+        """ Tear down the test fixture.
+
+        This is called after each test is run. This is part of the unittest 
+        API.
+
+        """
+        remove_hook(self._events.append)
+        return
+
+    def test_call(self):
+        """ Test events for a call and a result.
+
+        """
+        reply = lambda call_type, params: (200, self._DATA.result)
+        server = StubServer(reply)
+        server.start()
+        try:
+            request = StnDataRequest()
+            request._call = WebServicesCall(server.url + "StnData")
+            request.location(sid="okc")
+            request.dates("2011-12-31", "2012-01-01")
+            request.add_element("mint")
+            StnDataResult(request.submit())
+        finally:
+            server.stop()
+        names = [event["event"] for event in self._events]
+        self.assertSequenceEqual(("response", "decode", "construct"), names)
+        for event in self._events:
+            self.assertEqual("StnData", event["call_type"])
+        response = self._events[0]
+        self.assertGreater(response["param_bytes"], 0)
+        self.assertGreater(response["bytes"], 0)
+        self.assertEqual(response["bytes"], response["wire_bytes"])
+        self.assertEqual(response["bytes"], self._events[1]["bytes"])
+        return
+
+    def test_queue(self):
+        """ Test events for a RequestQueue.
+
+        """
+        reply = lambda call_type, params: (200, self._DATA.result)
+        server = StubServer(reply)
+        server.start()
+        try:
+            request = StnDataRequest()
+            request._call = WebServicesCall(server.url + "StnData")
+            queue = RequestQueue()
+            for _ in range(3):
+                queue.add(request)
+            queue.execute()
+        finally:
+            server.stop()
+        requests = [event for event in self._events if 
+                    event["event"] == "request"]
+        self.assertEqual(3, len(requests))
+        self.assertEqual(1, requests[0]["attempts"])
+        return
+
+    def test_stream(self):
+        """ Test events for a stream.
+
+        """
+        lines = ("Oklahoma City", "2011-12-31,M", "2012-01-01,30")
+        reply = lambda call_type, params: (200, "\n".join(lines))
+        server = StubServer(reply)
+        server.start()
+        try:
+            stream = StnDataStream()
+            stream._call = WebServicesCall(server.url + "StnData")
+            stream.location(sid="okc")
+            stream.dates("2011-12-31", "2012-01-01")
+            stream.add_element("maxt")
+            list(stream)
+        finally:
+            server.stop()
+        event = self._events[-1]
+        self.assertEqual("stream", event["event"])
+        self.assertEqual(2, event["records"])
+        return
+
+    def test_remove(self):
+        """ Test the remove_hook function.
+
+        """
+        remove_hook(self._events.append)
+        StnDataResult({"params": self._DATA.params, 
+                       "result": self._DATA.result})
+        add_hook(self._events.append)  # for tearDown()
+        self.assertEqual(0, len(self._events))
+        return
+
+
+class CallStatsTest(unittest.TestCase):
+    """ Unit testing for the CallStats class.
+
+    """
+    def setUp(self):
+        """ Set up the test fixture.
+
+        This is called before each test is run so that they are isolated from
+        any side effects. This is part of the unittest API.
+
+        """
+        self._stats = CallStats()
+        for value in range(1, 101):
+            self._stats({"event": "response", "call_type": "StnData",
+                         "ttfb": value, "bytes": None})
+        self._stats({"event": "decode", "call_type": "GridData", 
+                     "decode": 0.5})
+        return
+
+    def test_summary(self):
+        """ Test the summary method.
+
+        """
+        summary = {
+            "StnData": {"ttfb": (100, 50, 95, 99)},
+            "GridData": {"decode": (1, 0.5, 0.5, 0.5)},
+        }
+        self.assertDictEqual(summary, self._stats.summary())
+        return
+
+    def test_report(self):
+        """ Test the report method.
+
+        """
+        stream = StringIO()
+        self._stats.report(stream)
+        lines = stream.getvalue().splitlines()
+        self.assertEqual(3, len(lines))
+        self.assertEqual(["StnData", "ttfb", "100", "50", "95", "99"],
+                         lines[2].split())
+        return
+
+    def test_clear(self):
+        """ Test the clear method.
+
+        """
+        self._stats.clear()
+        self.assertDictEqual({}, self._stats.summary())
+        return
+
+
+# Specify the test cases to run for this module. Private bases classes need
+# to be explicitly excluded from automatic discovery.
+
+_TEST_CASES = (AddHookFunctionTest, CallStatsTest)
+
+def load_tests(loader, tests, pattern):
+    """ Define a TestSuite for this module.
+
+    This is part of the unittest API. The last two arguments are ignored. The
+    _TEST_CASES global is used to determine which TestCase classes to load
+    from this module.
+
+    """
+    suite = unittest.TestSuite()
+    for test_case in _TEST_CASES:
+        tests = loader.loadTestsFromTestCase(test_case)
+        suite.addTests(tests)
+    return suite
+
+
+# Make the module executable.
+
+if __name__ == "__main__":
+    unittest.main()  # main() calls sys.exit()
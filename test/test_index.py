@@ -0,0 +1,197 @@
+""" Testing for the the index.py module
+
+The module can be executed on its own or incorporated into a larger test suite.
+
+"""
+import _path
+import _unittest as unittest
+
+from math import asin
+from math import cos
+from math import radians
+from math import sin
+from math import sqrt
+from pickle import dumps
+from pickle import loads
+from random import Random
+
+from acis import StationIndex
+
+
+# Define the TestCase classes for this module. Each public component of the
+# module being tested has its own TestCase.
+
+class StationIndexTest(unittest.TestCase):
+    """ Unit testing for the StationIndex class.
+
+    """
+    @staticmethod
+    def _distance(lon1, lat1, lon2, lat2):
+        """ Return the great circle distance between two points in km.
+
+        """
+        lon1, lat1, lon2, lat2 = map(radians, (lon1, lat1, lon2, lat2))
+        hav = (sin((lat2 - lat1) / 2)**2 + 
+               cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2)**2)
+        return 2 * 6371. * asin(sqrt(hav))
+
+    @classmethod
+    def setUpClass(cls):
+        """ Initialize the StationIndexTest class.
+
+        This is called before any tests are run. This is part of the unittest
+        API.
+
+        """
+        random = Random(0)
+        cls._meta = {}
+        for uid in range(500):
+            cls._meta[uid] = {
+                "ll": [-110 + 20 * random.random(), 30 + 15 * random.random()],
+                "elev": random.choice((100, 200, 300, 400)),
+                "state": random.choice(("OK", "TX", "KS")),
+                "county": str(random.randint(1, 5)),
+                "sids": ["{0:d} 2".format(1000 + uid)],
+                "valid_daterange": [["{0:d}-01-01".format(1900 + uid % 100),
+                                     "{0:d}-12-31".format(1950 + uid % 60)],
+                                    []]}
+        cls._meta[500] = {"name": "no metadata"}
+        cls._index = StationIndex(cls._meta, cell=2.)
+        return
+
+    def test_len(self):
+        """ Test the __len__ method.
+
+        """
+        self.assertEqual(501, len(self._index))
+        return
+
+    def test_find(self):
+        """ Test the find method.
+
+        """
+        expected = set(uid for uid, site in self._meta.iteritems() if
+                       site.get("state") == "OK" and site.get("county") == "3")
+        self.assertSetEqual(expected, self._index.find(state="OK", county="3"))
+        self.assertEqual(500, len(self._index.find(network="COOP")))
+        self.assertSetEqual(set(), self._index.find(state="XX"))
+        self.assertEqual(501, len(self._index.find()))
+        return
+
+    def test_uid(self):
+        """ Test the uid method.
+
+        """
+        self.assertEqual(42, self._index.uid("COOP", "1042"))
+        with self.assertRaises(KeyError):
+            self._index.uid("WBAN", "1042")
+        return
+
+    def test_bbox(self):
+        """ Test the bbox method.
+
+        """
+        bbox = (-101.5, 33.2, -95, 40.1)
+        expected = set()
+        for uid, site in self._meta.iteritems():
+            try:
+                lon, lat = site["ll"]
+            except KeyError:
+                continue
+            if bbox[0] <= lon <= bbox[2] and bbox[1] <= lat <= bbox[3]:
+                expected.add(uid)
+        self.assertSetEqual(expected, self._index.bbox(*bbox))
+        return
+
+    def test_nearest(self):
+        """ Test the nearest method.
+
+        """
+        lon, lat = -97.5, 35.4
+        sites = [(uid, site["ll"]) for uid, site in self._meta.iteritems() if
+                 "ll" in site]
+        expected = sorted((self._distance(lon, lat, *ll), uid) for uid, ll in 
+                          sites)
+        nearest = self._index.nearest(lon, lat, 10)
+        self.assertSequenceEqual([uid for dist, uid in expected[:10]],
+                                 [uid for uid, dist in nearest])
+        for (dist, uid), (uid, index_dist) in zip(expected, nearest):
+            self.assertAlmostEqual(dist, index_dist, 6)
+        return
+
+    def test_nearest_max(self):
+        """ Test the nearest method with a maximum distance.
+
+        """
+        nearest = self._index.nearest(-97.5, 35.4, 500, max_distance=100.)
+        self.assertGreater(len(nearest), 0)
+        self.assertLessEqual(nearest[-1][1], 100.)
+        everything = self._index.nearest(-97.5, 35.4, 500)
+        self.assertEqual(500, len(everything))
+        self.assertSequenceEqual(everything[:len(nearest)], nearest)
+        return
+
+    def test_elevation(self):
+        """ Test the elevation method.
+
+        """
+        expected = set(uid for uid, site in self._meta.iteritems() if
+                       200 <= site.get("elev", 0) <= 300)
+        self.assertSetEqual(expected, self._index.elevation(200, 300))
+        self.assertEqual(500, len(self._index.elevation()))
+        return
+
+    def test_overlaps(self):
+        """ Test the overlaps method.
+
+        """
+        sdate, edate = "1960-06-01", "1970-01-01"
+        expected = set()
+        for uid, site in self._meta.iteritems():
+            try:
+                start, end = site["valid_daterange"][0]
+            except KeyError:
+                continue
+            if start <= edate and end >= sdate:
+                expected.add(uid)
+        self.assertSetEqual(expected, self._index.overlaps(sdate, edate))
+        self.assertSetEqual(set(), self._index.overlaps(sdate, edate, 1))
+        self.assertSetEqual(set(), self._index.overlaps(sdate, edate, 2))
+        return
+
+    def test_pickle(self):
+        """ Test pickling.
+
+        """
+        index = loads(dumps(self._index, -1))
+        self.assertEqual(self._index.nearest(-97.5, 35.4, 5), 
+                         index.nearest(-97.5, 35.4, 5))
+        self.assertSetEqual(self._index.bbox(-100, 30, -95, 35), 
+                            index.bbox(-100, 30, -95, 35))
+        return
+
+
+# Specify the test cases to run for this module. Private bases classes need
+# to be explicitly excluded from automatic discovery.
+
+_TEST_CASES = (StationIndexTest,)
+
+def load_tests(loader, tests, pattern):
+    """ Define a TestSuite for this module.
+
+    This is part of the unittest API. The last two arguments are ignored. The
+    _TEST_CASES global is used to determine which TestCase classes to load
+    from this module.
+
+    """
+    suite = unittest.TestSuite()
+    for test_case in _TEST_CASES:
+        tests = loader.loadTestsFromTestCase(test_case)
+        suite.addTests(tests)
+    return suite
+
+
+# Make the module executable.
+
+if __name__ == "__main__":
+    unittest.main()  # main() calls sys.exit()
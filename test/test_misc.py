@@ -0,0 +1,140 @@
+""" Testing for the the _misc.py module
+
+The module can be executed on its own or incorporated into a larger test suite.
+
+"""
+import _path
+import _unittest as unittest
+
+from acis import StnDataRequest
+from acis import StnDataStream
+from acis import StnDataResult
+from acis._misc import ElementSchema
+from acis._misc import annotate
+from acis._misc import element_schema
+
+
+# Define the TestCase classes for this module. Each public component of the
+# module being tested has its own TestCase.
+
+class AnnotateFunctionTest(unittest.TestCase):
+    """ Unit testing for the annotate function.
+
+    """
+    def test(self):
+        """ Test normal operation.
+
+        """
+        items = ("maxt", "mint", "maxt", "pcpn", "maxt", "mint")
+        annotated = ("maxt_0", "mint_0", "maxt_1", "pcpn", "maxt_2", "mint_1")
+        self.assertSequenceEqual(annotated, annotate(iter(items)))
+        self.assertSequenceEqual((), annotate([]))
+        return
+
+
+class ElementSchemaTest(unittest.TestCase):
+    """ Unit testing for the ElementSchema class.
+
+    """
+    def setUp(self):
+        """ Set up the test fixture.
+
+        This is called before each test is run so that they are isolated from
+        any side effects. This is part of the unittest API.
+
+        """
+        elems = ["maxt", 4, {"name": "maxt", "add": "f,t"}]
+        self._schema = ElementSchema(elems)
+        return
+
+    def test_aliases(self):
+        """ Test the aliases attribute and position method.
+
+        """
+        self.assertSequenceEqual(("maxt_0", "vx4", "maxt_1"),
+                                 self._schema.aliases)
+        self.assertEqual(2, self._schema.position("maxt_1"))
+        with self.assertRaises(KeyError):
+            self._schema.position("maxt")
+        self.assertSequenceEqual(("mint", "vx1"),
+                                 ElementSchema("mint,1").aliases)
+        return
+
+    def test_layouts(self):
+        """ Test the layouts attribute.
+
+        """
+        layouts = (("value",), ("value",), ("value", "flag", "time"))
+        self.assertSequenceEqual(layouts, self._schema.layouts)
+        return
+
+    def test_add(self):
+        """ Test the add and with_interval methods.
+
+        """
+        schema = self._schema.add("pcpn", smry="sum").with_interval("mly")
+        self.assertSequenceEqual(("maxt_0", "vx4", "maxt_1", "pcpn"),
+                                 schema.aliases)
+        self.assertEqual(3, len(self._schema))  # not modified
+        self.assertIsNone(self._schema.interval)
+        self.assertEqual("mly", schema.interval)
+        elems = schema.params()
+        self.assertEqual({"name": "pcpn", "alias": "pcpn", "smry": "sum",
+                          "interval": "mly"}, elems[3])
+        return
+
+    def test_params(self):
+        """ Test the params method.
+
+        """
+        elems = self._schema.params()
+        self.assertIs(self._schema, element_schema(elems))
+        elems[0]["name"] = "mint"  # params are copies
+        self.assertEqual("maxt", self._schema.params()[0]["name"])
+        self.assertSequenceEqual(self._schema.aliases,
+                                 element_schema(list(elems)).aliases)
+        return
+
+    def test_reuse(self):
+        """ Test that requests, results, and streams share a schema.
+
+        """
+        request = StnDataRequest()
+        request.add_element("maxt")
+        request.add_element("maxt", add="f")
+        schema = request.params["elems"].schema
+        query = {"params": request.params,
+                 "result": {"meta": {"uid": 1}, "data": []}}
+        result = StnDataResult(query)
+        self.assertIs(schema, result._schema)
+        self.assertSequenceEqual(("maxt_0", "maxt_1"), result.elems)
+        stream = StnDataStream()
+        stream.add_element("maxt")
+        self.assertIs(stream.elems, stream.elems)  # no annotation per access
+        return
+
+
+# Specify the test cases to run for this module. Private bases classes need
+# to be explicitly excluded from automatic discovery.
+
+_TEST_CASES = (AnnotateFunctionTest, ElementSchemaTest)
+
+def load_tests(loader, tests, pattern):
+    """ Define a TestSuite for this module.
+
+    This is part of the unittest API. The last two arguments are ignored. The
+    _TEST_CASES global is used to determine which TestCase classes to load
+    from this module.
+
+    """
+    suite = unittest.TestSuite()
+    for test_case in _TEST_CASES:
+        tests = loader.loadTestsFromTestCase(test_case)
+        suite.addTests(tests)
+    return suite
+
+
+# Make the module executable.
+
+if __name__ == "__main__":
+    unittest.main()  # main() calls sys.exit()
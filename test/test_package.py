@@ -0,0 +1,93 @@
+""" Testing for the the acis package (__init__.py)
+
+The module can be executed on its own or incorporated into a larger test suite.
+
+"""
+import _path
+import _unittest as unittest
+
+from os.path import dirname
+from os.path import join
+from subprocess import PIPE
+from subprocess import Popen
+from sys import executable
+
+import acis
+import acis.index
+import acis.result
+import acis.util
+
+
+# Define the TestCase classes for this module. Each public component of the
+# module being tested has its own TestCase.
+
+class LazyPackageTest(unittest.TestCase):
+    """ Unit testing for lazy loading of package modules.
+
+    """
+    @staticmethod
+    def _modules(code):
+        """ Execute code in a new interpreter and return the loaded modules.
+
+        """
+        code = "import sys; {0:s}; print ' '.join(sys.modules)".format(code)
+        root = join(dirname(__file__), "..")
+        process = Popen([executable, "-c", code], stdout=PIPE, cwd=root)
+        return set(process.communicate()[0].split())
+
+    def test_import(self):
+        """ Test that lazy modules are not imported with the package.
+
+        """
+        modules = self._modules("import acis")
+        for name in ("acis.result", "acis.util", "acis.index", "acis.queue",
+                     "dateutil", "numpy", "multiprocessing"):
+            self.assertNotIn(name, modules)
+        return
+
+    def test_access(self):
+        """ Test that a lazy module is imported by attribute access.
+
+        """
+        modules = self._modules("import acis; acis.StnDataResult")
+        self.assertIn("acis.result", modules)
+        self.assertNotIn("acis.util", modules)
+        return
+
+    def test_attrs(self):
+        """ Test the lazy attributes.
+
+        """
+        for module in (acis.result, acis.util, acis.index):
+            for attr in module.__all__:
+                self.assertIs(getattr(module, attr), getattr(acis, attr))
+                self.assertIn(attr, acis.__all__)
+        with self.assertRaises(AttributeError):
+            acis.nothing
+        return
+
+
+# Specify the test cases to run for this module. Private bases classes need
+# to be explicitly excluded from automatic discovery.
+
+_TEST_CASES = (LazyPackageTest,)
+
+def load_tests(loader, tests, pattern):
+    """ Define a TestSuite for this module.
+
+    This is part of the unittest API. The last two arguments are ignored. The
+    _TEST_CASES global is used to determine which TestCase classes to load
+    from this module.
+
+    """
+    suite = unittest.TestSuite()
+    for test_case in _TEST_CASES:
+        tests = loader.loadTestsFromTestCase(test_case)
+        suite.addTests(tests)
+    return suite
+
+
+# Make the module executable.
+
+if __name__ == "__main__":
+    unittest.main()  # main() calls sys.exit()
@@ -6,10 +6,30 @@ The module can be executed on its own or incorporated into a larger test suite.
 import _path
 import _unittest as unittest
 from _data import TestData
+from _server import StubServer
 
+from os import getpid
+from socket import timeout as SocketTimeout
+from threading import Event
+from threading import Lock
+from time import sleep
+
+from acis import RequestError
 from acis import StnDataRequest
 from acis import StnDataResult
+from acis import WebServicesCall
+from acis.queue import RequestFailure
 from acis.queue import RequestQueue
+from acis.queue import RetryPolicy
+
+
+def _process_uid(query):
+    """ Return the uid for a query and the ID of the current process.
+
+    Callbacks for worker processes must be picklable.
+
+    """
+    return query["result"]["meta"]["uid"], getpid()
 
 
 # Define the TestCase classes for this module. Each public component of the
@@ -76,6 +96,211 @@ class RequestQueueTest(unittest.TestCase):
             # self.assertDictEqual(result.smry, item.smry)
         return
     
+    def test_execute_local(self):
+        """ Test the execute method with a local server.
+
+        """
+        active = [0, 0]  # current and maximum concurrent requests
+        lock = Lock()
+        def reply(call_type, params):
+            with lock:
+                active[0] += 1
+                active[1] = max(active)
+            sleep(0.01)
+            with lock:
+                active[0] -= 1
+            return 200, {"meta": {"uid": params["uid"]}, "data": []}
+        server = StubServer(reply)
+        server.start()
+        try:
+            queue = RequestQueue(workers=3, max_in_flight=4)
+            for uid in range(20):
+                request = StnDataRequest()
+                request._call = WebServicesCall(server.url + "StnData")
+                request.location(uid=uid)
+                queue.add(request)
+            queue.execute()
+        finally:
+            server.stop()
+        uids = [item["result"]["meta"]["uid"] for item in queue.results]
+        self.assertSequenceEqual(range(20), uids)
+        self.assertLessEqual(active[1], 3)
+        self.assertLessEqual(server.connections, 3)
+        return
+
+    def test_reuse(self):
+        """ Test adding the same request with different params.
+
+        """
+        def reply(call_type, params):
+            return 200, {"meta": {"uid": params["uid"]}, "data": []}
+        server = StubServer(reply)
+        server.start()
+        try:
+            queue = RequestQueue()
+            request = StnDataRequest()
+            request._call = WebServicesCall(server.url + "StnData")
+            for uid in range(3):
+                request.location(uid=uid)
+                queue.add(request)
+            queue.execute()
+        finally:
+            server.stop()
+        uids = [item["result"]["meta"]["uid"] for item in queue.results]
+        self.assertSequenceEqual(range(3), uids)
+        uids = [item["params"]["uid"] for item in queue.results]
+        self.assertSequenceEqual(range(3), uids)
+        return
+
+    def test_timeout(self):
+        """ Test a request timeout.
+
+        """
+        def reply(call_type, params):
+            sleep(0.5)
+            return 200, {}
+        server = StubServer(reply)
+        server.start()
+        try:
+            queue = RequestQueue()
+            self._request._call = WebServicesCall(server.url + "StnData")
+            queue.add(self._request, timeout=0.1)
+            with self.assertRaises(SocketTimeout):
+                queue.execute()
+        finally:
+            server.stop()
+        return
+
+    def test_execute_capture(self):
+        """ Test the execute method with captured errors.
+
+        """
+        def reply(call_type, params):
+            if params["uid"] == 1:
+                return 400, "bad request"
+            return 200, {"meta": {"uid": params["uid"]}, "data": []}
+        server = StubServer(reply)
+        server.start()
+        try:
+            queue = RequestQueue(retry=RetryPolicy(backoff=0))
+            for uid in range(3):
+                request = StnDataRequest()
+                request._call = WebServicesCall(server.url + "StnData")
+                request.location(uid=uid)
+                queue.add(request)
+            queue.execute(capture=True)
+        finally:
+            server.stop()
+        self.assertEqual(3, len(server.requests))  # no retry for 400
+        failure = queue.results[1]
+        self.assertIsInstance(failure, RequestFailure)
+        self.assertIsInstance(failure.error, RequestError)
+        self.assertEqual(1, failure.attempts)
+        self.assertEqual(2, queue.results[2]["result"]["meta"]["uid"])
+        return
+
+    def test_execute_retry(self):
+        """ Test the execute method with retries for server errors.
+
+        """
+        def reply(call_type, params):
+            if len(server.requests) < 3:
+                return 503, "unavailable"
+            return 200, {"meta": {"uid": 0}, "data": []}
+        server = StubServer(reply)
+        server.start()
+        try:
+            queue = RequestQueue(retry=RetryPolicy(retries=2, backoff=0))
+            self._request._call = WebServicesCall(server.url + "StnData")
+            queue.add(self._request)
+            queue.execute()
+        finally:
+            server.stop()
+        self.assertEqual(3, len(server.requests))
+        self.assertEqual(0, queue.results[0]["result"]["meta"]["uid"])
+        return
+
+    def test_as_completed(self):
+        """ Test the as_completed method.
+
+        """
+        arrived = Event()
+        def reply(call_type, params):
+            if params["uid"] == 0:
+                arrived.wait(5)  # wait until another result has arrived
+            return 200, {"meta": {"uid": params["uid"]}, "data": []}
+        server = StubServer(reply)
+        server.start()
+        try:
+            queue = RequestQueue(workers=5)
+            for uid in range(5):
+                request = StnDataRequest()
+                request._call = WebServicesCall(server.url + "StnData")
+                request.location(uid=uid)
+                request.add_element("maxt")
+                queue.add(request, StnDataResult)
+            uids = []
+            for result in queue.as_completed():
+                uids.append(result.meta.keys()[0])
+                arrived.set()
+            for result in queue.as_completed():
+                break  # abandon remaining requests
+        finally:
+            server.stop()
+        self.assertItemsEqual(range(5), uids)
+        self.assertNotEqual(0, uids[0])  # results are not in request order
+        self.assertEqual(0, len(queue.results))
+        return
+
+    def test_execute_consumer(self):
+        """ Test the execute method with a consumer function.
+
+        """
+        reply = lambda call_type, params: (200, {"meta": {"uid": 0}})
+        server = StubServer(reply)
+        server.start()
+        try:
+            queue = RequestQueue()
+            self._request._call = WebServicesCall(server.url + "StnData")
+            queue.add(self._request)
+            queue.add(self._request)
+            consumed = []
+            queue.execute(consumer=consumed.append)
+        finally:
+            server.stop()
+        self.assertEqual(2, len(consumed))
+        self.assertEqual(0, len(queue.results))
+        return
+
+    def test_execute_processes(self):
+        """ Test the execute method with worker processes.
+
+        """
+        def reply(call_type, params):
+            if params["uid"] == 3:
+                return 400, "bad request"
+            return 200, {"meta": {"uid": params["uid"]}, "data": []}
+        server = StubServer(reply)
+        server.start()
+        try:
+            queue = RequestQueue(processes=2)
+            for uid in range(6):
+                request = StnDataRequest()
+                request._call = WebServicesCall(server.url + "StnData")
+                request.location(uid=uid)
+                queue.add(request, _process_uid)
+            queue.execute(capture=True)
+        finally:
+            server.stop()
+        failure = queue.results.pop(3)
+        self.assertIsInstance(failure, RequestFailure)
+        self.assertIsInstance(failure.error, RequestError)
+        self.assertIsNone(failure.traceback)
+        uids, pids = zip(*queue.results)
+        self.assertSequenceEqual([0, 1, 2, 4, 5], uids)
+        self.assertNotIn(getpid(), pids)  # callbacks run in the workers
+        return
+
     def test_clear(self):
         queue = RequestQueue()
         queue.add(self._request)
@@ -86,10 +311,35 @@ class RequestQueueTest(unittest.TestCase):
         return
 
 
+class RetryPolicyTest(unittest.TestCase):
+    """ Unit testing for the RetryPolicy class.
+
+    """
+    def test_retryable(self):
+        """ Test the retryable method.
+
+        """
+        policy = RetryPolicy(retries=2)
+        self.assertTrue(policy.retryable(SocketTimeout(), 1))
+        self.assertTrue(policy.retryable(SocketTimeout(), 2))
+        self.assertFalse(policy.retryable(SocketTimeout(), 3))
+        self.assertFalse(policy.retryable(RequestError(), 1))
+        return
+
+    def test_delay(self):
+        """ Test the delay method.
+
+        """
+        policy = RetryPolicy(backoff=1, factor=2, max_delay=5)
+        delays = [policy.delay(attempts) for attempts in range(1, 5)]
+        self.assertSequenceEqual([1, 2, 4, 5], delays)
+        return
+
+
 # Specify the test cases to run for this module. Private bases classes need
 # to be explicitly excluded from automatic discovery.
 
-_TEST_CASES = (RequestQueueTest,)
+_TEST_CASES = (RequestQueueTest, RetryPolicyTest)
 
 def load_tests(loader, tests, pattern):
     """ Define a TestSuite for this module.
@@ -11,6 +11,7 @@ from acis import ResultError
 from acis import StnMetaResult
 from acis import StnDataResult
 from acis import MultiStnDataResult
+from acis import LazyMultiStnDataResult
 from acis import GridDataResult
 from acis import AreaMetaResult
 
@@ -239,6 +240,84 @@ class MultiStnDataResultTest(_DataResultTest):
         return
 
 
+class LazyMultiStnDataResultTest(MultiStnDataResultTest):
+    """ Unit testing for the LazyMultiStnDataResult class.
+
+    """
+    _class = LazyMultiStnDataResult
+
+    def test_meta(self):
+        """ Test the meta attribute.
+
+        """
+        result = self._class(self._query)
+        self.assertDictEqual(self._meta, dict(result.meta))
+        return
+
+    def test_data(self):
+        """ Test the data attribute.
+
+        """
+        result = self._class(self._query)
+        self.assertDictEqual(self._data, dict(result.data))
+        return
+
+    def test_smry(self):
+        """ Test the smry attribute.
+
+        """
+        result = self._class(self._query)
+        self.assertDictEqual(self._smry, dict(result.smry))
+        return
+
+    def test_uid_missing(self):
+        """ Test for exception for missing site UID.
+
+        """
+        self._query["result"]["data"][1]["meta"].pop("uid")
+        result = self._class(self._query)
+        self.assertEqual(self._data[92], result.data[92])  # first site is ok
+        with self.assertRaises(ResultError):
+            len(result.meta)
+        return
+
+    def test_smry_only(self):
+        """ Test a smry_only result.
+
+        """
+        for site in self._query["result"]["data"]:
+            del site["data"]
+        result = self._class(self._query)
+        self.assertDictEqual(self._smry, dict(result.smry))
+        for record in result:
+            self.assertTrue(False)  # data should be empty
+        return
+
+    def test_lazy(self):
+        """ Test that sites are only processed as needed.
+
+        """
+        sites = iter(self._query["result"]["data"])
+        self._query["result"]["data"] = sites
+        result = self._class(self._query)
+        self.assertEqual(self._meta[92], result.meta[92])
+        self.assertIsNotNone(next(sites, None))  # second site not consumed
+        return
+
+    def test_single_date(self):
+        """ Test a single-date result.
+
+        """
+        self._query["params"]["date"] = self._query["params"].pop("sdate")
+        del self._query["params"]["edate"]
+        for site in self._query["result"]["data"]:
+            site["data"] = site["data"][0]  # 1D data
+        result = self._class(self._query)
+        self.assertSequenceEqual([["35", "71"]], result.data[92])
+        self.assertEqual(2, len(result))
+        return
+
+
 class GridDataResultTest(unittest.TestCase):
     """ Unit testing for the GridDataResult class.
 
@@ -345,6 +424,42 @@ class GridDataResultTest(unittest.TestCase):
         self.assertSequenceEqual(self._records, list(result))
         return
 
+    def test_array(self):
+        """ Test the array method.
+
+        """
+        result = self._class(self._query)
+        for pos, alias in enumerate(self._elems, 1):
+            array = result.array(alias)
+            self.assertTrue(array.flags["C_CONTIGUOUS"])
+            self.assertSequenceEqual([day[pos] for day in self._data],
+                                     array.tolist())
+            self.assertIs(array, result.array(alias))  # cached
+        return
+
+    def test_select(self):
+        """ Test the select method.
+
+        """
+        result = self._class(self._query)
+        bbox = (-97.05, 35.0, -97.0, 35.05)
+        array = result.select("mint", "2012-01-02", bbox=bbox)
+        self.assertSequenceEqual([[[29, 28], [29, 29]]], array.tolist())
+        array[0, 0, 0] = -999  # view, not a copy
+        self.assertEqual(-999, result.array("mint")[1, 0, 1])
+        array = result.select("vx1", edate="2012-01-01")
+        self.assertSequenceEqual([self._data[0][1]], array.tolist())
+        return
+
+    def test_to_records(self):
+        """ Test the to_records method.
+
+        """
+        result = self._class(self._query)
+        records = [[(record.row, record.col), record.date, record.vx1, 
+                    record.mint] for record in result.to_records()]
+        self.assertSequenceEqual(self._records, records)
+        return
 
 
 class AreaMetaResultTest(unittest.TestCase):
@@ -401,7 +516,8 @@ class AreaMetaResultTest(unittest.TestCase):
 # to be explicitly excluded from automatic discovery.
 
 _TEST_CASES = (StnMetaResultTest, StnDataResultTest, MultiStnDataResultTest,
-               GridDataResultTest, AreaMetaResultTest)
+               LazyMultiStnDataResultTest, GridDataResultTest, 
+               AreaMetaResultTest)
 
 def load_tests(loader, tests, pattern):
     """ Define a TestSuite for this module.
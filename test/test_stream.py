@@ -6,7 +6,11 @@ The module can be executed on its own or incorporated into a larger test suite.
 import _path
 import _unittest as unittest
 from _data import TestData
+from _server import StubServer
 
+from acis import RequestError
+from acis.call import ConnectionPool
+from acis.call import WebServicesCall
 from acis.stream import StnDataStream
 from acis.stream import MultiStnDataStream
 
@@ -64,6 +68,20 @@ class _StreamTest(unittest.TestCase):
         self.assertTrue(True)  # no execptions
         return
 
+    def _serve(self, content):
+        """ Point the test stream at a local server with the given reply.
+
+        The server is stopped when the test is complete.
+
+        """
+        server = StubServer(lambda call_type, params: (200, content))
+        server.start()
+        self.addCleanup(server.stop)
+        call_type = self._class.__name__[:-len("Stream")]
+        self._stream._call = WebServicesCall(server.url + call_type)
+        return
+
+
 class StnDataStreamTest(_StreamTest):
     """ Unit testing for the StnDataStream class.
 
@@ -87,6 +105,53 @@ class StnDataStreamTest(_StreamTest):
         self.assertDictEqual(self._meta, self._stream.meta)
         return
 
+    def test_error(self):
+        """ Test that a stream error releases its connection.
+
+        """
+        self._serve("error: Need sId\n")
+        self._stream._call.pool = ConnectionPool(maxsize=1)
+        self._stream._call._timeout = 1
+        for _ in range(3):  # would wait for a connection if one leaked
+            with self.assertRaises(RequestError) as context:
+                list(self._stream)
+            self.assertEqual("Need sId", str(context.exception))
+        return
+
+    def test_typed(self):
+        """ Test the typed method.
+
+        """
+        self._serve("OKC, OK\n2012-01-01,35,M\n2012-01-02,T,0.50A\n")
+        self._stream.dates("2012-01-01", "2012-01-02")
+        self._stream.location(sid="okc")
+        self._stream.add_element("mint")
+        self._stream.add_element("pcpn")
+        self._stream.typed(missing=-99., trace=0.001)
+        records = [["okc", "2012-01-01", 35., -99.],
+                   ["okc", "2012-01-02", 0.001, "0.50A"]]
+        self.assertSequenceEqual(records, list(self._stream))
+        self.assertDictEqual({"okc": {"name": "OKC, OK"}}, self._stream.meta)
+        self._stream.typed(False)
+        records = [["okc", "2012-01-01", "35", "M"],
+                   ["okc", "2012-01-02", "T", "0.50A"]]
+        self.assertSequenceEqual(records, list(self._stream))
+        return
+
+    def test_batches(self):
+        """ Test the batches method.
+
+        """
+        lines = ["2012-01-{0:02d},{0:d}".format(day) for day in range(1, 6)]
+        self._serve("OKC\n" + "\n".join(lines) + "\n")
+        self._stream.dates("2012-01-01", "2012-01-05")
+        self._stream.location(sid="okc")
+        self._stream.add_element("mint")
+        batches = list(self._stream.batches(2))
+        self.assertSequenceEqual([2, 2, 1], map(len, batches))
+        self.assertSequenceEqual(["okc", "2012-01-05", "5"], batches[-1][0])
+        return
+
 
 class MultiStnDataStreamTest(_StreamTest):
     """ Unit testing for the MultiStnDataStream class.
@@ -111,6 +176,26 @@ class MultiStnDataStreamTest(_StreamTest):
         self.assertDictEqual(self._meta, self._stream.meta)
         return
 
+    def test_quoted(self):
+        """ Test parsing of quoted fields.
+
+        """
+        self._serve('13967,"OKLAHOMA CITY, OK",OK,-97.6,35.39,1285,35,T\n'
+                    '\n')
+        self._stream.date("2011-12-31")
+        self._stream.location(sids="okc")
+        self._stream.add_element("mint")
+        self._stream.add_element("pcpn")
+        records = [["13967", "2011-12-31", "35", "T"]]
+        self.assertSequenceEqual(records, list(self._stream))
+        meta = {"13967": {"name": "OKLAHOMA CITY, OK", "state": "OK",
+                          "ll": [-97.6, 35.39], "elev": 1285.}}
+        self.assertDictEqual(meta, self._stream.meta)
+        self._stream.typed()
+        records = [["13967", "2011-12-31", 35., 0.]]
+        self.assertSequenceEqual(records, list(self._stream))
+        return
+
 
 # Specify the test cases to run for this module. Private bases classes need
 # to be explicitly excluded from automatic discovery.
@@ -8,7 +8,10 @@ import _unittest as unittest
 from _data import TestData
 
 from acis import result_array
+from acis import result_columns
 from acis import decode_sids
+from acis import index_sids
+from acis import MultiStnDataResult
 from acis import StnDataResult
 
 
@@ -42,6 +45,66 @@ class DecodeSidsFunctionTest(unittest.TestCase):
         self.assertEqual(message, str(context.exception))
         return
 
+    def test_multiline(self):
+        """ Test exception for a sid with trailing lines.
+
+        """
+        with self.assertRaises(ValueError):
+            decode_sids(("13967 1\ngarbage",))
+        return
+
+
+class IndexSidsFunctionTest(unittest.TestCase):
+    """ Unit testing for the index_sids function.
+
+    """
+    _META = {
+        92: {"sids": ["13967 1", "346661 2", "A123 9999"]},
+        93: {"sids": ["346664 2", "13967 1"]},
+        94: {"name": "no sids"}}
+
+    def test(self):
+        """ Test normal operation.
+
+        """
+        sites, index = index_sids(self._META)
+        self.assertDictEqual(decode_sids(self._META[92]["sids"]), sites[92])
+        self.assertDictEqual({}, sites[94])
+        self.assertEqual(92, index[("WBAN", "13967")])  # first site
+        self.assertEqual(93, index[("COOP", "346664")])
+        self.assertEqual(92, index[(9999, "A123")])
+        self.assertEqual(4, len(index))
+        return
+
+    def test_list(self):
+        """ Test normal operation for a list of sites.
+
+        """
+        meta = [dict(site, uid=uid) for uid, site in
+                sorted(self._META.iteritems())]
+        self.assertEqual(index_sids(self._META), index_sids(meta))
+        return
+
+    def test_bad_format(self):
+        """ Test exception for invalid sid format.
+
+        """
+        meta = {92: {"sids": ["13967 1", "346661"]}}
+        with self.assertRaises(ValueError) as context:
+            index_sids(meta)
+        message = "invalid SID: 346661"
+        self.assertEqual(message, str(context.exception))
+        return
+
+    def test_multiline(self):
+        """ Test exception for a sid with trailing lines.
+
+        """
+        meta = {92: {"sids": ["13967 1\ngarbage", "346661 2"]}}
+        with self.assertRaises(ValueError):
+            index_sids(meta)
+        return
+
 
 class ResultArrayFunctionTest(unittest.TestCase):
     """ Unit testing for the result_array function.
@@ -70,10 +133,84 @@ class ResultArrayFunctionTest(unittest.TestCase):
         return
 
 
+class ResultColumnsFunctionTest(unittest.TestCase):
+    """ Unit testing for the result_columns function.
+    
+    """
+    @classmethod
+    def setUpClass(cls):
+        """ Initialize the ResultColumnsFunctionTest class.
+        
+        This is called before any tests are run. This is part of the unittest
+        API.
+        
+        """
+        cls._DATA = TestData("data/MultiStnData.xml")
+        return  
+
+    def test(self):
+        """ Test normal operation.
+        
+        """
+        query = {"params": self._DATA.params, "result": self._DATA.result}
+        result = MultiStnDataResult(query)
+        columns = result_columns(result)
+        self.assertEqual(len(result), len(columns))
+        for uid, pos in zip(columns.uids, range(len(columns.uids))):
+            records = slice(columns.offsets[pos], columns.offsets[pos+1])
+            self.assertEqual(records, columns.site(uid))
+        for record, pos in zip(result, range(len(columns))):
+            uid, date = record[:2]
+            self.assertEqual(date, columns.dates[pos])
+            for alias, value in zip(result.elems, record[2:]):
+                self.assertEqual(float(value), columns.values[alias][pos])
+        return
+
+    def test_flags(self):
+        """ Test parsing of ACIS flags.
+
+        """
+        params = {"sid": "okc", "sdate": "2012-01-01", "edate": "2012-01-05",
+                  "elems": [{"name": "pcpn", "add": "f"}]}
+        values = ("0.52A", "S", "T", "M", "1.5")
+        data = [["2012-01-0{0:d}".format(day), [value, " "]] for day, value 
+                in zip(range(1, 6), values)]
+        result = {"meta": {"uid": 92}, "data": data}
+        columns = result_columns(StnDataResult({"params": params, 
+                                                "result": result}), trace=0.01)
+        self.assertSequenceEqual(["A", "S", "T", "M", ""], 
+                                 columns.flags["pcpn"].tolist())
+        self.assertSequenceEqual([False, True, False, True, False],
+                                 columns.mask["pcpn"].tolist())
+        self.assertAlmostEqual(2.03, columns.masked("pcpn").sum(), 5)
+        return
+
+    def test_flag_field(self):
+        """ Test parsing of ACIS flags from the flag field of a value.
+
+        """
+        params = {"sid": "okc", "sdate": "2012-01-01", "edate": "2012-01-04",
+                  "elems": [{"name": "pcpn", "add": "t,f"}]}
+        values = (["0.52", 7, "A"], ["0.00", -1, "T"], ["-999", -1, "M"],
+                  ["1.5S", 7, " "])
+        data = [["2012-01-0{0:d}".format(day), value] for day, value
+                in zip(range(1, 5), values)]
+        result = {"meta": {"uid": 92}, "data": data}
+        columns = result_columns(StnDataResult({"params": params,
+                                                "result": result}), trace=0.01)
+        self.assertSequenceEqual(["A", "T", "M", "S"],
+                                 columns.flags["pcpn"].tolist())
+        self.assertSequenceEqual([False, False, True, False],
+                                 columns.mask["pcpn"].tolist())
+        self.assertAlmostEqual(2.03, columns.masked("pcpn").sum(), 5)
+        return
+
+
 # Specify the test cases to run for this module. Private bases classes need
 # to be explicitly excluded from automatic discovery.
 
-_TEST_CASES = (DecodeSidsFunctionTest, ResultArrayFunctionTest)
+_TEST_CASES = (DecodeSidsFunctionTest, IndexSidsFunctionTest,
+               ResultArrayFunctionTest, ResultColumnsFunctionTest)
 
 def load_tests(loader, tests, pattern):
     """ Define a TestSuite for this module.